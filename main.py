@@ -10,10 +10,13 @@ import json
 import asyncio
 import aiohttp
 import aiofiles
-from datetime import datetime, timedelta
-from typing import List, Optional, Dict, Tuple, Any, Union
-from functools import wraps
+from datetime import datetime, timedelta, date, timezone
+from typing import List, Optional, Dict, Tuple, Any, Union, Callable
+from functools import wraps, partial, lru_cache
+from concurrent.futures import ThreadPoolExecutor, Future
 import hashlib
+import html
+import traceback
 import pickle
 import gzip
 from dataclasses import dataclass, asdict
@@ -23,9 +26,12 @@ import string
 from pathlib import Path
 import re
 import time
-from collections import defaultdict
+import threading
+import queue
+from collections import defaultdict, OrderedDict, deque
 
 import redis.asyncio as redis
+from sortedcontainers import SortedList
 from telegram import (
     Update, 
     InlineKeyboardButton, 
@@ -48,10 +54,11 @@ from telegram.ext import (
     ContextTypes,
     JobQueue,
     CallbackContext,
-    PicklePersistence
+    PicklePersistence,
+    BaseUpdateProcessor
 )
 from telegram.constants import ParseMode, ChatAction
-from telegram.error import TelegramError, NetworkError, RetryAfter
+from telegram.error import TelegramError, NetworkError, RetryAfter, BadRequest, Forbidden
 
 # ========== КОНФИГУРАЦИЯ ==========
 # Настройка логирования
@@ -71,6 +78,85 @@ ADMIN_IDS = json.loads(os.getenv("ADMIN_IDS", "[]"))
 WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
 WEBHOOK_PORT = int(os.getenv("PORT", "8080"))
 
+# Хранилище: "legacy" (по умолчанию) - одно общее соединение и обычный журнал отката, как раньше;
+# "wal" - WAL, пул соединений на чтение и один писатель (включается явно)
+DB_PATH = os.getenv("DB_PATH", "bot_database.db")
+DB_STORAGE_MODE = os.getenv("DB_STORAGE_MODE", "legacy").lower()
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", str(min(8, os.cpu_count() or 4))))
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "65536"))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+# Групповой коммит: сколько миллисекунд копить записи и сколько максимум в одной транзакции (0 - выключен)
+DB_GROUP_COMMIT_MS = float(os.getenv("DB_GROUP_COMMIT_MS", "5"))
+DB_GROUP_COMMIT_MAX = int(os.getenv("DB_GROUP_COMMIT_MAX", "200"))
+# Как часто сбрасывать накопленное время последней активности в базу (секунды)
+ACTIVITY_FLUSH_SECONDS = int(os.getenv("ACTIVITY_FLUSH_SECONDS", "60"))
+
+# Кэш профилей пользователей: сколько записей держать и сколько секунд запись считается свежей
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "300"))
+
+# Сколько заданий участник может отправить за день (по всем типам вместе)
+DAILY_TASK_LIMIT = 10
+# Ключ общего дневного счетчика в user_daily_counters (остальные ключи - типы заданий)
+DAILY_TOTAL_KEY = '*'
+# Дни квот и статистики считаются по UTC, как date('now') и CURRENT_TIMESTAMP в SQLite
+DAILY_RESET_TEXT = "в 00:00 UTC (03:00 по МСК)"
+
+# Обработка обновлений: сколько выполняется одновременно и сколько может ждать в очередях пользователей
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "256"))
+UPDATE_MAX_PENDING = int(os.getenv("UPDATE_MAX_PENDING", "4096"))
+# С какой глубины очереди одного пользователя писать предупреждение в лог
+UPDATE_LANE_WARN_DEPTH = 10
+
+# Исходящие уведомления: сообщений в секунду на всего бота (с запасом до ~30 у Telegram под ответы),
+# пауза между сообщениями в один чат, число отправителей и попыток доставки
+NOTIFY_RATE = float(os.getenv("NOTIFY_RATE", "25"))
+NOTIFY_CHAT_INTERVAL = float(os.getenv("NOTIFY_CHAT_INTERVAL", "1"))
+NOTIFY_WORKERS = int(os.getenv("NOTIFY_WORKERS", "8"))
+NOTIFY_MAX_ATTEMPTS = 5
+# Приоритеты очереди уведомлений: ответы на действия пользователей идут раньше массовых рассылок
+NOTIFY_PRIORITY_HIGH = 0
+NOTIFY_PRIORITY_BULK = 1
+# Результаты доставки уведомления
+DELIVERY_SENT = 'sent'
+DELIVERY_FAILED = 'failed'
+DELIVERY_BLOCKED = 'blocked'
+
+# Outbox уведомлений: размер пачки, интервал опроса (секунды), через сколько секунд
+# строка в статусе sending считается зависшей и число попыток до отказа
+OUTBOX_BATCH_SIZE = 50
+OUTBOX_POLL_SECONDS = 2
+OUTBOX_LEASE_SECONDS = 120
+OUTBOX_MAX_ATTEMPTS = 8
+
+# Рассылки: сколько получателей берется за один шаг (после шага сохраняется прогресс)
+# и как часто обновлять сообщение с прогрессом у администратора (секунды)
+BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE", "200"))
+BROADCAST_PROGRESS_SECONDS = 5
+
+# Сводка новых заданий для администраторов вместо сообщения на каждое задание:
+# сводка уходит через ADMIN_DIGEST_WINDOW секунд после первого задания или
+# сразу после ADMIN_DIGEST_MAX_TASKS заданий. Задание в пустую очередь сообщается сразу
+ADMIN_DIGEST_ENABLED = os.getenv("ADMIN_DIGEST_ENABLED", "1") == "1"
+ADMIN_DIGEST_WINDOW = float(os.getenv("ADMIN_DIGEST_WINDOW", "60"))
+ADMIN_DIGEST_MAX_TASKS = int(os.getenv("ADMIN_DIGEST_MAX_TASKS", "50"))
+
+# Ошибки: одинаковые ошибки (тип + место в коде) сообщаются администраторам не чаще
+# раза в ERROR_ALERT_INTERVAL секунд, сводка - раз в ERROR_SUMMARY_INTERVAL секунд.
+# Для каждой ошибки хранится ERROR_SAMPLES последних примеров, всего не больше ERROR_MAX_FINGERPRINTS ошибок
+ERROR_ALERT_INTERVAL = int(os.getenv("ERROR_ALERT_INTERVAL", "600"))
+ERROR_SUMMARY_INTERVAL = int(os.getenv("ERROR_SUMMARY_INTERVAL", "3600"))
+ERROR_SAMPLES = 5
+ERROR_MAX_FINGERPRINTS = 500
+
+# Сколько заданий показывать на странице очереди модерации
+TASKS_PAGE_SIZE = 5
+# На сколько секунд администратор закрепляет за собой открытое задание
+REVIEW_LEASE_SECONDS = int(os.getenv("REVIEW_LEASE_SECONDS", "300"))
+# Сколько заданий выдается на экран пакетной проверки
+BATCH_REVIEW_SIZE = 8
+
 # Директории
 for dir_path in ["screenshots", "cache", "drawings", "avatars", "reports", "prizes"]:
     os.makedirs(dir_path, exist_ok=True)
@@ -295,6 +381,132 @@ class Drawing:
 import sqlite3
 from contextlib import contextmanager
 
+def write_operation(func):
+    """Метод записи: тело получает курсор писателя и выполняется в групповой транзакции.
+    
+    Синхронный вызов ждет коммита и возвращает результат тела,
+    AsyncDatabase ожидает тот же Future без занятия потока.
+    """
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        return self.submit_write(func, *args, **kwargs).result()
+    wrapper.write_op = func
+    return wrapper
+
+# Колонки users, которые можно менять через patch_user
+USER_COLUMNS = frozenset({
+    'username', 'nickname', 'first_name', 'last_name', 'total_points', 'badges',
+    'custom_emoji', 'daily_family_contracts', 'last_family_reset', 'join_date', 'last_active',
+    'tasks_completed', 'tasks_pending', 'tasks_rejected', 'is_banned', 'ban_reason',
+    'daily_tasks_count', 'last_task_date', 'settings', 'drawings_won', 'last_drawing_win',
+    'bot_blocked'
+})
+USER_JSON_COLUMNS = frozenset({'badges', 'settings'})
+# Сколько значений передавать в один IN (...), с запасом до лимита переменных SQLite
+SQL_IN_CHUNK_SIZE = 500
+
+@lru_cache(maxsize=None)
+def _user_upsert_sql(columns: tuple) -> str:
+    """Текст UPSERT для набора колонок (кэшируется, набор колонок задает код, а не пользователь)"""
+    return (
+        f"INSERT INTO users (user_id, {', '.join(columns)}) "
+        f"VALUES (?{', ?' * len(columns)}) "
+        f"ON CONFLICT(user_id) DO UPDATE SET "
+        + ', '.join(f"{col} = excluded.{col}" for col in columns)
+    )
+
+def utc_now() -> datetime:
+    """Текущее время UTC (в нем SQLite пишет CURRENT_TIMESTAMP и считает date('now'))"""
+    return datetime.now(timezone.utc)
+
+def day_number(when: datetime = None) -> int:
+    """Номер дня по UTC от 1970-01-01, к которому относятся дневные счетчики.
+    
+    Граница дня та же, что у date('now') и tasks_day:<дата> в SQLite.
+    Время без часового пояса считается временем UTC.
+    """
+    when = when or utc_now()
+    if when.tzinfo:
+        when = when.astimezone(timezone.utc)
+    return (when.date() - date(1970, 1, 1)).days
+
+def day_range(day: str) -> Tuple[str, str]:
+    """Полуоткрытый интервал [начало дня, начало следующего дня) для сравнения с TIMESTAMP-колонками.
+    День задается датой UTC, как и CURRENT_TIMESTAMP в этих колонках"""
+    start = datetime.strptime(day, "%Y-%m-%d")
+    return start.strftime("%Y-%m-%d"), (start + timedelta(days=1)).strftime("%Y-%m-%d")
+
+class UserCache:
+    """LRU-кэш профилей пользователей с ограничением по времени жизни.
+    
+    Записи сбрасываются после коммита, изменившего пользователя. Счетчик
+    поколений не дает потоку, прочитавшему строку до коммита, положить
+    в кэш устаревшую копию уже после сброса.
+    """
+    
+    def __init__(self, max_size: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def _copy(user: dict) -> dict:
+        # Списки и словари отдаем копиями, чтобы правки вызывающего кода не попали в кэш
+        return {**user, 'badges': list(user['badges']), 'settings': dict(user['settings'])}
+    
+    @property
+    def generation(self) -> int:
+        return self._generation
+    
+    def get(self, user_id: int) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[0] > time.monotonic():
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return self._copy(entry[1])
+            if entry:
+                del self._entries[user_id]
+            self.misses += 1
+            return None
+    
+    def put(self, user_id: int, user: dict, generation: int):
+        """Запомнить профиль, прочитанный при поколении generation"""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[user_id] = (time.monotonic() + self.ttl, self._copy(user))
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def invalidate(self, user_ids):
+        with self._lock:
+            self._generation += 1
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+    
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+    
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
+
 class Database:
     _instance = None
     
@@ -305,21 +517,206 @@ class Database:
         return cls._instance
     
     def init_db(self):
-        self.conn = sqlite3.connect('bot_database.db', check_same_thread=False)
-        self.conn.row_factory = sqlite3.Row
+        self.wal_mode = DB_STORAGE_MODE == "wal"
+        # Все записи идут через одно соединение и сериализуются этой блокировкой
+        self._write_lock = threading.RLock()
+        self._user_listeners = []
+        self._op_changed_users = set()
+        self.user_cache = UserCache()
+        self.add_user_listener(self.user_cache.invalidate)
+        self.conn = self._connect()
+        if self.wal_mode:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
         self.create_tables()
+        
+        # Пул соединений только для чтения (в WAL читатели не ждут писателя)
+        self._read_pool = queue.Queue()
+        if self.wal_mode:
+            for _ in range(DB_READ_POOL_SIZE):
+                self._read_pool.put(self._connect(read_only=True))
+        
+        # Фоновый писатель с групповым коммитом
+        self.group_commit = DB_GROUP_COMMIT_MS > 0
+        self._write_queue = queue.Queue()
+        self._writer_thread = None
+        if self.group_commit:
+            self._writer_thread = threading.Thread(target=self._writer_loop, name="db-writer", daemon=True)
+            self._writer_thread.start()
+        
+        logger.info(f"База данных: {DB_PATH}, режим {'WAL' if self.wal_mode else 'legacy'}")
+    
+    @property
+    def max_concurrency(self) -> int:
+        """Сколько запросов может выполняться одновременно"""
+        return DB_READ_POOL_SIZE + 1 if self.wal_mode else 1
+    
+    def _connect(self, read_only: bool = False):
+        if read_only:
+            uri = f"{Path(DB_PATH).absolute().as_uri()}?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f'PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}')
+        if self.wal_mode:
+            conn.execute(f'PRAGMA cache_size=-{DB_CACHE_SIZE_KB}')
+            conn.execute(f'PRAGMA mmap_size={DB_MMAP_SIZE}')
+            conn.execute('PRAGMA temp_store=MEMORY')
+        return conn
     
     @contextmanager
     def get_cursor(self):
-        cursor = self.conn.cursor()
+        """Транзакция на соединении писателя"""
+        with self._write_lock:
+            cursor = self.conn.cursor()
+            try:
+                yield cursor
+                self.conn.commit()
+            except Exception as e:
+                self.conn.rollback()
+                raise e
+            finally:
+                cursor.close()
+    
+    @contextmanager
+    def read_cursor(self):
+        """Курсор для SELECT из пула читателей"""
+        if not self.wal_mode:
+            with self.get_cursor() as cursor:
+                yield cursor
+            return
+        
+        conn = self._read_pool.get()
+        cursor = conn.cursor()
         try:
             yield cursor
-            self.conn.commit()
-        except Exception as e:
-            self.conn.rollback()
-            raise e
         finally:
             cursor.close()
+            self._read_pool.put(conn)
+    
+    # ========== ГРУППОВОЙ КОММИТ ==========
+    def submit_write(self, op, *args, **kwargs) -> Future:
+        """Поставить операцию записи в очередь писателя.
+        
+        op(self, cursor, *args, **kwargs) выполняется внутри общей транзакции,
+        Future получает результат только после коммита.
+        """
+        future = Future()
+        if not self.group_commit:
+            if future.set_running_or_notify_cancel():
+                try:
+                    with self.get_cursor() as cursor:
+                        self._op_changed_users = changed_users = set()
+                        result = op(self, cursor, *args, **kwargs)
+                    self._notify_users_changed(changed_users)
+                    future.set_result(result)
+                except Exception as e:
+                    future.set_exception(e)
+            return future
+        
+        self._write_queue.put((op, args, kwargs, future))
+        return future
+    
+    def _writer_loop(self):
+        stopping = False
+        while not stopping:
+            item = self._write_queue.get()
+            if item is None:
+                break
+            
+            # Добираем операции, пришедшие за окно группового коммита
+            batch = [item]
+            deadline = time.monotonic() + DB_GROUP_COMMIT_MS / 1000
+            while len(batch) < DB_GROUP_COMMIT_MAX:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._write_queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            
+            try:
+                self._commit_batch(batch)
+            except Exception as e:
+                logger.error(f"Ошибка группового коммита: {e}")
+    
+    def _commit_batch(self, batch):
+        outcomes = []
+        changed_users = set()
+        with self._write_lock:
+            cursor = self.conn.cursor()
+            try:
+                cursor.execute('BEGIN IMMEDIATE')
+                for op, args, kwargs, future in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    
+                    # Ошибка одной операции откатывает только ее
+                    cursor.execute('SAVEPOINT write_op')
+                    self._op_changed_users = set()
+                    try:
+                        result = op(self, cursor, *args, **kwargs)
+                    except Exception as e:
+                        cursor.execute('ROLLBACK TO write_op')
+                        cursor.execute('RELEASE write_op')
+                        outcomes.append((future, None, e))
+                    else:
+                        cursor.execute('RELEASE write_op')
+                        changed_users |= self._op_changed_users
+                        outcomes.append((future, result, None))
+                self.conn.commit()
+            except Exception as e:
+                self.conn.rollback()
+                for op, args, kwargs, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+            finally:
+                cursor.close()
+        
+        # Слушатели видят зафиксированные данные раньше, чем вызывающий код получит результат
+        self._notify_users_changed(changed_users)
+        
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+    
+    # ========== УВЕДОМЛЕНИЯ ОБ ИЗМЕНЕНИЯХ ==========
+    def add_user_listener(self, listener):
+        """Подписаться на изменения пользователей: listener(set user_id) вызывается после коммита"""
+        self._user_listeners.append(listener)
+    
+    def _user_changed(self, *user_ids: int):
+        """Отметить пользователей, чьи строки в users изменила текущая операция записи"""
+        self._op_changed_users.update(user_ids)
+    
+    def _notify_users_changed(self, user_ids: set):
+        if not user_ids:
+            return
+        for listener in self._user_listeners:
+            try:
+                listener(user_ids)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика изменений пользователей: {e}")
+    
+    def close(self):
+        """Остановить писателя и закрыть все соединения"""
+        if self._writer_thread:
+            self._write_queue.put(None)
+            self._writer_thread.join()
+            self._writer_thread = None
+        while not self._read_pool.empty():
+            self._read_pool.get_nowait().close()
+        with self._write_lock:
+            self.conn.close()
     
     def create_tables(self):
         with self.get_cursor() as cursor:
@@ -403,6 +800,7 @@ class Database:
                     participants TEXT DEFAULT '[]',
                     winners TEXT DEFAULT '{}',
                     ticket_numbers TEXT DEFAULT '{}',
+                    participants_count INTEGER DEFAULT 0,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             ''')
@@ -422,143 +820,569 @@ class Database:
             ''')
             
             # Индексы
+            # Рейтинг (get_user_rank, get_top_users): фильтр по бану, порядок по баллам, при равенстве - по user_id
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_rank ON users(is_banned, total_points DESC, user_id)')
+            # Поиск перебором (search_users) идет по баллам без фильтра по бану и останавливается на LIMIT
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_points ON users(total_points DESC)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_nickname ON users(nickname)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status)')
+            # Очередь модерации: только ожидающие задания в порядке подачи.
+            # Малоселективный индекс по status заменен частичным
+            cursor.execute('DROP INDEX IF EXISTS idx_tasks_status')
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_tasks_pending_queue ON tasks(created_at, task_id) WHERE status = 'pending'"
+            )
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_tasks_user_date ON tasks(user_id, created_at DESC)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_drawings_status ON drawings(status)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_drawings_dates ON drawings(start_date, end_date)')
+            
+            # Участники розыгрыша хранятся только в drawing_participations
+            if self._ensure_column(cursor, 'drawings', 'participants_count', 'INTEGER DEFAULT 0'):
+                cursor.execute('''
+                    UPDATE drawings SET participants_count = (
+                        SELECT COUNT(DISTINCT user_id) FROM drawing_participations dp
+                        WHERE dp.drawing_id = drawings.drawing_id
+                    )
+                ''')
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_participations_drawing_user'"
+            )
+            if not cursor.fetchone():
+                # Дубликаты участия остались от старой схемы без уникального индекса
+                cursor.execute('''
+                    DELETE FROM drawing_participations
+                    WHERE participation_id NOT IN (
+                        SELECT MIN(participation_id) FROM drawing_participations
+                        GROUP BY drawing_id, user_id
+                    )
+                ''')
+                cursor.execute(
+                    'CREATE UNIQUE INDEX idx_participations_drawing_user ON drawing_participations(drawing_id, user_id)'
+                )
+            
+            self._create_counters(cursor)
+            self._create_task_rollup(cursor)
+            self.fts_enabled = self._create_user_search(cursor)
+            self._create_daily_counters(cursor)
+            
+            # Аренда заданий на проверку: кто и до какого момента (unix time) проверяет задание
+            self._ensure_column(cursor, 'tasks', 'claimed_by', 'INTEGER')
+            self._ensure_column(cursor, 'tasks', 'claimed_until', 'INTEGER')
+            cursor.execute(
+                'CREATE INDEX IF NOT EXISTS idx_tasks_claimed_by ON tasks(claimed_by) WHERE claimed_by IS NOT NULL'
+            )
+            
+            # Рассылки: last_user_id - курсор по users, до которого рассылка уже отправлена
+            self._ensure_column(cursor, 'users', 'bot_blocked', 'INTEGER DEFAULT 0')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS broadcasts (
+                    broadcast_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    admin_id INTEGER NOT NULL,
+                    text TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'running',
+                    last_user_id INTEGER NOT NULL DEFAULT 0,
+                    total INTEGER NOT NULL DEFAULT 0,
+                    sent INTEGER NOT NULL DEFAULT 0,
+                    failed INTEGER NOT NULL DEFAULT 0,
+                    blocked INTEGER NOT NULL DEFAULT 0,
+                    progress_chat_id INTEGER,
+                    progress_message_id INTEGER,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP,
+                    finished_at TIMESTAMP
+                )
+            ''')
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_broadcasts_running ON broadcasts(broadcast_id) WHERE status = 'running'"
+            )
+            
+            # Уведомления пишутся сюда той же транзакцией, что и изменение, о котором они сообщают
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS outbox (
+                    outbox_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    chat_id INTEGER NOT NULL,
+                    text TEXT NOT NULL,
+                    dedup_key TEXT UNIQUE,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    locked_at TIMESTAMP,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    sent_at TIMESTAMP
+                )
+            ''')
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_outbox_pending ON outbox(next_attempt_at) WHERE status = 'pending'"
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_outbox_sending ON outbox(locked_at) WHERE status = 'sending'"
+            )
+    
+    def _create_counters(self, cursor):
+        """Счетчики для панели администратора, которые ведут триггеры в той же транзакции"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS system_counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('SELECT COUNT(*) FROM system_counters')
+        needs_seed = cursor.fetchone()[0] == 0
+        
+        def bump(name: str, delta: str) -> str:
+            return (
+                f"INSERT INTO system_counters (name, value) VALUES ({name}, {delta}) "
+                f"ON CONFLICT(name) DO UPDATE SET value = value + excluded.value;"
+            )
+        
+        user_points = "CASE WHEN {row}.is_banned = 0 THEN {row}.total_points ELSE 0 END"
+        triggers = {
+            'trg_counters_users_insert': ('AFTER INSERT ON users', [
+                bump("'total_users'", "NEW.is_banned = 0"),
+                bump("'total_points'", user_points.format(row='NEW')),
+            ]),
+            'trg_counters_users_update': ('AFTER UPDATE OF is_banned, total_points ON users', [
+                bump("'total_users'", "(NEW.is_banned = 0) - (OLD.is_banned = 0)"),
+                bump("'total_points'", f"{user_points.format(row='NEW')} - {user_points.format(row='OLD')}"),
+            ]),
+            'trg_counters_users_delete': ('AFTER DELETE ON users', [
+                bump("'total_users'", "-(OLD.is_banned = 0)"),
+                bump("'total_points'", f"-{user_points.format(row='OLD')}"),
+            ]),
+            'trg_counters_tasks_insert': ('AFTER INSERT ON tasks', [
+                bump("'pending_tasks'", "NEW.status = 'pending'"),
+                bump("'tasks_day:' || date(NEW.created_at)", "1"),
+            ]),
+            'trg_counters_tasks_update': ('AFTER UPDATE OF status ON tasks', [
+                bump("'pending_tasks'", "(NEW.status = 'pending') - (OLD.status = 'pending')"),
+            ]),
+            'trg_counters_tasks_delete': ('AFTER DELETE ON tasks', [
+                bump("'pending_tasks'", "-(OLD.status = 'pending')"),
+                bump("'tasks_day:' || date(OLD.created_at)", "-1"),
+            ]),
+            'trg_counters_drawings_insert': ('AFTER INSERT ON drawings', [
+                bump("'active_drawings'", "NEW.status = 'active'"),
+            ]),
+            'trg_counters_drawings_update': ('AFTER UPDATE OF status ON drawings', [
+                bump("'active_drawings'", "(NEW.status = 'active') - (OLD.status = 'active')"),
+            ]),
+            'trg_counters_drawings_delete': ('AFTER DELETE ON drawings', [
+                bump("'active_drawings'", "-(OLD.status = 'active')"),
+            ]),
+        }
+        for trigger_name, (event, statements) in triggers.items():
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {trigger_name} {event} BEGIN {' '.join(statements)} END")
+        
+        if needs_seed:
+            # Первый запуск со счетчиками: считаем по существующим данным
+            cursor.execute('''
+                INSERT INTO system_counters (name, value)
+                SELECT 'total_users', COUNT(*) FROM users WHERE is_banned = 0
+                UNION ALL
+                SELECT 'total_points', COALESCE(SUM(total_points), 0) FROM users WHERE is_banned = 0
+                UNION ALL
+                SELECT 'pending_tasks', COUNT(*) FROM tasks WHERE status = 'pending'
+                UNION ALL
+                SELECT 'active_drawings', COUNT(*) FROM drawings WHERE status = 'active'
+                UNION ALL
+                SELECT 'tasks_day:' || date(created_at), COUNT(*) FROM tasks GROUP BY date(created_at)
+            ''')
+    
+    def _create_daily_counters(self, cursor):
+        """Дневные квоты участников: счетчик на (пользователь, день, тип задания).
+        
+        Строка с task_type = DAILY_TOTAL_KEY считает отправки за день, строки
+        типов - выполнения. Строки прошлых дней просто не читаются.
+        """
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_daily_counters'")
+        needs_backfill = cursor.fetchone() is None
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS user_daily_counters (
+                user_id INTEGER NOT NULL,
+                day INTEGER NOT NULL,
+                task_type TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, day, task_type)
+            ) WITHOUT ROWID
+        ''')
+        
+        if needs_backfill:
+            # Переносим сегодняшние счетчики из колонок users: отправки помечены
+            # last_task_date, семейные контракты - last_family_reset
+            today = day_number()
+            today_date = (date(1970, 1, 1) + timedelta(days=today)).isoformat()
+            cursor.execute('''
+                INSERT INTO user_daily_counters (user_id, day, task_type, count)
+                SELECT user_id, ?, ?, daily_tasks_count FROM users
+                WHERE last_task_date = ? AND daily_tasks_count > 0
+                UNION ALL
+                SELECT user_id, ?, 'family_contracts', daily_family_contracts FROM users
+                WHERE date(last_family_reset) = ? AND daily_family_contracts > 0
+            ''', (today, DAILY_TOTAL_KEY, today_date, today, today_date))
+    
+    def _create_user_search(self, cursor) -> bool:
+        """Полнотекстовый индекс (FTS5, триграммы) по именам пользователей.
+        
+        Индекс хранит только токены, тексты берутся из users; триггеры
+        поддерживают его в той же транзакции. Без FTS5 поиск идет через LIKE.
+        """
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users_fts'")
+        needs_rebuild = cursor.fetchone() is None
+        
+        try:
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+                    nickname, username, first_name, last_name,
+                    content = 'users', content_rowid = 'user_id', tokenize = 'trigram'
+                )
+            ''')
+        except sqlite3.OperationalError as e:
+            logger.warning(f"FTS5 недоступен, поиск пользователей через LIKE: {e}")
+            return False
+        
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_users_fts_insert AFTER INSERT ON users
+            BEGIN
+                INSERT INTO users_fts (rowid, nickname, username, first_name, last_name)
+                VALUES (NEW.user_id, NEW.nickname, NEW.username, NEW.first_name, NEW.last_name);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_users_fts_delete AFTER DELETE ON users
+            BEGIN
+                INSERT INTO users_fts (users_fts, rowid, nickname, username, first_name, last_name)
+                VALUES ('delete', OLD.user_id, OLD.nickname, OLD.username, OLD.first_name, OLD.last_name);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_users_fts_update
+            AFTER UPDATE OF nickname, username, first_name, last_name ON users
+            BEGIN
+                INSERT INTO users_fts (users_fts, rowid, nickname, username, first_name, last_name)
+                VALUES ('delete', OLD.user_id, OLD.nickname, OLD.username, OLD.first_name, OLD.last_name);
+                INSERT INTO users_fts (rowid, nickname, username, first_name, last_name)
+                VALUES (NEW.user_id, NEW.nickname, NEW.username, NEW.first_name, NEW.last_name);
+            END
+        ''')
+        
+        if needs_rebuild:
+            cursor.execute("INSERT INTO users_fts (users_fts) VALUES ('rebuild')")
+        return True
+    
+    def _create_task_rollup(self, cursor):
+        """Дневная сводка заданий по дню подачи, типу и участнику, ее ведут триггеры на tasks"""
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'task_daily_stats'")
+        needs_backfill = cursor.fetchone() is None
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS task_daily_stats (
+                day TEXT NOT NULL,
+                task_type TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                submitted INTEGER NOT NULL DEFAULT 0,
+                approved INTEGER NOT NULL DEFAULT 0,
+                rejected INTEGER NOT NULL DEFAULT 0,
+                points INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, task_type, user_id)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_task_daily_user ON task_daily_stats(user_id, task_type)')
+        
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_task_daily_insert AFTER INSERT ON tasks
+            BEGIN
+                INSERT INTO task_daily_stats (day, task_type, user_id, submitted)
+                VALUES (date(NEW.created_at), NEW.task_type, NEW.user_id, 1)
+                ON CONFLICT(day, task_type, user_id) DO UPDATE SET submitted = submitted + 1;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_task_daily_review AFTER UPDATE OF status ON tasks
+            WHEN NEW.status != OLD.status
+            BEGIN
+                UPDATE task_daily_stats
+                SET approved = approved + (NEW.status = 'approved') - (OLD.status = 'approved'),
+                    rejected = rejected + (NEW.status = 'rejected') - (OLD.status = 'rejected'),
+                    points = points
+                        + CASE WHEN NEW.status = 'approved' THEN NEW.points * NEW.count ELSE 0 END
+                        - CASE WHEN OLD.status = 'approved' THEN OLD.points * OLD.count ELSE 0 END
+                WHERE day = date(NEW.created_at) AND task_type = NEW.task_type AND user_id = NEW.user_id;
+            END
+        ''')
+        
+        if needs_backfill:
+            cursor.execute('''
+                INSERT INTO task_daily_stats (day, task_type, user_id, submitted, approved, rejected, points)
+                SELECT date(created_at), task_type, user_id, COUNT(*),
+                       SUM(status = 'approved'), SUM(status = 'rejected'),
+                       SUM(CASE WHEN status = 'approved' THEN points * count ELSE 0 END)
+                FROM tasks
+                GROUP BY date(created_at), task_type, user_id
+            ''')
+    
+    def _ensure_column(self, cursor, table: str, column: str, definition: str) -> bool:
+        """Добавить колонку в существующую таблицу. True, если колонка была создана"""
+        cursor.execute(f'PRAGMA table_info({table})')
+        if any(row['name'] == column for row in cursor.fetchall()):
+            return False
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+        return True
     
     # ========== МЕТОДЫ ПОЛЬЗОВАТЕЛЕЙ ==========
     def get_user(self, user_id: int):
-        with self.get_cursor() as cursor:
+        user = self.user_cache.get(user_id)
+        if user is not None:
+            return user
+        
+        generation = self.user_cache.generation
+        with self.read_cursor() as cursor:
             cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
             row = cursor.fetchone()
             if row:
                 user = dict(row)
                 user['badges'] = json.loads(user['badges']) if user['badges'] else []
                 user['settings'] = json.loads(user['settings']) if user['settings'] else {}
+                self.user_cache.put(user_id, user, generation)
                 return user
             return None
     
-    def save_user(self, user_data: dict):
-        with self.get_cursor() as cursor:
+    def _upsert_user(self, cursor, user_id: int, fields: dict):
+        unknown = set(fields) - USER_COLUMNS
+        if unknown:
+            raise ValueError(f"Неизвестные поля пользователя: {', '.join(sorted(unknown))}")
+        
+        columns = tuple(sorted(fields))
+        values = []
+        for col in columns:
+            value = fields[col]
+            if col in USER_JSON_COLUMNS and not isinstance(value, str):
+                value = json.dumps(value)
+            elif col == 'is_banned':
+                value = int(value)
+            values.append(value)
+        
+        cursor.execute(_user_upsert_sql(columns), (user_id, *values))
+        self._user_changed(user_id)
+    
+    @write_operation
+    def patch_user(self, cursor, user_id: int, **fields):
+        """Создать пользователя или обновить только переданные колонки.
+        
+        Остальные поля существующей строки не трогаются, у новой строки
+        они получают значения по умолчанию из схемы.
+        """
+        self._upsert_user(cursor, user_id, fields)
+    
+    @write_operation
+    def save_user(self, cursor, user_data: dict):
+        """Записать переданные поля пользователя. last_active пишет только ActivityTracker"""
+        fields = dict(user_data)
+        user_id = fields.pop('user_id')
+        self._upsert_user(cursor, user_id, fields)
+    
+    @write_operation
+    def update_user_points(self, cursor, user_id: int, points_change: int, admin_id: int = None, note: str = ""):
+        cursor.execute(
+            'UPDATE users SET total_points = total_points + ? WHERE user_id = ?',
+            (points_change, user_id)
+        )
+        self._user_changed(user_id)
+        
+        if admin_id:
+            operation_type = "add_points" if points_change > 0 else "remove_points"
             cursor.execute('''
-                INSERT OR REPLACE INTO users 
-                (user_id, username, nickname, first_name, last_name, total_points, badges, 
-                 custom_emoji, daily_family_contracts, last_family_reset, join_date, last_active,
-                 tasks_completed, tasks_pending, tasks_rejected, is_banned, ban_reason,
-                 daily_tasks_count, last_task_date, settings, drawings_won, last_drawing_win)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                user_data['user_id'],
-                user_data.get('username'),
-                user_data.get('nickname'),
-                user_data.get('first_name'),
-                user_data.get('last_name'),
-                user_data.get('total_points', 0),
-                json.dumps(user_data.get('badges', [])),
-                user_data.get('custom_emoji', ''),
-                user_data.get('daily_family_contracts', 0),
-                user_data.get('last_family_reset'),
-                user_data.get('join_date', datetime.now()),
-                datetime.now(),
-                user_data.get('tasks_completed', 0),
-                user_data.get('tasks_pending', 0),
-                user_data.get('tasks_rejected', 0),
-                int(user_data.get('is_banned', False)),
-                user_data.get('ban_reason', ''),
-                user_data.get('daily_tasks_count', 0),
-                user_data.get('last_task_date'),
-                json.dumps(user_data.get('settings', {})),
-                user_data.get('drawings_won', 0),
-                user_data.get('last_drawing_win')
-            ))
-    
-    def update_user_points(self, user_id: int, points_change: int, admin_id: int = None, note: str = ""):
-        with self.get_cursor() as cursor:
-            cursor.execute(
-                'UPDATE users SET total_points = total_points + ? WHERE user_id = ?',
-                (points_change, user_id)
-            )
-            
-            if admin_id:
-                operation_type = "add_points" if points_change > 0 else "remove_points"
-                cursor.execute('''
-                    INSERT INTO admin_operations 
-                    (admin_id, user_id, operation_type, points_change, note)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (admin_id, user_id, operation_type, points_change, note))
-            
-            return cursor.rowcount > 0
+                INSERT INTO admin_operations 
+                (admin_id, user_id, operation_type, points_change, note)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (admin_id, user_id, operation_type, points_change, note))
+        
+        return cursor.rowcount > 0
     
-    def update_user_badges(self, user_id: int, badges: list):
-        with self.get_cursor() as cursor:
+    @write_operation
+    def update_user_badges(self, cursor, user_id: int, badges: list):
+        cursor.execute(
+            'UPDATE users SET badges = ? WHERE user_id = ?',
+            (json.dumps(badges), user_id)
+        )
+        self._user_changed(user_id)
+        return cursor.rowcount > 0
+    
+    @write_operation
+    def update_user_emoji(self, cursor, user_id: int, emoji: str, admin_id: int = None, note: str = ""):
+        cursor.execute(
+            'UPDATE users SET custom_emoji = ? WHERE user_id = ?',
+            (emoji, user_id)
+        )
+        self._user_changed(user_id)
+        
+        if admin_id:
+            cursor.execute('''
+                INSERT INTO admin_operations 
+                (admin_id, user_id, operation_type, emoji_change, note)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (admin_id, user_id, "set_emoji", emoji, note))
+        
+        return cursor.rowcount > 0
+    
+    # ========== ДНЕВНЫЕ КВОТЫ ==========
+    def _consume_quota(self, cursor, user_id: int, task_type: str, n: int = 1):
+        """Проверить и списать квоту одним UPSERT в текущей транзакции.
+        
+        Отправка проходит, если сегодня отправлено меньше DAILY_TASK_LIMIT заданий
+        и у типа с max_per_day останется не больше лимита выполнений. SQLite
+        материализует SELECT до вставки, поэтому условие проверяется по
+        значениям до увеличения. Возвращает новые счетчики {ключ: значение} или None.
+        """
+        today = day_number()
+        type_limit = TASK_TYPES.get(task_type, {}).get('max_per_day')
+        cursor.execute('''
+            INSERT INTO user_daily_counters (user_id, day, task_type, count)
+            SELECT ?, ?, quota.column1, quota.column2
+            FROM (VALUES (?, 1), (?, ?)) AS quota
+            WHERE COALESCE((
+                SELECT count FROM user_daily_counters
+                WHERE user_id = ? AND day = ? AND task_type = ?
+            ), 0) < ?
+            AND (? IS NULL OR COALESCE((
+                SELECT count FROM user_daily_counters
+                WHERE user_id = ? AND day = ? AND task_type = ?
+            ), 0) + ? <= ?)
+            ON CONFLICT (user_id, day, task_type) DO UPDATE SET count = count + excluded.count
+            RETURNING task_type, count
+        ''', (
+            user_id, today, DAILY_TOTAL_KEY, task_type, n,
+            user_id, today, DAILY_TOTAL_KEY, DAILY_TASK_LIMIT,
+            type_limit, user_id, today, task_type, n, type_limit
+        ))
+        counters = {row[0]: row[1] for row in cursor.fetchall()}
+        return counters or None
+    
+    @write_operation
+    def try_consume_quota(self, cursor, user_id: int, task_type: str, n: int = 1):
+        """Списать дневную квоту на отправку n выполнений задания task_type.
+        
+        Возвращает новые счетчики или None, если лимит исчерпан.
+        """
+        return self._consume_quota(cursor, user_id, task_type, n)
+    
+    def get_daily_counters(self, user_id: int) -> Dict[str, int]:
+        """Сегодняшние счетчики пользователя: DAILY_TOTAL_KEY - отправки, типы заданий - выполнения"""
+        with self.read_cursor() as cursor:
             cursor.execute(
-                'UPDATE users SET badges = ? WHERE user_id = ?',
-                (json.dumps(badges), user_id)
+                'SELECT task_type, count FROM user_daily_counters WHERE user_id = ? AND day = ?',
+                (user_id, day_number())
             )
-            return cursor.rowcount > 0
+            return {row[0]: row[1] for row in cursor.fetchall()}
     
-    def update_user_emoji(self, user_id: int, emoji: str, admin_id: int = None, note: str = ""):
-        with self.get_cursor() as cursor:
+    @write_operation
+    def prune_daily_counters(self, cursor, keep_days: int = 7):
+        """Удалить дневные квоты участников и счетчики tasks_day:<дата> старше keep_days дней"""
+        cursor.execute('DELETE FROM user_daily_counters WHERE day < ?', (day_number() - keep_days,))
+        pruned = cursor.rowcount
+        cursor.execute('''
+            DELETE FROM system_counters
+            WHERE name LIKE 'tasks_day:%' AND name < 'tasks_day:' || date('now', ?)
+        ''', (f'-{keep_days} days',))
+        return pruned + cursor.rowcount
+    
+    @write_operation
+    def touch_users(self, cursor, activity: list):
+        """Записать время последней активности: список пар (user_id, datetime).
+        
+        Кэш пользователей намеренно не сбрасывается: актуальное время
+        активности хранит ActivityTracker, а last_active в базе и так
+        отстает на интервал сброса.
+        """
+        cursor.executemany(
+            'UPDATE users SET last_active = ? WHERE user_id = ?',
+            [(last_active, user_id) for user_id, last_active in activity]
+        )
+    
+    def get_recent_activity(self, since: datetime):
+        with self.read_cursor() as cursor:
             cursor.execute(
-                'UPDATE users SET custom_emoji = ? WHERE user_id = ?',
-                (emoji, user_id)
+                'SELECT user_id, last_active FROM users WHERE last_active >= ?',
+                (since,)
             )
-            
-            if admin_id:
-                cursor.execute('''
-                    INSERT INTO admin_operations 
-                    (admin_id, user_id, operation_type, emoji_change, note)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (admin_id, user_id, "set_emoji", emoji, note))
-            
-            return cursor.rowcount > 0
+            return [(row['user_id'], datetime.fromisoformat(row['last_active'])) for row in cursor.fetchall()]
     
     # ========== МЕТОДЫ ЗАДАНИЙ ==========
-    def create_task(self, task_data: dict):
-        with self.get_cursor() as cursor:
-            cursor.execute('''
-                INSERT INTO tasks 
-                (user_id, task_type, points, count, screenshot_path, comment, status, drawing_name)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                task_data['user_id'],
-                task_data['task_type'],
-                task_data['points'],
-                task_data.get('count', 1),
-                task_data.get('screenshot_path'),
-                task_data.get('comment'),
-                task_data.get('status', 'pending'),
-                task_data.get('drawing_name')
-            ))
-            
-            task_id = cursor.lastrowid
-            
-            # Обновляем статистику пользователя
-            if task_data.get('status') == 'pending':
-                cursor.execute(
-                    'UPDATE users SET tasks_pending = tasks_pending + 1 WHERE user_id = ?',
-                    (task_data['user_id'],)
-                )
-            
-            return task_id
+    @write_operation
+    def create_task(self, cursor, task_data: dict, consume_quota: bool = False):
+        """Создать задание. Возвращает (task_id, задание первое в очереди проверки).
+        
+        С consume_quota сначала списывается дневная квота в той же транзакции;
+        если лимит исчерпан, задание не создается и возвращается (None, False)
+        """
+        if consume_quota and not self._consume_quota(
+            cursor, task_data['user_id'], task_data['task_type'], task_data.get('count', 1)
+        ):
+            return None, False
+        
+        cursor.execute('''
+            INSERT INTO tasks 
+            (user_id, task_type, points, count, screenshot_path, comment, status, drawing_name)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            task_data['user_id'],
+            task_data['task_type'],
+            task_data['points'],
+            task_data.get('count', 1),
+            task_data.get('screenshot_path'),
+            task_data.get('comment'),
+            task_data.get('status', 'pending'),
+            task_data.get('drawing_name')
+        ))
+        
+        task_id = cursor.lastrowid
+        
+        # Обновляем статистику пользователя
+        first_pending = False
+        if task_data.get('status') == 'pending':
+            cursor.execute(
+                'UPDATE users SET tasks_pending = tasks_pending + 1 WHERE user_id = ?',
+                (task_data['user_id'],)
+            )
+            self._user_changed(task_data['user_id'])
+            # Очередь проверяется в той же транзакции, что и вставка
+            cursor.execute(
+                "SELECT NOT EXISTS (SELECT 1 FROM tasks WHERE status = 'pending' AND task_id <> ?)",
+                (task_id,)
+            )
+            first_pending = bool(cursor.fetchone()[0])
+        
+        return task_id, first_pending
     
-    def get_pending_tasks(self, limit: int = 50):
-        with self.get_cursor() as cursor:
-            cursor.execute('''
-                SELECT t.*, u.nickname, u.username 
-                FROM tasks t 
-                LEFT JOIN users u ON t.user_id = u.user_id 
-                WHERE t.status = 'pending'
-                ORDER BY t.created_at ASC 
-                LIMIT ?
-            ''', (limit,))
+    def get_pending_tasks(self, limit: int = 50, after_task_id: int = None):
+        """Ожидающие задания в порядке подачи.
+        
+        after_task_id - курсор страницы: выдаются задания после указанного
+        (по created_at, task_id), поэтому любая страница стоит одинаково.
+        """
+        with self.read_cursor() as cursor:
+            if after_task_id is None:
+                cursor.execute('''
+                    SELECT t.*, u.nickname, u.username
+                    FROM tasks t
+                    LEFT JOIN users u ON t.user_id = u.user_id
+                    WHERE t.status = 'pending'
+                    ORDER BY t.created_at, t.task_id
+                    LIMIT ?
+                ''', (limit,))
+            else:
+                cursor.execute('''
+                    SELECT t.*, u.nickname, u.username
+                    FROM tasks t
+                    LEFT JOIN users u ON t.user_id = u.user_id
+                    WHERE t.status = 'pending'
+                    AND (t.created_at, t.task_id) > (SELECT created_at, task_id FROM tasks WHERE task_id = ?)
+                    ORDER BY t.created_at, t.task_id
+                    LIMIT ?
+                ''', (after_task_id, limit))
             return [dict(row) for row in cursor.fetchall()]
     
     def get_user_tasks(self, user_id: int, limit: int = 50):
-        with self.get_cursor() as cursor:
+        with self.read_cursor() as cursor:
             cursor.execute('''
                 SELECT * FROM tasks 
                 WHERE user_id = ? 
@@ -568,12 +1392,15 @@ class Database:
             return [dict(row) for row in cursor.fetchall()]
     
     def get_user_tasks_by_type(self, user_id: int, task_type: str, date: str = None):
-        with self.get_cursor() as cursor:
+        with self.read_cursor() as cursor:
             if date:
+                # Полуоткрытый интервал дня, чтобы работал индекс idx_tasks_user_date
+                day_start, day_end = day_range(date)
                 cursor.execute('''
-                    SELECT COUNT(*) as count FROM tasks 
-                    WHERE user_id = ? AND task_type = ? AND DATE(created_at) = ? AND status != 'rejected'
-                ''', (user_id, task_type, date))
+                    SELECT COUNT(*) as count FROM tasks
+                    WHERE user_id = ? AND created_at >= ? AND created_at < ?
+                    AND task_type = ? AND status != 'rejected'
+                ''', (user_id, day_start, day_end, task_type))
             else:
                 cursor.execute('''
                     SELECT COUNT(*) as count FROM tasks 
@@ -581,100 +1408,234 @@ class Database:
                 ''', (user_id, task_type))
             return cursor.fetchone()[0]
     
-    def approve_task(self, task_id: int, admin_id: int):
-        with self.get_cursor() as cursor:
-            # Получаем задание
-            cursor.execute('SELECT * FROM tasks WHERE task_id = ? AND status = "pending"', (task_id,))
-            task = cursor.fetchone()
-            if not task:
-                return False
-            
-            task = dict(task)
-            user_id = task['user_id']
-            points = task['points'] * task.get('count', 1)
-            
-            # Обновляем задание
-            cursor.execute('''
-                UPDATE tasks 
-                SET status = 'approved', reviewed_at = ?, reviewed_by = ?
-                WHERE task_id = ?
-            ''', (datetime.now(), admin_id, task_id))
-            
-            # Начисляем баллы пользователю
-            cursor.execute('''
-                UPDATE users 
-                SET total_points = total_points + ?, 
-                    tasks_completed = tasks_completed + 1,
-                    tasks_pending = tasks_pending - 1
-                WHERE user_id = ?
-            ''', (points, user_id))
-            
-            # Записываем операцию
-            cursor.execute('''
-                INSERT INTO admin_operations 
-                (admin_id, user_id, operation_type, points_change, note)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (admin_id, user_id, "approve_task", points, f"Одобрено задание #{task_id}"))
-            
-            return True
+    def _approve_task(self, cursor, task_id: int, admin_id: int, notify: Callable[[dict], str] = None):
+        """Одобрить задание в текущей транзакции.
+        
+        Возвращает строку задания с новым балансом автора (balance)
+        или None, если задание пропущено. notify(строка задания) дает
+        текст уведомления автору, оно записывается в outbox.
+        """
+        # Обновляем задание, если оно ждет проверки и его не держит другой администратор
+        cursor.execute('''
+            UPDATE tasks
+            SET status = 'approved', reviewed_at = ?, reviewed_by = ?, claimed_by = NULL, claimed_until = NULL
+            WHERE task_id = ? AND status = 'pending'
+            AND (claimed_until IS NULL OR claimed_until < ? OR claimed_by = ?)
+            RETURNING *
+        ''', (datetime.now(), admin_id, task_id, int(time.time()), admin_id))
+        task = cursor.fetchone()
+        if not task:
+            return None
+        
+        task = dict(task)
+        user_id = task['user_id']
+        points = task['points'] * task.get('count', 1)
+        
+        # Начисляем баллы пользователю
+        cursor.execute('''
+            UPDATE users
+            SET total_points = total_points + ?,
+                tasks_completed = tasks_completed + 1,
+                tasks_pending = tasks_pending - 1
+            WHERE user_id = ?
+            RETURNING total_points
+        ''', (points, user_id))
+        row = cursor.fetchone()
+        task['balance'] = row[0] if row else None
+        self._user_changed(user_id)
+        
+        # Записываем операцию
+        cursor.execute('''
+            INSERT INTO admin_operations 
+            (admin_id, user_id, operation_type, points_change, note)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (admin_id, user_id, "approve_task", points, f"Одобрено задание #{task_id}"))
+        
+        if notify:
+            self._add_to_outbox(cursor, [(user_id, notify(task), f"task:{task_id}:approved")])
+        
+        return task
     
-    def reject_task(self, task_id: int, admin_id: int, reason: str):
-        with self.get_cursor() as cursor:
-            cursor.execute('SELECT user_id FROM tasks WHERE task_id = ?', (task_id,))
-            task = cursor.fetchone()
-            if not task:
-                return False
-            
-            user_id = task[0]
-            
-            # Обновляем задание
-            cursor.execute('''
-                UPDATE tasks 
-                SET status = 'rejected', reviewed_at = ?, reviewed_by = ?, rejection_reason = ?
-                WHERE task_id = ?
-            ''', (datetime.now(), admin_id, reason, task_id))
-            
-            # Обновляем статистику пользователя
-            cursor.execute('''
-                UPDATE users 
-                SET tasks_rejected = tasks_rejected + 1,
-                    tasks_pending = tasks_pending - 1
-                WHERE user_id = ?
-            ''', (user_id,))
-            
-            # Записываем операцию
-            cursor.execute('''
-                INSERT INTO admin_operations 
-                (admin_id, user_id, operation_type, note)
-                VALUES (?, ?, ?, ?)
-            ''', (admin_id, user_id, "reject_task", f"Отклонено задание #{task_id}: {reason}"))
-            
-            return True
+    @write_operation
+    def approve_task(self, cursor, task_id: int, admin_id: int, notify: Callable[[dict], str] = None):
+        """Одобрить задание. Возвращает строку задания с новым балансом автора или None"""
+        return self._approve_task(cursor, task_id, admin_id, notify)
+    
+    @write_operation
+    def approve_tasks(self, cursor, task_ids: list, admin_id: int, notify: Callable[[dict], str] = None):
+        """Одобрить задания одной транзакцией: {task_id: строка задания или None, если пропущено}"""
+        return {task_id: self._approve_task(cursor, task_id, admin_id, notify) for task_id in task_ids}
+    
+    def _reject_task(self, cursor, task_id: int, admin_id: int, reason: str, notify: Callable[[dict], str] = None):
+        """Отклонить задание в текущей транзакции. Возвращает строку задания или None, если оно пропущено.
+        Уведомление автору (notify(строка задания)) записывается в outbox"""
+        cursor.execute('''
+            UPDATE tasks
+            SET status = 'rejected', reviewed_at = ?, reviewed_by = ?, rejection_reason = ?,
+                claimed_by = NULL, claimed_until = NULL
+            WHERE task_id = ? AND status = 'pending'
+            AND (claimed_until IS NULL OR claimed_until < ? OR claimed_by = ?)
+            RETURNING *
+        ''', (datetime.now(), admin_id, reason, task_id, int(time.time()), admin_id))
+        task = cursor.fetchone()
+        if not task:
+            return None
+        
+        task = dict(task)
+        user_id = task['user_id']
+        
+        # Обновляем статистику пользователя
+        cursor.execute('''
+            UPDATE users
+            SET tasks_rejected = tasks_rejected + 1,
+                tasks_pending = tasks_pending - 1
+            WHERE user_id = ?
+        ''', (user_id,))
+        self._user_changed(user_id)
+        
+        # Записываем операцию
+        cursor.execute('''
+            INSERT INTO admin_operations 
+            (admin_id, user_id, operation_type, note)
+            VALUES (?, ?, ?, ?)
+        ''', (admin_id, user_id, "reject_task", f"Отклонено задание #{task_id}: {reason}"))
+        
+        if notify:
+            self._add_to_outbox(cursor, [(user_id, notify(task), f"task:{task_id}:rejected")])
+        
+        return task
+    
+    @write_operation
+    def reject_task(self, cursor, task_id: int, admin_id: int, reason: str, notify: Callable[[dict], str] = None):
+        """Отклонить задание. Возвращает строку задания или None, если оно пропущено"""
+        return self._reject_task(cursor, task_id, admin_id, reason, notify)
+    
+    @write_operation
+    def reject_tasks(self, cursor, task_ids: list, admin_id: int, reason: str,
+                     notify: Callable[[dict], str] = None):
+        """Отклонить задания одной транзакцией: {task_id: строка задания или None, если пропущено}"""
+        return {task_id: self._reject_task(cursor, task_id, admin_id, reason, notify) for task_id in task_ids}
+    
+    @write_operation
+    def apply_batch_review(self, cursor, approve_ids: list, reject_ids: list, admin_id: int, reason: str,
+                           approve_notify: Callable[[dict], str] = None,
+                           reject_notify: Callable[[dict], str] = None):
+        """Применить решения пакетной проверки одной транзакцией.
+        
+        Одобрения, отклонения, уведомления в outbox и возврат в очередь
+        заданий без решения либо применяются вместе, либо не применяются.
+        Возвращает (одобренные, отклоненные) в виде {task_id: строка задания или None}.
+        """
+        approved = {task_id: self._approve_task(cursor, task_id, admin_id, approve_notify) for task_id in approve_ids}
+        rejected = {
+            task_id: self._reject_task(cursor, task_id, admin_id, reason, reject_notify) for task_id in reject_ids
+        }
+        self._release_claims(cursor, admin_id)
+        return approved, rejected
+    
+    @write_operation
+    def claim_task(self, cursor, task_id: int, admin_id: int):
+        """Закрепить задание за администратором. False, если его уже проверяет другой"""
+        now = int(time.time())
+        cursor.execute('''
+            UPDATE tasks SET claimed_by = ?, claimed_until = ?
+            WHERE task_id = ? AND status = 'pending'
+            AND (claimed_until IS NULL OR claimed_until < ? OR claimed_by = ?)
+        ''', (admin_id, now + REVIEW_LEASE_SECONDS, task_id, now, admin_id))
+        return cursor.rowcount > 0
+    
+    @write_operation
+    def claim_next_task(self, cursor, admin_id: int, after_task_id: int = None, keep_task_id: int = None):
+        """Закрепить за администратором первое свободное задание очереди (после after_task_id).
+        
+        Остальные аренды администратора, кроме keep_task_id, снимаются,
+        так что пропущенные задания сразу возвращаются в очередь.
+        Возвращает task_id или None, если свободных заданий нет.
+        """
+        now = int(time.time())
+        cursor.execute('''
+            UPDATE tasks SET claimed_by = NULL, claimed_until = NULL
+            WHERE claimed_by = ? AND task_id != ?
+        ''', (admin_id, keep_task_id or 0))
+        
+        after_clause, after_params = '', ()
+        if after_task_id:
+            after_clause = 'AND (created_at, task_id) > (SELECT created_at, task_id FROM tasks WHERE task_id = ?)'
+            after_params = (after_task_id,)
+        
+        cursor.execute(f'''
+            UPDATE tasks SET claimed_by = ?, claimed_until = ?
+            WHERE task_id = (
+                SELECT task_id FROM tasks
+                WHERE status = 'pending'
+                AND (claimed_until IS NULL OR claimed_until < ? OR claimed_by = ?)
+                AND task_id != ?
+                {after_clause}
+                ORDER BY created_at, task_id
+                LIMIT 1
+            )
+            RETURNING task_id
+        ''', (admin_id, now + REVIEW_LEASE_SECONDS, now, admin_id, keep_task_id or 0, *after_params))
+        row = cursor.fetchone()
+        return row[0] if row else None
+    
+    def _release_claims(self, cursor, admin_id: int):
+        cursor.execute(
+            'UPDATE tasks SET claimed_by = NULL, claimed_until = NULL WHERE claimed_by = ?',
+            (admin_id,)
+        )
+        return cursor.rowcount
+    
+    @write_operation
+    def release_claims(self, cursor, admin_id: int):
+        """Вернуть в очередь все задания, закрепленные за администратором"""
+        return self._release_claims(cursor, admin_id)
+    
+    @write_operation
+    def claim_task_batch(self, cursor, admin_id: int, limit: int):
+        """Закрепить за администратором до limit свободных заданий из начала очереди"""
+        now = int(time.time())
+        cursor.execute('''
+            UPDATE tasks SET claimed_by = NULL, claimed_until = NULL
+            WHERE claimed_by = ?
+        ''', (admin_id,))
+        cursor.execute('''
+            UPDATE tasks SET claimed_by = ?, claimed_until = ?
+            WHERE task_id IN (
+                SELECT task_id FROM tasks
+                WHERE status = 'pending'
+                AND (claimed_until IS NULL OR claimed_until < ?)
+                ORDER BY created_at, task_id
+                LIMIT ?
+            )
+            RETURNING task_id
+        ''', (admin_id, now + REVIEW_LEASE_SECONDS, now, limit))
+        return [row[0] for row in cursor.fetchall()]
     
     # ========== МЕТОДЫ РОЗЫГРЫШЕЙ ==========
-    def create_drawing(self, drawing_data: dict):
-        with self.get_cursor() as cursor:
-            cursor.execute('''
-                INSERT INTO drawings 
-                (name, description, prize, start_date, end_date, status, 
-                 min_participants, max_participants, entry_cost, required_badges)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                drawing_data['name'],
-                drawing_data.get('description', ''),
-                drawing_data['prize'],
-                drawing_data['start_date'],
-                drawing_data['end_date'],
-                drawing_data.get('status', 'announced'),
-                drawing_data.get('min_participants', 5),
-                drawing_data.get('max_participants', 100),
-                drawing_data.get('entry_cost', 0),
-                json.dumps(drawing_data.get('required_badges', []))
-            ))
-            return cursor.lastrowid
+    @write_operation
+    def create_drawing(self, cursor, drawing_data: dict):
+        cursor.execute('''
+            INSERT INTO drawings 
+            (name, description, prize, start_date, end_date, status, 
+             min_participants, max_participants, entry_cost, required_badges)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            drawing_data['name'],
+            drawing_data.get('description', ''),
+            drawing_data['prize'],
+            drawing_data['start_date'],
+            drawing_data['end_date'],
+            drawing_data.get('status', 'announced'),
+            drawing_data.get('min_participants', 5),
+            drawing_data.get('max_participants', 100),
+            drawing_data.get('entry_cost', 0),
+            json.dumps(drawing_data.get('required_badges', []))
+        ))
+        return cursor.lastrowid
     
     def get_drawing(self, drawing_id: int = None, drawing_name: str = None):
-        with self.get_cursor() as cursor:
+        with self.read_cursor() as cursor:
             if drawing_id:
                 cursor.execute('SELECT * FROM drawings WHERE drawing_id = ?', (drawing_id,))
             elif drawing_name:
@@ -686,14 +1647,12 @@ class Database:
             if row:
                 drawing = dict(row)
                 drawing['required_badges'] = json.loads(drawing['required_badges']) if drawing['required_badges'] else []
-                drawing['participants'] = json.loads(drawing['participants']) if drawing['participants'] else []
                 drawing['winners'] = json.loads(drawing['winners']) if drawing['winners'] else {}
-                drawing['ticket_numbers'] = json.loads(drawing['ticket_numbers']) if drawing['ticket_numbers'] else {}
                 return drawing
             return None
     
     def get_active_drawings(self):
-        with self.get_cursor() as cursor:
+        with self.read_cursor() as cursor:
             cursor.execute('''
                 SELECT * FROM drawings 
                 WHERE status = 'active' 
@@ -704,14 +1663,12 @@ class Database:
             for row in cursor.fetchall():
                 drawing = dict(row)
                 drawing['required_badges'] = json.loads(drawing['required_badges']) if drawing['required_badges'] else []
-                drawing['participants'] = json.loads(drawing['participants']) if drawing['participants'] else []
                 drawing['winners'] = json.loads(drawing['winners']) if drawing['winners'] else {}
-                drawing['ticket_numbers'] = json.loads(drawing['ticket_numbers']) if drawing['ticket_numbers'] else {}
                 drawings.append(drawing)
             return drawings
     
     def get_finished_drawings(self, limit: int = 10):
-        with self.get_cursor() as cursor:
+        with self.read_cursor() as cursor:
             cursor.execute('''
                 SELECT * FROM drawings 
                 WHERE status = 'finished'
@@ -722,88 +1679,125 @@ class Database:
             for row in cursor.fetchall():
                 drawing = dict(row)
                 drawing['required_badges'] = json.loads(drawing['required_badges']) if drawing['required_badges'] else []
-                drawing['participants'] = json.loads(drawing['participants']) if drawing['participants'] else []
                 drawing['winners'] = json.loads(drawing['winners']) if drawing['winners'] else {}
-                drawing['ticket_numbers'] = json.loads(drawing['ticket_numbers']) if drawing['ticket_numbers'] else {}
                 drawings.append(drawing)
             return drawings
     
-    def add_drawing_participant(self, drawing_id: int, user_id: int, ticket_number: int = None):
-        with self.get_cursor() as cursor:
-            # Проверяем, не участвует ли уже
+    @write_operation
+    def add_drawing_participant(self, cursor, drawing_id: int, user_id: int, ticket_number: int = None):
+        """Зарегистрировать участника и списать стоимость участия.
+        
+        Возвращает словарь с номером билета (ticket_number), числом участников
+        (participants_count, max_participants) и балансом после списания (balance)
+        или None, если розыгрыш не активен, мест нет, пользователь уже участвует
+        или ему не хватает баллов.
+        """
+        # Счетчик участников одновременно проверяет лимит, баланс и выдает номер билета
+        cursor.execute('''
+            UPDATE drawings
+            SET participants_count = participants_count + 1
+            WHERE drawing_id = ? AND status = 'active'
+            AND participants_count < max_participants
+            AND NOT EXISTS (
+                SELECT 1 FROM drawing_participations
+                WHERE drawing_id = ? AND user_id = ?
+            )
+            AND (SELECT total_points FROM users WHERE user_id = ?) >= entry_cost
+            RETURNING participants_count, max_participants, entry_cost
+        ''', (drawing_id, drawing_id, user_id, user_id))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        
+        result = dict(row)
+        entry_cost = result.pop('entry_cost')
+        result['ticket_number'] = ticket_number or result['participants_count']
+        cursor.execute('''
+            INSERT INTO drawing_participations
+            (drawing_id, user_id, ticket_number)
+            VALUES (?, ?, ?)
+        ''', (drawing_id, user_id, result['ticket_number']))
+        
+        cursor.execute(
+            'UPDATE users SET total_points = total_points - ? WHERE user_id = ? RETURNING total_points',
+            (entry_cost, user_id)
+        )
+        result['balance'] = cursor.fetchone()[0]
+        if entry_cost:
+            self._user_changed(user_id)
+        
+        return result
+    
+    def get_participant_ticket(self, drawing_id: int, user_id: int):
+        with self.read_cursor() as cursor:
             cursor.execute('''
-                SELECT * FROM drawing_participations 
+                SELECT ticket_number FROM drawing_participations
                 WHERE drawing_id = ? AND user_id = ?
             ''', (drawing_id, user_id))
-            if cursor.fetchone():
-                return False
-            
-            # Получаем текущих участников розыгрыша
-            cursor.execute('SELECT participants, ticket_numbers FROM drawings WHERE drawing_id = ?', (drawing_id,))
             row = cursor.fetchone()
-            if not row:
-                return False
-            
-            participants = json.loads(row[0]) if row[0] else []
-            ticket_numbers = json.loads(row[1]) if row[1] else {}
-            
-            # Добавляем участника
-            participants.append(user_id)
-            if ticket_number:
-                ticket_numbers[user_id] = ticket_number
-            else:
-                ticket_numbers[user_id] = len(participants)
-            
-            # Обновляем розыгрыш
+            return row[0] if row else None
+    
+    def get_drawing_participants(self, drawing_id: int):
+        with self.read_cursor() as cursor:
             cursor.execute('''
-                UPDATE drawings 
-                SET participants = ?, ticket_numbers = ?
+                SELECT user_id FROM drawing_participations
                 WHERE drawing_id = ?
-            ''', (json.dumps(participants), json.dumps(ticket_numbers), drawing_id))
-            
-            # Записываем участие
+                ORDER BY ticket_number
+            ''', (drawing_id,))
+            return [row[0] for row in cursor.fetchall()]
+    
+    @write_operation
+    def finish_drawing(self, cursor, drawing_id: int, winners: dict, notifications: list = None):
+        """Завершить розыгрыш. notifications - уведомления для outbox: (chat_id, текст, ключ дедупликации)"""
+        # Обновляем статус розыгрыша и победителей
+        cursor.execute('''
+            UPDATE drawings 
+            SET status = 'finished', winners = ?, end_date = datetime('now')
+            WHERE drawing_id = ?
+        ''', (json.dumps(winners), drawing_id))
+        
+        # Обновляем статистику победителей
+        self._user_changed(*winners.values())
+        for place, user_id in winners.items():
             cursor.execute('''
-                INSERT INTO drawing_participations 
-                (drawing_id, user_id, ticket_number)
-                VALUES (?, ?, ?)
-            ''', (drawing_id, user_id, ticket_numbers[user_id]))
+                UPDATE users 
+                SET drawings_won = drawings_won + 1,
+                    last_drawing_win = datetime('now')
+                WHERE user_id = ?
+            ''', (user_id,))
             
-            return True
-    
-    def finish_drawing(self, drawing_id: int, winners: dict):
-        with self.get_cursor() as cursor:
-            # Обновляем статус розыгрыша и победителей
+            # Обновляем запись участия
             cursor.execute('''
-                UPDATE drawings 
-                SET status = 'finished', winners = ?, end_date = datetime('now')
-                WHERE drawing_id = ?
-            ''', (json.dumps(winners), drawing_id))
-            
-            # Обновляем статистику победителей
-            for place, user_id in winners.items():
-                cursor.execute('''
-                    UPDATE users 
-                    SET drawings_won = drawings_won + 1,
-                        last_drawing_win = datetime('now')
-                    WHERE user_id = ?
-                ''', (user_id,))
-                
-                # Обновляем запись участия
-                cursor.execute('''
-                    UPDATE drawing_participations 
-                    SET won_place = ?
-                    WHERE drawing_id = ? AND user_id = ?
-                ''', (place, drawing_id, user_id))
-            
-            return True
+                UPDATE drawing_participations 
+                SET won_place = ?
+                WHERE drawing_id = ? AND user_id = ?
+            ''', (place, drawing_id, user_id))
+        
+        if notifications:
+            self._add_to_outbox(cursor, notifications)
+        
+        return True
     
     # ========== ПОИСК И СТАТИСТИКА ==========
     def search_users(self, search_term: str, limit: int = 10):
-        with self.get_cursor() as cursor:
+        with self.read_cursor() as cursor:
+            # Триграммам нужно минимум 3 символа, короткие запросы ищем перебором
+            if self.fts_enabled and len(search_term) >= 3:
+                phrase = '"' + search_term.replace('"', '""') + '"'
+                cursor.execute('''
+                    SELECT u.user_id, u.nickname, u.username, u.first_name, u.last_name, u.total_points
+                    FROM users_fts
+                    JOIN users u ON u.user_id = users_fts.rowid
+                    WHERE users_fts MATCH ?
+                    ORDER BY bm25(users_fts), u.total_points DESC
+                    LIMIT ?
+                ''', (phrase, limit))
+                return [dict(row) for row in cursor.fetchall()]
+            
             search_pattern = f"%{search_term}%"
             cursor.execute('''
                 SELECT user_id, nickname, username, first_name, last_name, total_points
-                FROM users 
+                FROM users
                 WHERE nickname LIKE ? OR username LIKE ? OR first_name LIKE ? OR last_name LIKE ?
                 ORDER BY total_points DESC
                 LIMIT ?
@@ -811,13 +1805,13 @@ class Database:
             return [dict(row) for row in cursor.fetchall()]
     
     def get_top_users(self, limit: int = 10):
-        with self.get_cursor() as cursor:
+        with self.read_cursor() as cursor:
             cursor.execute('''
                 SELECT user_id, nickname, username, custom_emoji, total_points as points,
                        drawings_won, tasks_completed
-                FROM users 
+                FROM users
                 WHERE is_banned = 0
-                ORDER BY total_points DESC
+                ORDER BY total_points DESC, user_id
                 LIMIT ?
             ''', (limit,))
             
@@ -828,8 +1822,70 @@ class Database:
                 users.append(user)
             return users
     
+    def get_leaderboard_entries(self, user_ids: list = None):
+        """Записи рейтинга: все незаблокированные или указанные пользователи (с флагом is_banned)"""
+        with self.read_cursor() as cursor:
+            query = '''
+                SELECT user_id, nickname, username, custom_emoji, total_points as points,
+                       drawings_won, tasks_completed, is_banned
+                FROM users
+            '''
+            if user_ids is None:
+                cursor.execute(query + ' WHERE is_banned = 0')
+                return [dict(row) for row in cursor.fetchall()]
+            
+            entries = []
+            for start in range(0, len(user_ids), SQL_IN_CHUNK_SIZE):
+                chunk = user_ids[start:start + SQL_IN_CHUNK_SIZE]
+                placeholders = ', '.join('?' * len(chunk))
+                cursor.execute(query + f' WHERE user_id IN ({placeholders})', tuple(chunk))
+                entries.extend(dict(row) for row in cursor.fetchall())
+            return entries
+    
+    def get_users_by_ids(self, user_ids) -> Dict[int, dict]:
+        """Короткие записи для отображения (ник, username, эмодзи) одним запросом на пачку id"""
+        user_ids = list(dict.fromkeys(user_ids))
+        users = {}
+        with self.read_cursor() as cursor:
+            for start in range(0, len(user_ids), SQL_IN_CHUNK_SIZE):
+                chunk = user_ids[start:start + SQL_IN_CHUNK_SIZE]
+                placeholders = ', '.join('?' * len(chunk))
+                cursor.execute(f'''
+                    SELECT user_id, nickname, username, custom_emoji
+                    FROM users
+                    WHERE user_id IN ({placeholders})
+                ''', tuple(chunk))
+                for row in cursor.fetchall():
+                    users[row['user_id']] = dict(row)
+        return users
+    
+    def get_user_rank(self, user_id: int):
+        """Место пользователя в рейтинге (с 1) или None для заблокированных и неизвестных.
+        
+        Тот же порядок, что у Leaderboard, но прямо из базы: COUNT по idx_users_rank
+        """
+        with self.read_cursor() as cursor:
+            cursor.execute('''
+                SELECT 1 + (
+                    SELECT COUNT(*) FROM users o
+                    WHERE o.is_banned = 0
+                    AND (o.total_points > u.total_points
+                         OR (o.total_points = u.total_points AND o.user_id < u.user_id))
+                )
+                FROM users u
+                WHERE u.user_id = ? AND u.is_banned = 0
+            ''', (user_id,))
+            row = cursor.fetchone()
+            return row[0] if row else None
+    
+    def count_ranked_users(self):
+        """Число участников рейтинга (незаблокированных), COUNT по idx_users_rank"""
+        with self.read_cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM users WHERE is_banned = 0')
+            return cursor.fetchone()[0]
+    
     def get_user_stats(self, user_id: int):
-        with self.get_cursor() as cursor:
+        with self.read_cursor() as cursor:
             cursor.execute('''
                 SELECT 
                     COUNT(*) as total_tasks,
@@ -846,7 +1902,7 @@ class Database:
             return {'total_tasks': 0, 'earned_points': 0, 'approved': 0, 'pending': 0, 'rejected': 0}
     
     def get_user_drawings_stats(self, user_id: int):
-        with self.get_cursor() as cursor:
+        with self.read_cursor() as cursor:
             cursor.execute('''
                 SELECT 
                     COUNT(*) as total_participations,
@@ -863,7 +1919,7 @@ class Database:
             return {'total_participations': 0, 'drawings_won': 0, 'winning_places': []}
     
     def get_admin_operations(self, user_id: int, limit: int = 20):
-        with self.get_cursor() as cursor:
+        with self.read_cursor() as cursor:
             cursor.execute('''
                 SELECT ao.*, u.username as admin_username
                 FROM admin_operations ao
@@ -874,7 +1930,581 @@ class Database:
             ''', (user_id, limit))
             return [dict(row) for row in cursor.fetchall()]
 
+    def get_system_stats(self):
+        """Сводка для панели администратора из system_counters (без сканирования таблиц)"""
+        with self.read_cursor() as cursor:
+            cursor.execute('''
+                SELECT name, value FROM system_counters
+                WHERE name IN ('total_users', 'pending_tasks', 'active_drawings', 'total_points')
+                OR name = 'tasks_day:' || date('now')
+            ''')
+            counters = {row['name']: row['value'] for row in cursor.fetchall()}
+            
+            return {
+                'total_users': counters.get('total_users', 0),
+                'pending_tasks': counters.get('pending_tasks', 0),
+                'active_drawings': counters.get('active_drawings', 0),
+                'total_points': counters.get('total_points', 0),
+                'today_tasks': sum(v for k, v in counters.items() if k.startswith('tasks_day:'))
+            }
+
+    def get_task_details(self, task_id: int):
+        with self.read_cursor() as cursor:
+            cursor.execute('''
+                SELECT t.*, u.nickname, u.username, u.user_id, u.total_points
+                FROM tasks t
+                JOIN users u ON t.user_id = u.user_id
+                WHERE t.task_id = ?
+            ''', (task_id,))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+
+    def get_tasks_by_ids(self, task_ids: list):
+        """Задания с никнеймами авторов в порядке очереди"""
+        task_ids = list(dict.fromkeys(task_ids))
+        tasks = []
+        with self.read_cursor() as cursor:
+            for start in range(0, len(task_ids), SQL_IN_CHUNK_SIZE):
+                chunk = task_ids[start:start + SQL_IN_CHUNK_SIZE]
+                placeholders = ', '.join('?' * len(chunk))
+                cursor.execute(f'''
+                    SELECT t.*, u.nickname, u.username
+                    FROM tasks t
+                    LEFT JOIN users u ON t.user_id = u.user_id
+                    WHERE t.task_id IN ({placeholders})
+                ''', tuple(chunk))
+                tasks.extend(dict(row) for row in cursor.fetchall())
+        # Порядок очереди восстанавливаем после объединения пачек
+        tasks.sort(key=lambda task: (task['created_at'], task['task_id']))
+        return tasks
+    
+    def get_user_task_type_stats(self, user_id: int, task_type: str):
+        with self.read_cursor() as cursor:
+            cursor.execute('''
+                SELECT COALESCE(SUM(submitted), 0) as total,
+                       COALESCE(SUM(approved), 0) as approved,
+                       COALESCE(SUM(rejected), 0) as rejected
+                FROM task_daily_stats
+                WHERE user_id = ? AND task_type = ?
+            ''', (user_id, task_type))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+    
+    def get_task_daily_totals(self, days: int = 7):
+        """Итоги по дням подачи за последние days дней (UTC), от новых к старым"""
+        with self.read_cursor() as cursor:
+            cursor.execute('''
+                SELECT day, SUM(submitted) as submitted, SUM(approved) as approved,
+                       SUM(rejected) as rejected, SUM(points) as points
+                FROM task_daily_stats
+                WHERE day >= date('now', ?)
+                GROUP BY day
+                ORDER BY day DESC
+            ''', (f'-{days - 1} days',))
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def get_task_type_totals(self, days: int = 7):
+        """Итоги по типам заданий за последние days дней (UTC)"""
+        with self.read_cursor() as cursor:
+            cursor.execute('''
+                SELECT task_type, SUM(submitted) as submitted, SUM(approved) as approved,
+                       SUM(rejected) as rejected, SUM(points) as points
+                FROM task_daily_stats
+                WHERE day >= date('now', ?)
+                GROUP BY task_type
+                ORDER BY submitted DESC
+            ''', (f'-{days - 1} days',))
+            return [dict(row) for row in cursor.fetchall()]
+
+    @write_operation
+    def add_admin_operation(self, cursor, admin_id: int, user_id: int, operation_type: str,
+                            badge_change: str = None, note: str = ""):
+        cursor.execute('''
+            INSERT INTO admin_operations
+            (admin_id, user_id, operation_type, badge_change, note)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (admin_id, user_id, operation_type, badge_change, note))
+        return cursor.lastrowid
+
+    @write_operation
+    def ban_user(self, cursor, user_id: int, admin_id: int, reason: str):
+        cursor.execute('''
+            UPDATE users
+            SET is_banned = 1, ban_reason = ?
+            WHERE user_id = ?
+        ''', (reason, user_id))
+        self._user_changed(user_id)
+
+        # Записываем операцию
+        cursor.execute('''
+            INSERT INTO admin_operations
+            (admin_id, user_id, operation_type, note)
+            VALUES (?, ?, ?, ?)
+        ''', (admin_id, user_id, "ban_user", f"Блокировка: {reason}"))
+
+        return True
+
+    # ========== МЕТОДЫ РАССЫЛОК ==========
+    @write_operation
+    def create_broadcast(self, cursor, admin_id: int, text: str):
+        """Создать рассылку всем незаблокированным участникам, которые не заблокировали бота"""
+        cursor.execute('''
+            INSERT INTO broadcasts (admin_id, text, total, updated_at)
+            SELECT ?, ?, COUNT(*), datetime('now') FROM users
+            WHERE is_banned = 0 AND bot_blocked = 0
+        ''', (admin_id, text))
+        return cursor.lastrowid
+    
+    @write_operation
+    def set_broadcast_message(self, cursor, broadcast_id: int, chat_id: int, message_id: int):
+        """Запомнить сообщение, в котором администратору показывается прогресс"""
+        cursor.execute('''
+            UPDATE broadcasts SET progress_chat_id = ?, progress_message_id = ?
+            WHERE broadcast_id = ?
+        ''', (chat_id, message_id, broadcast_id))
+    
+    def get_broadcast(self, broadcast_id: int):
+        with self.read_cursor() as cursor:
+            cursor.execute('SELECT * FROM broadcasts WHERE broadcast_id = ?', (broadcast_id,))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+    
+    def get_running_broadcasts(self):
+        with self.read_cursor() as cursor:
+            cursor.execute("SELECT * FROM broadcasts WHERE status = 'running' ORDER BY broadcast_id")
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def get_recent_broadcasts(self, limit: int = 3):
+        with self.read_cursor() as cursor:
+            cursor.execute('SELECT * FROM broadcasts ORDER BY broadcast_id DESC LIMIT ?', (limit,))
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def get_broadcast_recipients(self, after_user_id: int, limit: int):
+        """Следующая пачка получателей по возрастанию user_id (курсор, без OFFSET)"""
+        with self.read_cursor() as cursor:
+            cursor.execute('''
+                SELECT user_id FROM users
+                WHERE user_id > ? AND is_banned = 0 AND bot_blocked = 0
+                ORDER BY user_id
+                LIMIT ?
+            ''', (after_user_id, limit))
+            return [row[0] for row in cursor.fetchall()]
+    
+    @write_operation
+    def checkpoint_broadcast(self, cursor, broadcast_id: int, last_user_id: int,
+                             sent: int, failed: int, blocked: int):
+        """Сохранить прогресс после отправленной пачки. Возвращает строку рассылки"""
+        cursor.execute('''
+            UPDATE broadcasts
+            SET last_user_id = ?, sent = sent + ?, failed = failed + ?, blocked = blocked + ?,
+                updated_at = datetime('now')
+            WHERE broadcast_id = ?
+            RETURNING *
+        ''', (last_user_id, sent, failed, blocked, broadcast_id))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+    
+    @write_operation
+    def finish_broadcast(self, cursor, broadcast_id: int, status: str = 'finished'):
+        """Завершить или остановить рассылку. Возвращает строку рассылки или None, если она уже не идет"""
+        cursor.execute('''
+            UPDATE broadcasts SET status = ?, finished_at = datetime('now'), updated_at = datetime('now')
+            WHERE broadcast_id = ? AND status = 'running'
+            RETURNING *
+        ''', (status, broadcast_id))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+    
+    @write_operation
+    def mark_bot_blocked(self, cursor, user_id: int, blocked: bool = True):
+        """Отметить, что пользователь заблокировал бота (или снова им пользуется)"""
+        cursor.execute('UPDATE users SET bot_blocked = ? WHERE user_id = ?', (int(blocked), user_id))
+        self._user_changed(user_id)
+        return cursor.rowcount > 0
+    
+    def get_expired_drawings(self):
+        with self.read_cursor() as cursor:
+            cursor.execute('''
+                SELECT drawing_id, name, participants_count, min_participants, winners
+                FROM drawings
+                WHERE status = 'active'
+                AND datetime('now') > end_date
+            ''')
+            drawings = []
+            for row in cursor.fetchall():
+                drawing = dict(row)
+                drawing['winners'] = json.loads(drawing['winners']) if drawing['winners'] else {}
+                drawings.append(drawing)
+            return drawings
+
+    @write_operation
+    def cancel_drawing(self, cursor, drawing_id: int, notifications: list = None):
+        cursor.execute('''
+            UPDATE drawings
+            SET status = 'cancelled'
+            WHERE drawing_id = ?
+        ''', (drawing_id,))
+        cancelled = cursor.rowcount > 0
+        if cancelled and notifications:
+            self._add_to_outbox(cursor, notifications)
+        return cancelled
+    
+    # ========== ИСХОДЯЩИЕ УВЕДОМЛЕНИЯ (OUTBOX) ==========
+    def _add_to_outbox(self, cursor, messages: list):
+        """Записать уведомления в текущей транзакции: список (chat_id, текст, ключ дедупликации).
+        
+        Уведомление с уже существующим ключом пропускается, поэтому повтор
+        операции не отправит его второй раз.
+        """
+        cursor.executemany('''
+            INSERT INTO outbox (chat_id, text, dedup_key) VALUES (?, ?, ?)
+            ON CONFLICT(dedup_key) DO NOTHING
+        ''', messages)
+    
+    @write_operation
+    def claim_outbox(self, cursor, limit: int, lease_seconds: int = OUTBOX_LEASE_SECONDS):
+        """Взять пачку уведомлений к отправке (статус sending).
+        
+        Строки, которые висят в sending дольше lease_seconds (бот упал
+        во время отправки), берутся повторно.
+        """
+        cursor.execute('''
+            UPDATE outbox
+            SET status = 'sending', attempts = attempts + 1, locked_at = datetime('now')
+            WHERE outbox_id IN (
+                SELECT outbox_id FROM outbox
+                WHERE (status = 'pending' AND next_attempt_at <= datetime('now'))
+                   OR (status = 'sending' AND locked_at < datetime('now', ?))
+                ORDER BY outbox_id
+                LIMIT ?
+            )
+            RETURNING outbox_id, chat_id, text, attempts
+        ''', (f'-{lease_seconds} seconds', limit))
+        return sorted((dict(row) for row in cursor.fetchall()), key=lambda message: message['outbox_id'])
+    
+    @write_operation
+    def complete_outbox(self, cursor, results: list):
+        """Записать итоги отправки: список (outbox_id, результат доставки, номер попытки).
+        
+        Неудачная отправка откладывается с растущей задержкой,
+        после OUTBOX_MAX_ATTEMPTS попыток уведомление помечается failed.
+        """
+        for outbox_id, outcome, attempts in results:
+            if outcome == DELIVERY_SENT:
+                cursor.execute('''
+                    UPDATE outbox SET status = 'sent', sent_at = datetime('now'), locked_at = NULL
+                    WHERE outbox_id = ?
+                ''', (outbox_id,))
+            elif outcome == DELIVERY_FAILED and attempts < OUTBOX_MAX_ATTEMPTS:
+                cursor.execute('''
+                    UPDATE outbox SET status = 'pending', locked_at = NULL, next_attempt_at = datetime('now', ?)
+                    WHERE outbox_id = ?
+                ''', (f'+{min(3600, 30 * 2 ** attempts)} seconds', outbox_id))
+            else:
+                cursor.execute(
+                    'UPDATE outbox SET status = ?, locked_at = NULL WHERE outbox_id = ?',
+                    ('blocked' if outcome == DELIVERY_BLOCKED else 'failed', outbox_id)
+                )
+    
+    def get_outbox_stats(self):
+        """Число уведомлений outbox по статусам"""
+        with self.read_cursor() as cursor:
+            cursor.execute('SELECT status, COUNT(*) FROM outbox GROUP BY status')
+            return {row[0]: row[1] for row in cursor.fetchall()}
+    
+    @write_operation
+    def prune_outbox(self, cursor, keep_days: int = 7):
+        """Удалить обработанные уведомления старше keep_days дней"""
+        cursor.execute('''
+            DELETE FROM outbox
+            WHERE status IN ('sent', 'failed', 'blocked') AND created_at < datetime('now', ?)
+        ''', (f'-{keep_days} days',))
+        return cursor.rowcount
+
+class AsyncDatabase:
+    """Асинхронный доступ к Database.
+
+    Каждый публичный метод Database доступен как корутина с той же сигнатурой:
+    запрос выполняется в выделенном пуле потоков, поэтому медленный SQL
+    не блокирует цикл событий и остальные обновления продолжают обрабатываться.
+    """
+
+    def __init__(self, database: Database, max_workers: int = 1):
+        self._db = database
+        # Число потоков соответствует числу соединений Database
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db")
+
+    async def run(self, func, *args, **kwargs):
+        """Выполнить произвольную функцию в потоке БД"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._db, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        write_op = getattr(attr, 'write_op', None)
+        if write_op and self._db.group_commit:
+            # Записи уходят в очередь писателя, поток пула не занимается ожиданием коммита
+            async def method(*args, **kwargs):
+                return await asyncio.wrap_future(self._db.submit_write(write_op, *args, **kwargs))
+        else:
+            async def method(*args, **kwargs):
+                return await self.run(attr, *args, **kwargs)
+
+        method.__name__ = name
+        method.__doc__ = attr.__doc__
+        # Кэшируем обертку, чтобы не создавать ее при каждом вызове
+        setattr(self, name, method)
+        return method
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+class ActivityTracker:
+    """Время последней активности пользователей в памяти.
+    
+    touch() только запоминает отметку, в базу они уходят пачкой
+    раз в ACTIVITY_FLUSH_SECONDS и при остановке бота. В памяти держится
+    окно за последние 7 дней, поэтому выборки активных пользователей
+    не обращаются к базе.
+    """
+    
+    WINDOW = timedelta(days=7)
+    
+    def __init__(self):
+        self._last_seen: Dict[int, datetime] = {}
+        self._dirty: Dict[int, datetime] = {}
+    
+    def touch(self, user_id: int, when: datetime = None):
+        when = when or datetime.now()
+        self._last_seen[user_id] = when
+        self._dirty[user_id] = when
+    
+    def seed(self, activity: list):
+        """Загрузить отметки из базы, не затирая более свежие из памяти"""
+        for user_id, last_active in activity:
+            if last_active > self._last_seen.get(user_id, datetime.min):
+                self._last_seen[user_id] = last_active
+    
+    def last_seen(self, user_id: int) -> Optional[datetime]:
+        return self._last_seen.get(user_id)
+    
+    def active_users(self, period: timedelta) -> List[int]:
+        since = datetime.now() - period
+        return [user_id for user_id, seen in self._last_seen.items() if seen >= since]
+    
+    def count_active(self, period: timedelta) -> int:
+        since = datetime.now() - period
+        return sum(1 for seen in self._last_seen.values() if seen >= since)
+    
+    async def flush(self):
+        # Выкидываем отметки старше окна
+        since = datetime.now() - self.WINDOW
+        for user_id in [uid for uid, seen in self._last_seen.items() if seen < since]:
+            del self._last_seen[user_id]
+        
+        if not self._dirty:
+            return
+        
+        pending, self._dirty = self._dirty, {}
+        try:
+            await adb.touch_users(list(pending.items()))
+        except Exception as e:
+            logger.error(f"Ошибка записи активности пользователей: {e}")
+            # Возвращаем отметки, если за это время не появились более свежие
+            for user_id, when in pending.items():
+                self._dirty.setdefault(user_id, when)
+
+class Leaderboard:
+    """Рейтинг участников в памяти.
+    
+    Ключи (-баллы, user_id) лежат в SortedList: изменение баллов и место
+    пользователя стоят O(log n), топ и соседи - срез по позиции.
+    Загружается при старте бота (start). После коммита, изменившего
+    пользователей, их записи перечитывает отдельный поток, чтобы
+    писатель базы не ждал чтения.
+    """
+    
+    def __init__(self, database: Database):
+        self._db = database
+        self._lock = threading.Lock()
+        self._keys = SortedList()
+        self._entries: Dict[int, dict] = {}
+        self._stale: set = set()
+        self._stale_changed = threading.Condition()
+        self._sync_thread: Optional[threading.Thread] = None
+    
+    def start(self):
+        """Подписаться на изменения пользователей, загрузить рейтинг и запустить поток обновления"""
+        if self._sync_thread:
+            return
+        # Подписка до загрузки: изменения, попавшие между ними, будут перечитаны повторно, а не потеряны
+        self._db.add_user_listener(self.sync)
+        self.load()
+        self._sync_thread = threading.Thread(target=self._sync_loop, name="leaderboard-sync", daemon=True)
+        self._sync_thread.start()
+    
+    @staticmethod
+    def _key(entry: dict) -> Tuple[int, int]:
+        return (-entry['points'], entry['user_id'])
+    
+    def load(self):
+        # Читаем под блокировкой, чтобы параллельное обновление не применилось к устаревшему снимку
+        with self._lock:
+            entries = self._db.get_leaderboard_entries()
+            self._entries = {entry['user_id']: entry for entry in entries}
+            self._keys = SortedList(self._key(entry) for entry in entries)
+        logger.info(f"Рейтинг загружен: {len(entries)} участников")
+    
+    def sync(self, user_ids):
+        """Отметить записи пользователей устаревшими (вызывается писателем после коммита)"""
+        with self._stale_changed:
+            self._stale.update(user_ids)
+            self._stale_changed.notify()
+    
+    def _sync_loop(self):
+        while True:
+            with self._stale_changed:
+                while not self._stale:
+                    self._stale_changed.wait()
+                user_ids, self._stale = self._stale, set()
+            try:
+                self._refresh(user_ids)
+            except Exception as e:
+                logger.error(f"Ошибка обновления рейтинга: {e}")
+    
+    def _refresh(self, user_ids):
+        # Перечитывает один поток и под блокировкой: более старое чтение
+        # не может примениться поверх более нового
+        with self._lock:
+            entries = self._db.get_leaderboard_entries(list(user_ids))
+            for entry in entries:
+                self._remove(entry['user_id'])
+                if not entry['is_banned']:
+                    self._entries[entry['user_id']] = entry
+                    self._keys.add(self._key(entry))
+    
+    def _remove(self, user_id: int):
+        old = self._entries.pop(user_id, None)
+        if old:
+            self._keys.remove(self._key(old))
+    
+    def __len__(self):
+        return len(self._keys)
+    
+    def top(self, limit: int = 10) -> List[dict]:
+        with self._lock:
+            return [dict(self._entries[user_id]) for _, user_id in self._keys[:limit]]
+    
+    def rank(self, user_id: int) -> Optional[int]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if not entry:
+                return None
+            return self._keys.bisect_left(self._key(entry)) + 1
+    
+    def around(self, user_id: int, radius: int = 2) -> List[Tuple[int, dict]]:
+        """Соседи пользователя по рейтингу: пары (место, запись)"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if not entry:
+                return []
+            index = self._keys.bisect_left(self._key(entry))
+            start = max(0, index - radius)
+            return [
+                (start + i + 1, dict(self._entries[uid]))
+                for i, (_, uid) in enumerate(self._keys[start:index + radius + 1])
+            ]
+
+class UserLaneUpdateProcessor(BaseUpdateProcessor):
+    """Обработка обновлений с очередью на каждого пользователя.
+    
+    Обновления одного пользователя выполняются строго по одному и в порядке
+    поступления, поэтому двойное нажатие не запускает два обработчика
+    параллельно. Разные пользователи обрабатываются одновременно, но не более
+    max_concurrent_updates сразу. Ожидание в очереди пользователя не занимает
+    слот выполнения; общее число принятых обновлений ограничивает max_pending_updates.
+    """
+    
+    def __init__(self, max_concurrent_updates: int = UPDATE_CONCURRENCY,
+                 max_pending_updates: int = UPDATE_MAX_PENDING):
+        super().__init__(max(max_pending_updates, max_concurrent_updates))
+        self._running = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._lanes: Dict[int, asyncio.Lock] = {}
+        self._depths: Dict[int, int] = {}
+        self.in_progress = 0
+        self.peak_depth = 0
+        self.queued_total = 0
+    
+    @staticmethod
+    def _lane_key(update: object) -> Optional[int]:
+        if isinstance(update, Update):
+            if update.effective_user:
+                return update.effective_user.id
+            if update.effective_chat:
+                return update.effective_chat.id
+        return None
+    
+    async def do_process_update(self, update: object, coroutine) -> None:
+        key = self._lane_key(update)
+        if key is None:
+            await self._run(coroutine)
+            return
+        
+        lock = self._lanes.get(key)
+        if lock is None:
+            lock = self._lanes[key] = asyncio.Lock()
+        depth = self._depths[key] = self._depths.get(key, 0) + 1
+        if depth > 1:
+            self.queued_total += 1
+        self.peak_depth = max(self.peak_depth, depth)
+        if depth == UPDATE_LANE_WARN_DEPTH:
+            logger.warning(f"Очередь обновлений пользователя {key} достигла {depth}")
+        
+        try:
+            async with lock:
+                await self._run(coroutine)
+        finally:
+            self._depths[key] -= 1
+            if not self._depths[key]:
+                del self._depths[key]
+                del self._lanes[key]
+    
+    async def _run(self, coroutine) -> None:
+        async with self._running:
+            self.in_progress += 1
+            try:
+                await coroutine
+            finally:
+                self.in_progress -= 1
+    
+    def hot_lanes(self, limit: int = 5) -> List[Tuple[int, int]]:
+        """Пользователи с самыми длинными очередями: пары (user_id, глубина)"""
+        lanes = [(user_id, depth) for user_id, depth in self._depths.items() if depth > 1]
+        return sorted(lanes, key=lambda lane: lane[1], reverse=True)[:limit]
+    
+    def stats(self) -> dict:
+        return {
+            'in_progress': self.in_progress,
+            'lanes': len(self._depths),
+            'pending': sum(self._depths.values()),
+            'peak_depth': self.peak_depth,
+            'queued_total': self.queued_total,
+        }
+    
+    async def initialize(self) -> None:
+        pass
+    
+    async def shutdown(self) -> None:
+        pass
+
 db = Database()
+adb = AsyncDatabase(db, max_workers=db.max_concurrency)
+activity = ActivityTracker()
+leaderboard = Leaderboard(db)
+update_processor = UserLaneUpdateProcessor()
 
 # ========== СОСТОЯНИЯ ДЛЯ ConversationHandler ==========
 (
@@ -1152,74 +2782,641 @@ def validate_nickname(nickname: str) -> Tuple[bool, str]:
     if not re.match(r'^[a-zA-Zа-яА-Я0-9 _\-]+$', nickname):
         return False, "❌ Никнейм может содержать только буквы, цифры, пробелы, дефисы и подчеркивания"
     
-    # Проверка на запрещенные слова
-    forbidden = ["admin", "админ", "moderator", "модератор", "система", "system"]
-    if any(word in nickname.lower() for word in forbidden):
-        return False, "❌ Никнейм содержит запрещенные слова"
+    # Проверка на запрещенные слова
+    forbidden = ["admin", "админ", "moderator", "модератор", "система", "system"]
+    if any(word in nickname.lower() for word in forbidden):
+        return False, "❌ Никнейм содержит запрещенные слова"
+    
+    return True, "✅ Никнейм прошел проверку"
+
+async def ensure_user_exists(user_id: int, username: str = None, 
+                           first_name: str = None, last_name: str = None) -> dict:
+    """Обеспечивает существование пользователя в базе"""
+    user = await adb.get_user(user_id)
+    
+    if not user:
+        user_data = {
+            'user_id': user_id,
+            'username': username,
+            'first_name': first_name,
+            'last_name': last_name,
+            'nickname': username or first_name or f"User_{user_id}",
+            'join_date': datetime.now(),
+            'last_active': datetime.now(),
+            'settings': {
+                'notifications': True,
+                'privacy': False,
+                'daily_reminder': True,
+                'language': 'ru',
+                'drawing_notifications': True
+            }
+        }
+        await adb.save_user(user_data)
+        user = await adb.get_user(user_id)
+    elif user.get('bot_blocked'):
+        # Пользователь снова пишет боту - возвращаем его в рассылки
+        await adb.mark_bot_blocked(user_id, False)
+        user['bot_blocked'] = 0
+    
+    # Время последней активности копится в памяти и пишется пачкой
+    activity.touch(user_id)
+    
+    return user
+
+class TokenBucket:
+    """Ограничитель частоты: rate токенов в секунду, не больше capacity подряд"""
+    
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+    
+    def pause(self, seconds: float):
+        """Не выдавать токены seconds секунд (после RetryAfter от Telegram)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+    
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+class NotificationDispatcher:
+    """Очередь исходящих уведомлений.
+    
+    Несколько отправителей разбирают очередь с приоритетами: сначала
+    NOTIFY_PRIORITY_HIGH, затем массовые рассылки. Общая частота ограничена
+    токенами, в один чат - не чаще раза в NOTIFY_CHAT_INTERVAL секунд.
+    RetryAfter приостанавливает все отправки на указанное время, сетевые ошибки
+    повторяются с растущей задержкой, остальные ошибки Telegram не повторяются.
+    Попыток не больше NOTIFY_MAX_ATTEMPTS, отложенные повторы stop() тоже дожидается.
+    Пользователи, заблокировавшие бота, отмечаются в базе и выпадают из рассылок.
+    """
+    
+    def __init__(self, workers: int = NOTIFY_WORKERS, rate: float = NOTIFY_RATE,
+                 chat_interval: float = NOTIFY_CHAT_INTERVAL):
+        self.workers = workers
+        self.rate = rate
+        self.chat_interval = chat_interval
+        self._bot = None
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._bucket: Optional[TokenBucket] = None
+        self._tasks: List[asyncio.Task] = []
+        self._chat_ready: Dict[int, float] = {}
+        # Отложенные повторы вне очереди: seq -> (таймер, сообщение)
+        self._retries: Dict[int, Tuple[asyncio.TimerHandle, tuple]] = {}
+        self._seq = 0
+        self.sent = 0
+        self.failed = 0
+        self.blocked = 0
+        self.retried = 0
+    
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+    
+    def start(self, bot):
+        if self.running:
+            return
+        self._bot = bot
+        self._queue = asyncio.PriorityQueue()
+        self._bucket = TokenBucket(self.rate)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+    
+    async def stop(self, timeout: float = 10):
+        """Дождаться отправки очереди и повторов (не дольше timeout секунд) и остановить отправителей.
+        
+        Сообщения, которые не успели уйти, завершаются с DELIVERY_FAILED,
+        чтобы ожидающие их future не зависли.
+        """
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self._drain(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Не отправлено уведомлений при остановке: {self._queue.qsize() + len(self._retries)}")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        
+        for handle, item in self._retries.values():
+            handle.cancel()
+            self._finish(item[-1], DELIVERY_FAILED)
+        self._retries.clear()
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            self._queue.task_done()
+            self._finish(item[-1], DELIVERY_FAILED)
+    
+    def submit(self, bot, chat_id: int, text: str, priority: int = NOTIFY_PRIORITY_BULK, **kwargs) -> asyncio.Future:
+        """Поставить сообщение в очередь. Future получит DELIVERY_SENT, DELIVERY_FAILED или DELIVERY_BLOCKED"""
+        self.start(bot)
+        future = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        self._queue.put_nowait((priority, self._seq, chat_id, text, kwargs, 1, future))
+        return future
+    
+    def stats(self) -> dict:
+        return {
+            'queued': (self._queue.qsize() if self._queue else 0) + len(self._retries),
+            'sent': self.sent,
+            'failed': self.failed,
+            'blocked': self.blocked,
+            'retried': self.retried,
+        }
+    
+    async def _worker(self):
+        while True:
+            item = await self._queue.get()
+            try:
+                await self._deliver(item)
+            except asyncio.CancelledError:
+                # Остановка во время отправки
+                self._finish(item[-1], DELIVERY_FAILED)
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка отправителя уведомлений: {e}")
+            finally:
+                self._queue.task_done()
+    
+    async def _wait_for_chat(self, chat_id: int):
+        # Бронируем следующий слот чата заранее, чтобы параллельные отправители не заняли тот же
+        now = time.monotonic()
+        ready = max(self._chat_ready.get(chat_id, 0.0), now)
+        self._chat_ready[chat_id] = ready + self.chat_interval
+        if len(self._chat_ready) > 10000:
+            self._chat_ready = {cid: t for cid, t in self._chat_ready.items() if t > now}
+        if ready > now:
+            await asyncio.sleep(ready - now)
+    
+    async def _drain(self):
+        while True:
+            await self._queue.join()
+            if not self._retries:
+                return
+            # Отложенные повторы возвращаем в очередь сразу, не дожидаясь таймеров
+            for seq in list(self._retries):
+                self._retries[seq][0].cancel()
+                self._requeue(seq)
+    
+    def _retry(self, item: tuple, delay: float):
+        priority, seq, chat_id, text, kwargs, attempt, future = item
+        self.retried += 1
+        retry_item = (priority, seq, chat_id, text, kwargs, attempt + 1, future)
+        handle = asyncio.get_running_loop().call_later(delay, self._requeue, seq)
+        self._retries[seq] = (handle, retry_item)
+    
+    def _requeue(self, seq: int):
+        entry = self._retries.pop(seq, None)
+        if entry:
+            self._queue.put_nowait(entry[1])
+    
+    def _finish(self, future: asyncio.Future, outcome: str):
+        if outcome == DELIVERY_SENT:
+            self.sent += 1
+        elif outcome == DELIVERY_BLOCKED:
+            self.blocked += 1
+        else:
+            self.failed += 1
+        if not future.done():
+            future.set_result(outcome)
+    
+    async def _deliver(self, item: tuple):
+        priority, seq, chat_id, text, kwargs, attempt, future = item
+        # Отправитель больше не ждет сообщение (например, рассылку остановили)
+        if future.cancelled():
+            return
+        await self._wait_for_chat(chat_id)
+        await self._bucket.acquire()
+        if future.cancelled():
+            return
+        kwargs.setdefault('disable_web_page_preview', True)
+        
+        try:
+            await self._bot.send_message(chat_id=chat_id, text=text, **kwargs)
+        except RetryAfter as e:
+            logger.warning(f"Telegram просит подождать {e.retry_after} с, отправка уведомлений приостановлена")
+            self._bucket.pause(e.retry_after)
+            if attempt >= NOTIFY_MAX_ATTEMPTS:
+                logger.error(f"Не удалось отправить уведомление пользователю {chat_id} за {attempt} попыток: {e}")
+                self._finish(future, DELIVERY_FAILED)
+            else:
+                self._retry(item, e.retry_after)
+        except BadRequest as e:
+            logger.error(f"Ошибка отправки уведомления пользователю {chat_id}: {e}")
+            self._finish(future, DELIVERY_FAILED)
+        except NetworkError as e:
+            if attempt >= NOTIFY_MAX_ATTEMPTS:
+                logger.error(f"Не удалось отправить уведомление пользователю {chat_id} за {attempt} попыток: {e}")
+                self._finish(future, DELIVERY_FAILED)
+            else:
+                self._retry(item, min(60, 2 ** attempt))
+        except Forbidden as e:
+            logger.info(f"Пользователь {chat_id} недоступен для бота: {e}")
+            self._finish(future, DELIVERY_BLOCKED)
+            try:
+                await adb.mark_bot_blocked(chat_id)
+            except Exception as db_error:
+                logger.error(f"Не удалось отметить блокировку бота пользователем {chat_id}: {db_error}")
+        except TelegramError as e:
+            logger.error(f"Ошибка отправки уведомления пользователю {chat_id}: {e}")
+            self._finish(future, DELIVERY_FAILED)
+        else:
+            self._finish(future, DELIVERY_SENT)
+
+notifier = NotificationDispatcher()
+
+async def send_notification(bot, user_id: int, message: str, parse_mode: str = ParseMode.HTML,
+                            priority: int = NOTIFY_PRIORITY_BULK) -> bool:
+    """Отправить уведомление пользователю через очередь notifier и дождаться доставки"""
+    outcome = await notifier.submit(bot, user_id, message, priority=priority, parse_mode=parse_mode)
+    return outcome == DELIVERY_SENT
+
+class OutboxWorker:
+    """Отправка уведомлений из таблицы outbox.
+    
+    Уведомления записываются в outbox той же транзакцией, что и изменение,
+    о котором они сообщают, поэтому обработчик администратора не ждет
+    Telegram, а уведомления переживают перезапуск бота. Воркер забирает
+    их пачками, отправляет через notifier и записывает результат.
+    Доставка не менее одного раза: пачка, отправлявшаяся в момент
+    падения, после OUTBOX_LEASE_SECONDS уйдет повторно.
+    """
     
-    return True, "✅ Никнейм прошел проверку"
-
-async def ensure_user_exists(user_id: int, username: str = None, 
-                           first_name: str = None, last_name: str = None) -> dict:
-    """Обеспечивает существование пользователя в базе"""
-    user = db.get_user(user_id)
+    def __init__(self, batch_size: int = OUTBOX_BATCH_SIZE, poll_seconds: float = OUTBOX_POLL_SECONDS):
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self._bot = None
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
     
-    if not user:
-        user_data = {
-            'user_id': user_id,
-            'username': username,
-            'first_name': first_name,
-            'last_name': last_name,
-            'nickname': username or first_name or f"User_{user_id}",
-            'join_date': datetime.now(),
-            'last_active': datetime.now(),
-            'settings': json.dumps({
-                'notifications': True,
-                'privacy': False,
-                'daily_reminder': True,
-                'language': 'ru',
-                'drawing_notifications': True
-            })
-        }
-        db.save_user(user_data)
-        user = db.get_user(user_id)
+    def start(self, bot):
+        if self._task:
+            return
+        self._bot = bot
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
     
-    # Обновляем время последней активности
-    db.save_user({
-        'user_id': user_id,
-        'last_active': datetime.now()
-    })
+    def wake(self):
+        """Проверить outbox сейчас, не дожидаясь следующего опроса"""
+        if self._wake:
+            self._wake.set()
     
-    return user
+    async def stop(self):
+        if not self._task:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+    
+    async def _run(self):
+        while True:
+            try:
+                messages = await adb.claim_outbox(self.batch_size)
+                if messages:
+                    await self._send(messages)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка отправки уведомлений из outbox: {e}")
+                messages = []
+            if len(messages) == self.batch_size:
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+    
+    async def _send(self, messages: list):
+        futures = [
+            notifier.submit(self._bot, message['chat_id'], message['text'],
+                            priority=NOTIFY_PRIORITY_HIGH, parse_mode=ParseMode.HTML)
+            for message in messages
+        ]
+        outcomes = await asyncio.gather(*futures)
+        await adb.complete_outbox([
+            (message['outbox_id'], outcome, message['attempts'])
+            for message, outcome in zip(messages, outcomes)
+        ])
 
-async def send_notification(bot, user_id: int, message: str, parse_mode: str = ParseMode.HTML) -> bool:
-    """Отправка уведомления пользователю"""
-    try:
-        await bot.send_message(
-            chat_id=user_id,
-            text=message,
-            parse_mode=parse_mode,
-            disable_web_page_preview=True
-        )
-        return True
-    except Exception as e:
-        logger.error(f"Ошибка отправки уведомления пользователю {user_id}: {e}")
-        return False
+outbox = OutboxWorker()
 
 async def notify_admins(bot, message: str, exclude_id: int = None, parse_mode: str = ParseMode.HTML):
     """Уведомление всех администраторов"""
     for admin_id in ADMIN_IDS:
         if admin_id != exclude_id:
-            try:
-                await bot.send_message(
-                    chat_id=admin_id,
-                    text=message,
-                    parse_mode=parse_mode,
-                    disable_web_page_preview=True
+            notifier.submit(bot, admin_id, message, priority=NOTIFY_PRIORITY_HIGH, parse_mode=parse_mode)
+
+class AdminTaskDigest:
+    """Сводка новых заданий для администраторов.
+    
+    Новые задания копятся отдельно для каждого администратора и уходят
+    одним сообщением с числом заданий по типам: через window секунд после
+    первого задания в сводке или сразу, когда их набралось max_tasks.
+    """
+    
+    def __init__(self, window: float = ADMIN_DIGEST_WINDOW, max_tasks: int = ADMIN_DIGEST_MAX_TASKS):
+        self.window = window
+        self.max_tasks = max_tasks
+        self._pending: Dict[int, Dict[str, int]] = {}
+        self._timers: Dict[int, asyncio.TimerHandle] = {}
+        self._bot = None
+        self.digests_sent = 0
+        self.tasks_coalesced = 0
+    
+    def add(self, bot, task_type: str, exclude_id: int = None):
+        """Учесть новое задание в сводках всех администраторов, кроме exclude_id"""
+        self._bot = bot
+        for admin_id in ADMIN_IDS:
+            if admin_id == exclude_id:
+                continue
+            counts = self._pending.setdefault(admin_id, {})
+            counts[task_type] = counts.get(task_type, 0) + 1
+            self.tasks_coalesced += 1
+            if sum(counts.values()) >= self.max_tasks:
+                self._flush(bot, admin_id)
+            elif admin_id not in self._timers:
+                self._timers[admin_id] = asyncio.get_running_loop().call_later(
+                    self.window, self._flush, bot, admin_id
                 )
-                await asyncio.sleep(0.1)  # Задержка чтобы не превысить лимиты
-            except Exception as e:
-                logger.error(f"Ошибка уведомления администратора {admin_id}: {e}")
+    
+    def flush_all(self):
+        """Отправить все накопленные сводки (при остановке бота)"""
+        for admin_id in list(self._pending):
+            self._flush(self._bot, admin_id)
+    
+    def _flush(self, bot, admin_id: int):
+        timer = self._timers.pop(admin_id, None)
+        if timer:
+            timer.cancel()
+        counts = self._pending.pop(admin_id, None)
+        if not counts:
+            return
+        
+        total = sum(counts.values())
+        text = f"""
+📋 <b>НОВЫЕ ЗАДАНИЯ НА ПРОВЕРКУ: {format_number(total)}</b>
+"""
+        for task_type, count in sorted(counts.items(), key=lambda item: item[1], reverse=True):
+            task_info = TASK_TYPES.get(task_type, {'emoji': '📋', 'name': task_type})
+            text += f"\n{task_info['emoji']} {task_info['name']}: <code>{count}</code>"
+        
+        notifier.submit(
+            bot, admin_id, text,
+            priority=NOTIFY_PRIORITY_HIGH,
+            parse_mode=ParseMode.HTML,
+            reply_markup=InlineKeyboardMarkup([[
+                InlineKeyboardButton("🔍 Проверить сейчас", callback_data="admin_refresh_tasks")
+            ]])
+        )
+        self.digests_sent += 1
+
+admin_digest = AdminTaskDigest()
+
+class ErrorAggregator:
+    """Группировка ошибок обработчиков.
+    
+    Ошибки объединяются по отпечатку: тип исключения и последний кадр
+    трассировки. Для отпечатка хранятся счетчики, время первого и
+    последнего появления и несколько последних примеров. Оповещение
+    по одному отпечатку отправляется не чаще раза в alert_interval секунд.
+    """
+    
+    def __init__(self, alert_interval: float = ERROR_ALERT_INTERVAL, samples: int = ERROR_SAMPLES,
+                 max_fingerprints: int = ERROR_MAX_FINGERPRINTS):
+        self.alert_interval = alert_interval
+        self.samples = samples
+        self.max_fingerprints = max_fingerprints
+        self._entries: Dict[str, dict] = {}
+    
+    @staticmethod
+    def fingerprint(error: BaseException) -> Tuple[str, str, str]:
+        """(отпечаток, тип исключения, место в коде)"""
+        error_type = type(error).__name__
+        frames = traceback.extract_tb(error.__traceback__)
+        # Ошибки из библиотек (Telegram, sqlite) группируем по месту вызова в коде бота
+        own_frames = [frame for frame in frames if frame.filename == __file__]
+        if frames:
+            frame = (own_frames or frames)[-1]
+            location = f"{os.path.basename(frame.filename)}:{frame.lineno} {frame.name}"
+        else:
+            location = '?'
+        digest = hashlib.sha1(f"{error_type}|{location}".encode()).hexdigest()[:8]
+        return digest, error_type, location
+    
+    @staticmethod
+    def describe_update(update: object) -> str:
+        """Короткое описание обновления для примера ошибки (без полного дампа)"""
+        if not isinstance(update, Update):
+            return str(update)[:200] if update else 'нет обновления'
+        parts = []
+        if update.effective_user:
+            parts.append(f"user {update.effective_user.id}")
+        if update.callback_query:
+            parts.append(f"callback {update.callback_query.data}")
+        elif update.effective_message and update.effective_message.text:
+            parts.append(f"text {update.effective_message.text[:100]!r}")
+        return ', '.join(parts) or f"update {update.update_id}"
+    
+    def record(self, error: BaseException, update: object = None) -> Tuple[dict, bool]:
+        """Учесть ошибку. Возвращает (запись отпечатка, нужно ли оповестить администраторов)"""
+        key, error_type, location = self.fingerprint(error)
+        now = datetime.now()
+        entry = self._entries.get(key)
+        if entry is None:
+            if len(self._entries) >= self.max_fingerprints:
+                oldest = min(self._entries, key=lambda k: self._entries[k]['last_seen'])
+                del self._entries[oldest]
+            entry = self._entries[key] = {
+                'fingerprint': key,
+                'type': error_type,
+                'location': location,
+                'count': 0,
+                'since_alert': 0,
+                'since_summary': 0,
+                'first_seen': now,
+                'last_seen': now,
+                'last_alert': None,
+                'samples': deque(maxlen=self.samples),
+            }
+        entry['count'] += 1
+        entry['since_alert'] += 1
+        entry['since_summary'] += 1
+        entry['last_seen'] = now
+        entry['samples'].append({
+            'time': now,
+            'message': str(error)[:300],
+            'update': self.describe_update(update),
+        })
+        
+        alert = (entry['last_alert'] is None
+                 or (now - entry['last_alert']).total_seconds() >= self.alert_interval)
+        if alert:
+            entry['last_alert'] = now
+        return entry, alert
+    
+    def alert_sent(self, entry: dict):
+        entry['since_alert'] = 0
+    
+    def get(self, fingerprint: str) -> Optional[dict]:
+        return self._entries.get(fingerprint)
+    
+    def top(self, limit: int = 10) -> List[dict]:
+        """Отпечатки с наибольшим числом ошибок"""
+        return sorted(self._entries.values(), key=lambda entry: entry['count'], reverse=True)[:limit]
+    
+    def take_summary(self, limit: int = 10) -> Tuple[int, List[Tuple[dict, int]]]:
+        """Ошибки с прошлой сводки: (всего, [(запись, сколько раз), ...]). Счетчики сводки обнуляются"""
+        entries = [(entry, entry['since_summary']) for entry in self._entries.values() if entry['since_summary']]
+        entries.sort(key=lambda item: item[1], reverse=True)
+        total = sum(count for _, count in entries)
+        for entry, _ in entries:
+            entry['since_summary'] = 0
+        return total, entries[:limit]
+
+error_aggregator = ErrorAggregator()
+
+def format_broadcast_progress(broadcast: dict, rate: float = None) -> str:
+    """Текст сообщения с прогрессом рассылки"""
+    done = broadcast['sent'] + broadcast['failed'] + broadcast['blocked']
+    total = max(broadcast['total'], done)
+    percent = done * 100 // total if total else 100
+    status = {
+        'running': '⏳ Идет отправка',
+        'finished': '✅ Завершена',
+        'cancelled': '⛔ Остановлена',
+    }.get(broadcast['status'], broadcast['status'])
+    
+    text = f"""
+📢 <b>РАССЫЛКА #{broadcast['broadcast_id']}</b>
+══════════════════════════════
+
+{status}
+📊 Прогресс: <code>{format_number(done)}</code> из <code>{format_number(total)}</code> ({percent}%)
+✅ Доставлено: <code>{format_number(broadcast['sent'])}</code>
+🚫 Заблокировали бота: <code>{format_number(broadcast['blocked'])}</code>
+❌ Ошибок: <code>{format_number(broadcast['failed'])}</code>
+"""
+    if rate is not None and broadcast['status'] == 'running':
+        text += f"⚡ Скорость: <code>{rate:.1f}</code> сообщ./сек"
+        if rate > 0 and total > done:
+            text += f"\n⏰ Осталось примерно: {format_timedelta(timedelta(seconds=(total - done) / rate))}"
+    return text
+
+class BroadcastEngine:
+    """Массовые рассылки.
+    
+    Получатели читаются из users пачками по курсору user_id, после каждой
+    пачки прогресс сохраняется в broadcasts. После перезапуска рассылки со
+    статусом running продолжаются с сохраненного курсора (пачка, которая
+    отправлялась в момент остановки, может прийти повторно).
+    Сообщения идут через notifier с низким приоритетом.
+    """
+    
+    def __init__(self):
+        self._tasks: Dict[int, asyncio.Task] = {}
+    
+    def start(self, bot, broadcast_id: int):
+        if broadcast_id in self._tasks:
+            return
+        task = asyncio.create_task(self._run(bot, broadcast_id))
+        self._tasks[broadcast_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(broadcast_id, None))
+    
+    async def resume(self, bot):
+        """Продолжить рассылки, прерванные остановкой бота"""
+        for broadcast in await adb.get_running_broadcasts():
+            logger.info(f"Продолжение рассылки #{broadcast['broadcast_id']} после user_id {broadcast['last_user_id']}")
+            self.start(bot, broadcast['broadcast_id'])
+    
+    async def cancel(self, broadcast_id: int) -> Optional[dict]:
+        broadcast = await adb.finish_broadcast(broadcast_id, 'cancelled')
+        task = self._tasks.get(broadcast_id)
+        if task:
+            task.cancel()
+        return broadcast
+    
+    async def stop(self):
+        """Остановить отправку при выключении бота, рассылки останутся в статусе running"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    async def _run(self, bot, broadcast_id: int):
+        broadcast = await adb.get_broadcast(broadcast_id)
+        if not broadcast or broadcast['status'] != 'running':
+            return
+        
+        started = time.monotonic()
+        delivered = 0
+        last_progress = 0.0
+        try:
+            while True:
+                recipients = await adb.get_broadcast_recipients(broadcast['last_user_id'], BROADCAST_BATCH_SIZE)
+                if not recipients:
+                    broadcast = await adb.finish_broadcast(broadcast_id) or broadcast
+                    break
+                
+                futures = [
+                    notifier.submit(bot, user_id, broadcast['text'], parse_mode=ParseMode.HTML)
+                    for user_id in recipients
+                ]
+                outcomes = await asyncio.gather(*futures)
+                broadcast = await adb.checkpoint_broadcast(
+                    broadcast_id, recipients[-1],
+                    sent=outcomes.count(DELIVERY_SENT),
+                    failed=outcomes.count(DELIVERY_FAILED),
+                    blocked=outcomes.count(DELIVERY_BLOCKED)
+                )
+                delivered += len(outcomes)
+                
+                if time.monotonic() - last_progress >= BROADCAST_PROGRESS_SECONDS:
+                    last_progress = time.monotonic()
+                    await self._show_progress(bot, broadcast, delivered / (last_progress - started))
+        except asyncio.CancelledError:
+            broadcast = await adb.get_broadcast(broadcast_id) or broadcast
+            if broadcast['status'] == 'running':
+                # Бот останавливается: рассылка продолжится после запуска
+                raise
+        
+        await self._show_progress(bot, broadcast)
+        if broadcast['status'] == 'finished':
+            logger.info(f"Рассылка #{broadcast_id} завершена: доставлено {broadcast['sent']}")
+    
+    async def _show_progress(self, bot, broadcast: dict, rate: float = None):
+        if not broadcast.get('progress_message_id'):
+            return
+        reply_markup = None
+        if broadcast['status'] == 'running':
+            reply_markup = InlineKeyboardMarkup([[
+                InlineKeyboardButton("⛔ Остановить", callback_data=f"admin_broadcast_stop_{broadcast['broadcast_id']}")
+            ]])
+        try:
+            await bot.edit_message_text(
+                chat_id=broadcast['progress_chat_id'],
+                message_id=broadcast['progress_message_id'],
+                text=format_broadcast_progress(broadcast, rate),
+                parse_mode=ParseMode.HTML,
+                reply_markup=reply_markup
+            )
+        except TelegramError as e:
+            logger.debug(f"Не удалось обновить прогресс рассылки #{broadcast['broadcast_id']}: {e}")
+
+broadcaster = BroadcastEngine()
 
 # ========== ОСНОВНЫЕ КОМАНДЫ ==========
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1254,11 +3451,11 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         admin_features = ""
     
     # Получаем информацию о пользователе
-    user_data = db.get_user(user.id)
+    user_data = await adb.get_user(user.id)
     nickname = user_data.get('nickname', user.first_name)
     
     # Проверяем активные розыгрыши
-    active_drawings = db.get_active_drawings()
+    active_drawings = await adb.get_active_drawings()
     drawings_text = ""
     if active_drawings:
         drawings_text = "\n\n<b>🎰 АКТИВНЫЕ РОЗЫГРЫШИ:</b>\n"
@@ -1377,22 +3574,18 @@ async def show_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     
     # Получаем данные пользователя
-    user = db.get_user(user_id)
+    user = await adb.get_user(user_id)
     if not user:
         await update.message.reply_text("❌ Пользователь не найден!")
         return
+    daily = await adb.get_daily_counters(user_id)
     
     # Получаем статистику
-    stats = db.get_user_stats(user_id)
-    drawings_stats = db.get_user_drawings_stats(user_id)
+    stats = await adb.get_user_stats(user_id)
+    drawings_stats = await adb.get_user_drawings_stats(user_id)
     
     # Рассчитываем позицию в топе
-    top_users = db.get_top_users(1000)
-    position = 1
-    for top_user in top_users:
-        if top_user['user_id'] == user_id:
-            break
-        position += 1
+    position = leaderboard.rank(user_id) or '—'
     
     # Форматируем никнейм
     display_name = f"{user.get('custom_emoji', '')} {user['nickname']}".strip()
@@ -1433,9 +3626,9 @@ async def show_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
 🎖️ Места: {', '.join(drawings_stats['winning_places']) if drawings_stats['winning_places'] else 'нет'}
 
 <b>📅 СЕГОДНЯ</b>
-🎯 Отправлено заданий: {user.get('daily_tasks_count', 0)}
-📋 Можно отправить еще: {10 - user.get('daily_tasks_count', 0)}
-👨‍👩‍👧‍👦 Сем. контрактов: {user.get('daily_family_contracts', 0)}/10
+🎯 Отправлено заданий: {daily.get(DAILY_TOTAL_KEY, 0)}
+📋 Можно отправить еще: {max(0, DAILY_TASK_LIMIT - daily.get(DAILY_TOTAL_KEY, 0))}
+👨‍👩‍👧‍👦 Сем. контрактов: {daily.get('family_contracts', 0)}/{TASK_TYPES['family_contracts']['max_per_day']}
     """
     
     # Добавляем значки если есть
@@ -1479,7 +3672,7 @@ async def show_my_wins(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     
     # Получаем все розыгрыши
-    finished_drawings = db.get_finished_drawings(limit=50)
+    finished_drawings = await adb.get_finished_drawings(limit=50)
     
     # Находим розыгрыши, где пользователь победил
     user_wins = []
@@ -1544,9 +3737,9 @@ async def show_my_wins(update: Update, context: ContextTypes.DEFAULT_TYPE):
         wins_text += f"   📅 Дата: {format_date(drawing['end_date'])}\n"
         
         # Участники
-        participants = drawing['participants']
+        participants = drawing['participants_count']
         if participants:
-            wins_text += f"   👥 Участников: {len(participants)}\n"
+            wins_text += f"   👥 Участников: {participants}\n"
         
         wins_text += "\n"
     
@@ -1568,7 +3761,7 @@ async def show_my_wins(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # ========== СИСТЕМА РОЗЫГРЫШЕЙ ==========
 async def show_active_drawings(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показать активные розыгрыши"""
-    active_drawings = db.get_active_drawings()
+    active_drawings = await adb.get_active_drawings()
     
     if not active_drawings:
         await update.message.reply_text(
@@ -1605,7 +3798,7 @@ async def show_active_drawings(update: Update, context: ContextTypes.DEFAULT_TYP
         prize = drawing['prize']
         start_date = format_date(drawing['start_date'])
         end_date = format_date(drawing['end_date'])
-        participants = len(drawing['participants'])
+        participants = drawing['participants_count']
         max_participants = drawing['max_participants']
         
         # Время до конца
@@ -1662,7 +3855,7 @@ async def show_drawing_details(update: Update, context: ContextTypes.DEFAULT_TYP
         await query.answer()
         drawing_id = int(query.data.replace("drawing_view_", ""))
     
-    drawing = db.get_drawing(drawing_id=drawing_id)
+    drawing = await adb.get_drawing(drawing_id=drawing_id)
     user_id = update.effective_user.id
     
     if not drawing:
@@ -1677,7 +3870,7 @@ async def show_drawing_details(update: Update, context: ContextTypes.DEFAULT_TYP
     prize = drawing['prize']
     start_date = format_date(drawing['start_date'])
     end_date = format_date(drawing['end_date'])
-    participants = len(drawing['participants'])
+    participants = drawing['participants_count']
     max_participants = drawing['max_participants']
     min_participants = drawing['min_participants']
     
@@ -1735,7 +3928,7 @@ async def show_drawing_details(update: Update, context: ContextTypes.DEFAULT_TYP
         text += "• 🎫 <b>Без специальных требований</b>\n"
     
     # Проверяем, может ли пользователь участвовать
-    user = db.get_user(user_id)
+    user = await adb.get_user(user_id)
     can_participate = False
     participation_reason = ""
     
@@ -1757,9 +3950,9 @@ async def show_drawing_details(update: Update, context: ContextTypes.DEFAULT_TYP
             participation_reason = "✅ Вы можете участвовать!"
         
         # Проверяем, не участвует ли уже
-        if user_id in drawing['participants']:
+        ticket_number = await adb.get_participant_ticket(drawing_id, user_id)
+        if ticket_number:
             can_participate = False
-            ticket_number = drawing['ticket_numbers'].get(user_id, 0)
             participation_reason = f"✅ Вы уже участвуете! Ваш билет №{ticket_number}"
     
     text += f"\n<b>🎫 Ваш статус:</b> {participation_reason}"
@@ -1787,9 +3980,9 @@ async def participate_in_drawing(update: Update, context: ContextTypes.DEFAULT_T
         await query.answer()
         drawing_id = int(query.data.replace("drawing_participate_", ""))
     
-    drawing = db.get_drawing(drawing_id=drawing_id)
+    drawing = await adb.get_drawing(drawing_id=drawing_id)
     user_id = update.effective_user.id
-    user = db.get_user(user_id)
+    user = await adb.get_user(user_id)
     
     if not drawing:
         if 'query' in locals():
@@ -1817,28 +4010,22 @@ async def participate_in_drawing(update: Update, context: ContextTypes.DEFAULT_T
             return
     
     # Проверяем, не участвует ли уже
-    if user_id in drawing['participants']:
+    if await adb.get_participant_ticket(drawing_id, user_id):
         if 'query' in locals():
             await query.answer("❌ Вы уже участвуете в этом розыгрыше!")
         return
     
     # Проверяем максимальное количество участников
-    if len(drawing['participants']) >= drawing['max_participants']:
+    if drawing['participants_count'] >= drawing['max_participants']:
         if 'query' in locals():
             await query.answer("❌ Достигнуто максимальное количество участников!")
         return
     
-    # Списываем баллы если требуется
-    if drawing['entry_cost'] > 0:
-        db.update_user_points(user_id, -drawing['entry_cost'], None, f"Участие в розыгрыше: {drawing['name']}")
-    
-    # Добавляем участника
-    success = db.add_drawing_participant(drawing_id, user_id)
+    # Добавляем участника, стоимость участия списывается в той же транзакции
+    entry = await adb.add_drawing_participant(drawing_id, user_id)
     
-    if success:
-        # Получаем обновленные данные розыгрыша
-        drawing = db.get_drawing(drawing_id=drawing_id)
-        ticket_number = drawing['ticket_numbers'].get(user_id, 0)
+    if entry:
+        ticket_number = entry['ticket_number']
         
         if 'query' in locals():
             await query.answer(f"✅ Вы успешно зарегистрированы! Ваш билет №{ticket_number}")
@@ -1854,7 +4041,7 @@ async def participate_in_drawing(update: Update, context: ContextTypes.DEFAULT_T
 👤 Участник: {user.get('nickname', 'Неизвестно')}
 🆔 ID: <code>{user_id}</code>
 🎫 Билет №: {ticket_number}
-👥 Всего участников: {len(drawing['participants'])}/{drawing['max_participants']}
+👥 Всего участников: {entry['participants_count']}/{entry['max_participants']}
 
 <b>🎁 Приз:</b> {drawing['prize']}
         """
@@ -1889,36 +4076,20 @@ async def admin_dashboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     # Получаем статистику
-    with db.get_cursor() as cursor:
-        cursor.execute('SELECT COUNT(*) as total_users FROM users WHERE is_banned = 0')
-        total_users = cursor.fetchone()[0]
-        
-        cursor.execute('SELECT COUNT(*) as pending_tasks FROM tasks WHERE status = "pending"')
-        pending_tasks = cursor.fetchone()[0]
-        
-        cursor.execute('SELECT COUNT(*) as active_drawings FROM drawings WHERE status = "active"')
-        active_drawings = cursor.fetchone()[0]
-        
-        cursor.execute('SELECT SUM(total_points) as total_points FROM users WHERE is_banned = 0')
-        total_points = cursor.fetchone()[0] or 0
-        
-        cursor.execute('''
-            SELECT COUNT(*) as today_tasks 
-            FROM tasks 
-            WHERE DATE(created_at) = DATE('now')
-        ''')
-        today_tasks = cursor.fetchone()[0]
+    stats = await adb.get_system_stats()
     
     text = f"""
 👑 <b>ПАНЕЛЬ АДМИНИСТРАТОРА</b>
 ══════════════════════════════
 
 📊 <b>Общая статистика:</b>
-👥 Участников: <code>{format_number(total_users)}</code>
-📋 Заданий на проверке: <code>{format_number(pending_tasks)}</code>
-🎰 Активных розыгрышей: <code>{format_number(active_drawings)}</code>
-💰 Всего баллов в системе: <code>{format_number(total_points)}</code>
-📅 Заданий сегодня: <code>{format_number(today_tasks)}</code>
+👥 Участников: <code>{format_number(stats['total_users'])}</code>
+📋 Заданий на проверке: <code>{format_number(stats['pending_tasks'])}</code>
+🎰 Активных розыгрышей: <code>{format_number(stats['active_drawings'])}</code>
+💰 Всего баллов в системе: <code>{format_number(stats['total_points'])}</code>
+📅 Заданий сегодня: <code>{format_number(stats['today_tasks'])}</code>
+🟢 Активны за 24 часа: <code>{format_number(activity.count_active(timedelta(days=1)))}</code>
+🗓 Активны за 7 дней: <code>{format_number(activity.count_active(timedelta(days=7)))}</code>
 
 ⚡ <b>Быстрые действия:</b>
 """
@@ -1933,90 +4104,435 @@ async def admin_dashboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
         disable_web_page_preview=True
     )
 
-async def check_tasks(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Проверить задания на модерации"""
+@admin_required
+async def start_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Начало рассылки: запрос текста"""
+    text = """
+📢 <b>РАССЫЛКА</b>
+══════════════════════════════
+
+✏️ Отправьте текст сообщения для всех участников.
+Форматирование (жирный, курсив, ссылки) сохранится.
+
+Участники, заблокировавшие бота, и забаненные пропускаются.
+"""
+    recent = await adb.get_recent_broadcasts(limit=3)
+    if recent:
+        text += "\n📜 <b>Последние рассылки:</b>"
+        for broadcast in recent:
+            done = broadcast['sent'] + broadcast['failed'] + broadcast['blocked']
+            text += (f"\n#{broadcast['broadcast_id']} {format_date(broadcast['created_at'])}: "
+                     f"{broadcast['status']}, {done}/{broadcast['total']}")
+    
+    await update.message.reply_text(
+        text,
+        parse_mode=ParseMode.HTML,
+        reply_markup=InlineKeyboardMarkup([[
+            InlineKeyboardButton("🔙 Назад", callback_data="admin_back_to_dashboard")
+        ]])
+    )
+    
+    return ADMIN_SEND_BROADCAST
+
+async def process_broadcast_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Предпросмотр рассылки перед отправкой"""
+    context.user_data['broadcast_text'] = update.message.text_html
+    
+    recipients = (await adb.get_system_stats())['total_users']
+    await update.message.reply_text(
+        f"👀 <b>Предпросмотр рассылки</b> (получателей не больше {format_number(recipients)}):",
+        parse_mode=ParseMode.HTML
+    )
+    await update.message.reply_text(
+        update.message.text_html,
+        parse_mode=ParseMode.HTML,
+        disable_web_page_preview=True,
+        reply_markup=InlineKeyboardMarkup([[
+            InlineKeyboardButton("✅ Отправить всем", callback_data="admin_broadcast_confirm"),
+            InlineKeyboardButton("❌ Отмена", callback_data="admin_broadcast_discard")
+        ]])
+    )
+    
+    return ConversationHandler.END
+
+@admin_required
+async def confirm_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Создать рассылку и запустить отправку"""
+    query = update.callback_query
+    text = context.user_data.pop('broadcast_text', None)
+    if not text:
+        await query.edit_message_text("❌ Текст рассылки не найден, начните заново.")
+        return
+    
+    broadcast_id = await adb.create_broadcast(query.from_user.id, text)
+    broadcast = await adb.get_broadcast(broadcast_id)
+    await query.edit_message_reply_markup(reply_markup=None)
+    progress = await query.message.reply_text(
+        format_broadcast_progress(broadcast),
+        parse_mode=ParseMode.HTML,
+        reply_markup=InlineKeyboardMarkup([[
+            InlineKeyboardButton("⛔ Остановить", callback_data=f"admin_broadcast_stop_{broadcast_id}")
+        ]])
+    )
+    await adb.set_broadcast_message(broadcast_id, progress.chat_id, progress.message_id)
+    
+    broadcaster.start(context.bot, broadcast_id)
+
+@admin_required
+async def stop_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE, broadcast_id: int):
+    """Остановить идущую рассылку"""
+    broadcast = await broadcaster.cancel(broadcast_id) or await adb.get_broadcast(broadcast_id)
+    if not broadcast:
+        return
+    await update.callback_query.edit_message_text(
+        format_broadcast_progress(broadcast),
+        parse_mode=ParseMode.HTML
+    )
+
+@admin_required
+async def show_errors(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /errors: самые частые ошибки, /errors <отпечаток> - примеры одной ошибки"""
+    if context.args:
+        entry = error_aggregator.get(context.args[0])
+        if not entry:
+            await update.message.reply_text("❌ Ошибка с таким отпечатком не найдена.")
+            return
+        
+        text = f"""
+🐞 <b>ОШИБКА</b> <code>{entry['fingerprint']}</code>
+══════════════════════════════
+
+<b>{html.escape(entry['type'])}</b> в <code>{html.escape(entry['location'])}</code>
+🔢 Всего: <code>{entry['count']}</code>
+🕐 Впервые: {entry['first_seen']:%d.%m.%Y %H:%M:%S}
+🕑 Последний раз: {entry['last_seen']:%d.%m.%Y %H:%M:%S}
+
+📋 <b>Последние примеры:</b>
+"""
+        for sample in reversed(entry['samples']):
+            text += (f"\n<b>{sample['time']:%H:%M:%S}</b> {html.escape(sample['update'])}\n"
+                     f"<code>{html.escape(sample['message'])}</code>\n")
+        await update.message.reply_text(text, parse_mode=ParseMode.HTML)
+        return
+    
+    entries = error_aggregator.top(10)
+    if not entries:
+        await update.message.reply_text("✅ Ошибок с момента запуска не было.")
+        return
+    
+    text = """
+🐞 <b>ЧАСТЫЕ ОШИБКИ</b>
+══════════════════════════════
+"""
+    for entry in entries:
+        text += (f"\n<code>{entry['fingerprint']}</code> <b>{html.escape(entry['type'])}</b> × {entry['count']}\n"
+                 f"📍 <code>{html.escape(entry['location'])}</code>\n"
+                 f"🕐 {entry['first_seen']:%d.%m %H:%M} — {entry['last_seen']:%d.%m %H:%M}\n")
+    text += "\n💡 Примеры ошибки: /errors &lt;отпечаток&gt;"
+    
+    await update.message.reply_text(text, parse_mode=ParseMode.HTML)
+
+@admin_required
+async def show_system_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Статистика заданий за неделю из дневной сводки"""
+    stats = await adb.get_system_stats()
+    daily = await adb.get_task_daily_totals(days=7)
+    by_type = await adb.get_task_type_totals(days=7)
+    cache = db.user_cache.stats()
+    updates = update_processor.stats()
+    notifications = notifier.stats()
+    outbox_stats = await adb.get_outbox_stats()
+    
+    text = f"""
+📊 <b>СТАТИСТИКА</b>
+══════════════════════════════
+
+👥 Участников: <code>{format_number(stats['total_users'])}</code>
+💰 Всего баллов: <code>{format_number(stats['total_points'])}</code>
+📋 На проверке: <code>{format_number(stats['pending_tasks'])}</code>
+🗂 Кэш профилей: <code>{cache['size']}</code> записей, попаданий <code>{cache['hit_rate']:.0%}</code>
+⚡ Обновления: в работе <code>{updates['in_progress']}</code>, ждут <code>{max(0, updates['pending'] - updates['in_progress'])}</code>, пик очереди пользователя <code>{updates['peak_depth']}</code>
+📨 Уведомления: в очереди <code>{notifications['queued']}</code>, отправлено <code>{notifications['sent']}</code>, ошибок <code>{notifications['failed']}</code>
+🗞 Сводки администраторам: отправлено <code>{admin_digest.digests_sent}</code>, заданий в них <code>{admin_digest.tasks_coalesced}</code>
+📬 Outbox: ждут <code>{outbox_stats.get('pending', 0) + outbox_stats.get('sending', 0)}</code>, не доставлено <code>{outbox_stats.get('failed', 0)}</code>
+
+📅 <b>Задания по дням (отправлено / ✅ / ❌ / баллы):</b>
+"""
+    
+    if daily:
+        for row in daily:
+            text += (f"\n{row['day']}: {row['submitted']} / {row['approved']} / "
+                     f"{row['rejected']} / {format_number(row['points'])}")
+    else:
+        text += "\n📭 За неделю заданий не было"
+    
+    if by_type:
+        text += "\n\n🎮 <b>По типам за 7 дней:</b>"
+        for row in by_type:
+            task_info = TASK_TYPES.get(row['task_type'], {'name': row['task_type'], 'emoji': '📌'})
+            text += (f"\n{task_info['emoji']} {task_info['name']}: {row['submitted']} "
+                     f"(✅ {row['approved']}, ❌ {row['rejected']})")
+    
+    hot_lanes = update_processor.hot_lanes()
+    if hot_lanes:
+        text += "\n\n🔥 <b>Самые длинные очереди обновлений:</b>"
+        for lane_user_id, depth in hot_lanes:
+            text += f"\n<code>{lane_user_id}</code>: {depth}"
+    
+    await update.message.reply_text(
+        text,
+        parse_mode=ParseMode.HTML,
+        reply_markup=create_admin_management_keyboard(),
+        disable_web_page_preview=True
+    )
+
+async def check_tasks(update: Update, context: ContextTypes.DEFAULT_TYPE, after_task_id: int = None):
+    """Проверить задания на модерации (страница очереди после after_task_id)"""
     user_id = update.effective_user.id
+    message = update.effective_message
     
     if not is_admin(user_id):
-        await update.message.reply_text("⛔ У вас нет прав администратора!")
+        await message.reply_text("⛔ У вас нет прав администратора!")
         return
     
-    pending_tasks = db.get_pending_tasks(limit=10)
+    # Берем на одно задание больше, чтобы знать, есть ли следующая страница
+    page = await adb.get_pending_tasks(limit=TASKS_PAGE_SIZE + 1, after_task_id=after_task_id)
+    pending_tasks, has_more = page[:TASKS_PAGE_SIZE], len(page) > TASKS_PAGE_SIZE
+    pending_count = (await adb.get_system_stats())['pending_tasks']
     
-    if not pending_tasks:
-        await update.message.reply_text(
+    if not pending_tasks and after_task_id is None:
+        await message.reply_text(
             """
 ✅ <b>ПРОВЕРКА ЗАДАНИЙ</b>
 ══════════════════════════════
 
 📭 На данный момент нет заданий на проверке.
 
-🎯 <b>Что можно сделать:</b>
-• Подождать новых заданий от участников
-• Проверить статистику участников
-• Создать новый розыгрыш
-• Отправить рассылку участникам
-            """,
-            parse_mode=ParseMode.HTML,
-            reply_markup=create_admin_management_keyboard()
-        )
+🎯 <b>Что можно сделать:</b>
+• Подождать новых заданий от участников
+• Проверить статистику участников
+• Создать новый розыгрыш
+• Отправить рассылку участникам
+            """,
+            parse_mode=ParseMode.HTML,
+            reply_markup=create_admin_management_keyboard()
+        )
+        return
+    
+    text = f"""
+✅ <b>ПРОВЕРКА ЗАДАНИЙ</b>
+══════════════════════════════
+
+📋 Заданий на проверке: <code>{format_number(pending_count)}</code>
+
+<b>📝 {'Следующие' if after_task_id else 'Первые в очереди'} задания:</b>
+"""
+    
+    if not pending_tasks:
+        text += "\n📭 Дальше заданий нет"
+    
+    now = int(time.time())
+    for task in pending_tasks:
+        task_type = TASK_TYPES.get(task['task_type'], {'name': task['task_type'], 'emoji': '📝'})
+        user_nickname = task.get('nickname') or task.get('username') or f"User_{task['user_id']}"
+        created_at = format_date(task['created_at'])
+        claimed = task.get('claimed_by') not in (None, user_id) and (task.get('claimed_until') or 0) >= now
+        
+        text += f"\n<b>{task_type['emoji']} {task_type['name']}</b>{' 🔒' if claimed else ''}"
+        text += f"\n👤 {user_nickname}"
+        text += f"\n🎯 Баллов: {task['points']} × {task.get('count', 1)} = {task['points'] * task.get('count', 1)}"
+        text += f"\n📅 {created_at}"
+        
+        if task.get('comment'):
+            text += f"\n💬 {task['comment'][:50]}..."
+        
+        text += f"\n{'─' * 25}"
+    
+    # Кнопки
+    keyboard = []
+    for task in pending_tasks:
+        task_type = TASK_TYPES.get(task['task_type'], {'name': task['task_type'][:10]})
+        keyboard.append([
+            InlineKeyboardButton(
+                f"👤 {task['task_id']} | {task_type['name'][:15]}",
+                callback_data=f"admin_review_task_{task['task_id']}"
+            )
+        ])
+    
+    keyboard.append([
+        InlineKeyboardButton("🎯 Взять следующее свободное", callback_data="admin_claim_next")
+    ])
+    keyboard.append([
+        InlineKeyboardButton("📦 Пакетная проверка", callback_data="admin_batch_review")
+    ])
+    
+    # Навигация по очереди: курсор - последнее задание на странице
+    navigation = []
+    if after_task_id is not None:
+        navigation.append(InlineKeyboardButton("⏮ В начало", callback_data="admin_refresh_tasks"))
+    if has_more:
+        navigation.append(InlineKeyboardButton(
+            "➡️ Дальше", callback_data=f"admin_tasks_after_{pending_tasks[-1]['task_id']}"
+        ))
+    if navigation:
+        keyboard.append(navigation)
+    
+    keyboard.append([
+        InlineKeyboardButton("🔄 Обновить список", callback_data="admin_refresh_tasks"),
+        InlineKeyboardButton("📋 Все задания", callback_data="admin_all_tasks")
+    ])
+    
+    keyboard.append([
+        InlineKeyboardButton("🔙 Назад", callback_data="admin_back_to_dashboard")
+    ])
+    
+    if update.callback_query:
+        await update.callback_query.edit_message_text(
+            text,
+            parse_mode=ParseMode.HTML,
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            disable_web_page_preview=True
+        )
+    else:
+        await message.reply_text(
+            text,
+            parse_mode=ParseMode.HTML,
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            disable_web_page_preview=True
+        )
+
+async def open_next_task(update: Update, context: ContextTypes.DEFAULT_TYPE, after_task_id: int = None):
+    """Закрепить и открыть следующее свободное задание после текущего"""
+    admin_id = update.effective_user.id
+    next_task_id = await adb.claim_next_task(admin_id, after_task_id=after_task_id)
+    if not next_task_id and after_task_id:
+        # Дошли до конца очереди - начинаем сначала
+        next_task_id = await adb.claim_next_task(admin_id)
+    
+    if next_task_id:
+        await review_task(update, context, next_task_id)
+    else:
+        await check_tasks(update, context)
+
+async def start_batch_review(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Пакетная проверка: закрепить несколько заданий и показать их с переключателями"""
+    admin_id = update.effective_user.id
+    task_ids = await adb.claim_task_batch(admin_id, BATCH_REVIEW_SIZE)
+    tasks = await adb.get_tasks_by_ids(task_ids)
+    
+    if not tasks:
+        await check_tasks(update, context)
+        return
+    
+    context.user_data['batch_review'] = {
+        task['task_id']: {
+            'decision': None,
+            'task_type': task['task_type'],
+            'nickname': task.get('nickname') or task.get('username') or f"User_{task['user_id']}",
+            'points': task['points'] * task.get('count', 1),
+            'comment': task.get('comment')
+        }
+        for task in tasks
+    }
+    await show_batch_review(update, context)
+
+async def show_batch_review(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Экран пакетной проверки"""
+    query = update.callback_query
+    batch = context.user_data.get('batch_review')
+    if not batch:
+        await check_tasks(update, context)
         return
     
+    decision_marks = {None: '⬜', 'approve': '✅', 'reject': '❌'}
     text = f"""
-✅ <b>ПРОВЕРКА ЗАДАНИЙ</b>
+📦 <b>ПАКЕТНАЯ ПРОВЕРКА</b>
 ══════════════════════════════
 
-📋 Заданий на проверке: <code>{len(pending_tasks)}</code>
-
-<b>📝 Последние задания:</b>
+Нажимайте на задания, чтобы выбрать решение: ⬜ → ✅ → ❌
+Задания закреплены за вами на {REVIEW_LEASE_SECONDS // 60} мин.
 """
     
-    # Показываем 3 последних задания
-    for task in pending_tasks[:3]:
-        task_type = TASK_TYPES.get(task['task_type'], {'name': task['task_type'], 'emoji': '📝'})
-        user_nickname = task.get('nickname') or task.get('username') or f"User_{task['user_id']}"
-        created_at = format_date(task['created_at'])
-        
-        text += f"\n<b>{task_type['emoji']} {task_type['name']}</b>"
-        text += f"\n👤 {user_nickname}"
-        text += f"\n🎯 Баллов: {task['points']} × {task.get('count', 1)} = {task['points'] * task.get('count', 1)}"
-        text += f"\n📅 {created_at}"
-        
-        if task.get('comment'):
-            text += f"\n💬 {task['comment'][:50]}..."
-        
-        text += f"\n{'─' * 25}"
-    
-    if len(pending_tasks) > 3:
-        text += f"\n\n<i>...и еще {len(pending_tasks) - 3} заданий</i>"
-    
-    # Кнопки
     keyboard = []
-    for task in pending_tasks[:5]:  # Максимум 5 кнопок
-        task_type = TASK_TYPES.get(task['task_type'], {'name': task['task_type'][:10]})
-        keyboard.append([
-            InlineKeyboardButton(
-                f"👤 {task['task_id']} | {task_type['name'][:15]}",
-                callback_data=f"admin_review_task_{task['task_id']}"
-            )
-        ])
-    
-    keyboard.append([
-        InlineKeyboardButton("🔄 Обновить список", callback_data="admin_refresh_tasks"),
-        InlineKeyboardButton("📋 Все задания", callback_data="admin_all_tasks")
-    ])
+    for task_id, item in batch.items():
+        task_type = TASK_TYPES.get(item['task_type'], {'name': item['task_type'], 'emoji': '📝'})
+        text += f"\n{decision_marks[item['decision']]} <b>#{task_id}</b> {task_type['emoji']} {task_type['name']}"
+        text += f"\n   👤 {item['nickname']} | 🎯 {item['points']}"
+        if item['comment']:
+            text += f"\n   💬 {item['comment'][:50]}"
+        keyboard.append([InlineKeyboardButton(
+            f"{decision_marks[item['decision']]} #{task_id} | {item['nickname'][:15]}",
+            callback_data=f"admin_batch_toggle_{task_id}"
+        )])
+    
+    approve_count = sum(1 for item in batch.values() if item['decision'] == 'approve')
+    reject_count = sum(1 for item in batch.values() if item['decision'] == 'reject')
     
     keyboard.append([
-        InlineKeyboardButton("🔙 Назад", callback_data="admin_back_to_dashboard")
+        InlineKeyboardButton("✅ Отметить все", callback_data="admin_batch_all"),
+        InlineKeyboardButton(f"🚀 Применить ({approve_count}✅ {reject_count}❌)", callback_data="admin_batch_apply")
     ])
+    keyboard.append([InlineKeyboardButton("🔙 К списку", callback_data="admin_back_to_tasks")])
     
-    await update.message.reply_text(
+    await query.edit_message_text(
         text,
         parse_mode=ParseMode.HTML,
         reply_markup=InlineKeyboardMarkup(keyboard),
         disable_web_page_preview=True
     )
 
+async def toggle_batch_decision(update: Update, context: ContextTypes.DEFAULT_TYPE, task_id: int = None):
+    """Переключить решение по заданию (или по всем) на экране пакетной проверки"""
+    batch = context.user_data.get('batch_review', {})
+    if task_id is None:
+        for item in batch.values():
+            item['decision'] = 'approve'
+    elif task_id in batch:
+        next_decision = {None: 'approve', 'approve': 'reject', 'reject': None}
+        batch[task_id]['decision'] = next_decision[batch[task_id]['decision']]
+    await show_batch_review(update, context)
+
+async def apply_batch_review(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Применить решения пакетной проверки одной транзакцией"""
+    query = update.callback_query
+    admin_id = query.from_user.id
+    batch = context.user_data.pop('batch_review', {})
+    
+    approve_ids = [task_id for task_id, item in batch.items() if item['decision'] == 'approve']
+    reject_ids = [task_id for task_id, item in batch.items() if item['decision'] == 'reject']
+    reason = "Отклонено при пакетной проверке"
+    
+    # Задания без решения в той же транзакции возвращаются в очередь
+    approved, rejected = await adb.apply_batch_review(
+        approve_ids, reject_ids, admin_id, reason,
+        approve_notify=task_approved_message,
+        reject_notify=task_rejected_message
+    )
+    outbox.wake()
+    
+    skipped = [task_id for task_id, task in {**approved, **rejected}.items() if task is None]
+    untouched = len(batch) - len(approve_ids) - len(reject_ids)
+    
+    text = f"""
+📦 <b>ПАКЕТНАЯ ПРОВЕРКА ЗАВЕРШЕНА</b>
+══════════════════════════════
+
+✅ Одобрено: <code>{sum(1 for task in approved.values() if task)}</code>
+❌ Отклонено: <code>{sum(1 for task in rejected.values() if task)}</code>
+⏭ Без решения: <code>{untouched}</code>
+"""
+    if skipped:
+        text += f"\n⚠️ Пропущены (уже проверены другим администратором): {', '.join(f'#{t}' for t in skipped)}"
+    
+    await query.edit_message_text(
+        text,
+        parse_mode=ParseMode.HTML,
+        reply_markup=InlineKeyboardMarkup([
+            [InlineKeyboardButton("📦 Следующая пачка", callback_data="admin_batch_review")],
+            [InlineKeyboardButton("🔙 К списку", callback_data="admin_back_to_tasks")]
+        ])
+    )
+
 async def review_task(update: Update, context: ContextTypes.DEFAULT_TYPE, task_id: int = None):
     """Просмотр и проверка задания"""
     query = update.callback_query
@@ -2025,22 +4541,27 @@ async def review_task(update: Update, context: ContextTypes.DEFAULT_TYPE, task_i
     if not task_id:
         task_id = int(query.data.replace("admin_review_task_", ""))
     
-    task = None
-    with db.get_cursor() as cursor:
-        cursor.execute('''
-            SELECT t.*, u.nickname, u.username, u.user_id, u.total_points
-            FROM tasks t 
-            JOIN users u ON t.user_id = u.user_id 
-            WHERE t.task_id = ?
-        ''', (task_id,))
-        row = cursor.fetchone()
-        if row:
-            task = dict(row)
+    task = await adb.get_task_details(task_id)
     
     if not task:
         await query.edit_message_text("❌ Задание не найдено!")
         return
     
+    admin_id = query.from_user.id
+    if not await adb.claim_task(task_id, admin_id):
+        if task['status'] != 'pending':
+            reason = "✅ Задание уже проверено."
+        else:
+            reason = "🔒 Задание сейчас проверяет другой администратор."
+        await query.edit_message_text(
+            f"{reason}\n\nВозьмите следующее свободное задание.",
+            reply_markup=InlineKeyboardMarkup([[
+                InlineKeyboardButton("➡️ Следующее задание", callback_data=f"admin_next_task_{task_id}"),
+                InlineKeyboardButton("🔙 К списку", callback_data="admin_back_to_tasks")
+            ]])
+        )
+        return
+    
     task_type = TASK_TYPES.get(task['task_type'], {'name': task['task_type'], 'emoji': '📝', 'description': ''})
     
     text = f"""
@@ -2072,26 +4593,19 @@ async def review_task(update: Update, context: ContextTypes.DEFAULT_TYPE, task_i
     text += f"\n<b>📝 Описание задания:</b>\n{task_type.get('description', '')}"
     
     # Получаем статистику пользователя по этому типу задания
-    with db.get_cursor() as cursor:
-        cursor.execute('''
-            SELECT COUNT(*) as total, 
-                   SUM(CASE WHEN status = 'approved' THEN 1 ELSE 0 END) as approved,
-                   SUM(CASE WHEN status = 'rejected' THEN 1 ELSE 0 END) as rejected
-            FROM tasks 
-            WHERE user_id = ? AND task_type = ?
-        ''', (task['user_id'], task['task_type']))
-        stats = cursor.fetchone()
+    stats = await adb.get_user_task_type_stats(task['user_id'], task['task_type'])
     
     if stats:
         text += f"""
         
 📈 <b>Статистика пользователя по этому типу:</b>
-📊 Всего отправлено: {stats[0]}
-✅ Одобрено: {stats[1]}
-❌ Отклонено: {stats[2]}
+📊 Всего отправлено: {stats['total']}
+✅ Одобрено: {stats['approved']}
+❌ Отклонено: {stats['rejected']}
 """
     
-    # Кнопки
+    # Кнопки. Следующее задание закрепляется только по нажатию (open_next_task),
+    # текущее при этом возвращается в очередь
     keyboard = [
         [
             InlineKeyboardButton("✅ Одобрить", callback_data=f"admin_approve_task_{task_id}"),
@@ -2102,7 +4616,7 @@ async def review_task(update: Update, context: ContextTypes.DEFAULT_TYPE, task_i
             InlineKeyboardButton("📋 Все задания участника", callback_data=f"admin_user_tasks_{task['user_id']}")
         ],
         [
-            InlineKeyboardButton("🔄 Следующее задание", callback_data="admin_next_task"),
+            InlineKeyboardButton("🔄 Следующее задание", callback_data=f"admin_next_task_{task_id}"),
             InlineKeyboardButton("🔙 К списку", callback_data="admin_back_to_tasks")
         ]
     ]
@@ -2126,6 +4640,43 @@ async def review_task(update: Update, context: ContextTypes.DEFAULT_TYPE, task_i
         except Exception as e:
             logger.error(f"Ошибка отправки скриншота: {e}")
 
+def task_approved_message(task: dict) -> str:
+    """Уведомление автору об одобрении задания (task - строка задания с balance)"""
+    return f"""
+✅ <b>ВАШЕ ЗАДАНИЕ ОДОБРЕНО!</b>
+
+🎮 Тип задания: {TASK_TYPES.get(task['task_type'], {'name': task['task_type']})['name']}
+💰 Начислено баллов: <code>{format_number(task['points'] * task['count'])}</code>
+📅 Время проверки: {format_date(datetime.now().isoformat())}
+
+🎯 <b>Текущий баланс:</b> <code>{format_number(task['balance'] or 0)}</code>
+
+🚀 Продолжайте в том же духе!
+        """
+
+def task_rejected_message(task: dict) -> str:
+    """Уведомление автору об отклонении задания"""
+    return f"""
+❌ <b>ВАШЕ ЗАДАНИЕ ОТКЛОНЕНО</b>
+
+🎮 Тип задания: {TASK_TYPES.get(task['task_type'], {'name': task['task_type']})['name']}
+📝 Причина: {task['rejection_reason']}
+📅 Время проверки: {format_date(datetime.now().isoformat())}
+
+💡 <b>Что делать дальше:</b>
+1. Исправьте указанные ошибки
+2. Отправьте задание заново
+3. Убедитесь, что скриншот соответствует требованиям
+
+🚀 <b>Требования к заданиям:</b>
+• Четкий скриншот
+• Соответствие описанию задания
+• Правильное количество выполнений
+• Отсутствие нарушений правил
+
+🔄 <b>Попробуйте еще раз!</b>
+        """
+
 async def approve_task_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Одобрить задание"""
     query = update.callback_query
@@ -2134,38 +4685,11 @@ async def approve_task_callback(update: Update, context: ContextTypes.DEFAULT_TY
     task_id = int(query.data.replace("admin_approve_task_", ""))
     admin_id = query.from_user.id
     
-    # Одобряем задание
-    success = db.approve_task(task_id, admin_id)
+    # Одобряем задание, уведомление автору записывается в outbox той же транзакцией
+    task_info = await adb.approve_task(task_id, admin_id, notify=task_approved_message)
     
-    if success:
-        # Получаем информацию о задании для уведомления
-        with db.get_cursor() as cursor:
-            cursor.execute('''
-                SELECT t.user_id, t.task_type, t.points, t.count, u.nickname
-                FROM tasks t 
-                JOIN users u ON t.user_id = u.user_id 
-                WHERE t.task_id = ?
-            ''', (task_id,))
-            task_info = cursor.fetchone()
-        
-        if task_info:
-            user_id, task_type, points, count, nickname = task_info
-            total_points = points * count
-            
-            # Уведомляем пользователя
-            notification_text = f"""
-✅ <b>ВАШЕ ЗАДАНИЕ ОДОБРЕНО!</b>
-
-🎮 Тип задания: {TASK_TYPES.get(task_type, {'name': task_type})['name']}
-💰 Начислено баллов: <code>{format_number(total_points)}</code>
-📅 Время проверки: {format_date(datetime.now().isoformat())}
-
-🎯 <b>Текущий баланс:</b> <code>{format_number(db.get_user(user_id)['total_points'])}</code>
-
-🚀 Продолжайте в том же духе!
-            """
-            
-            await send_notification(context.bot, user_id, notification_text)
+    if task_info:
+        outbox.wake()
         
         await query.answer("✅ Задание одобрено и баллы начислены!", show_alert=True)
         await query.edit_message_text(
@@ -2176,7 +4700,7 @@ async def approve_task_callback(update: Update, context: ContextTypes.DEFAULT_TY
         # Переходим к следующему заданию
         await check_tasks(update, context)
     else:
-        await query.answer("❌ Ошибка при одобрении задания!", show_alert=True)
+        await query.answer("❌ Задание уже проверено или его проверяет другой администратор!", show_alert=True)
 
 async def reject_task_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Отклонить задание"""
@@ -2223,46 +4747,11 @@ async def process_task_rejection(update: Update, context: ContextTypes.DEFAULT_T
         await update.message.reply_text("❌ Ошибка: данные не найдены!")
         return ConversationHandler.END
     
-    # Отклоняем задание
-    success = db.reject_task(task_id, admin_id, reason)
+    # Отклоняем задание, уведомление автору записывается в outbox той же транзакцией
+    task_info = await adb.reject_task(task_id, admin_id, reason, notify=task_rejected_message)
     
-    if success:
-        # Получаем информацию о задании для уведомления
-        with db.get_cursor() as cursor:
-            cursor.execute('''
-                SELECT t.user_id, t.task_type, u.nickname
-                FROM tasks t 
-                JOIN users u ON t.user_id = u.user_id 
-                WHERE t.task_id = ?
-            ''', (task_id,))
-            task_info = cursor.fetchone()
-        
-        if task_info:
-            user_id, task_type, nickname = task_info
-            
-            # Уведомляем пользователя
-            notification_text = f"""
-❌ <b>ВАШЕ ЗАДАНИЕ ОТКЛОНЕНО</b>
-
-🎮 Тип задания: {TASK_TYPES.get(task_type, {'name': task_type})['name']}
-📝 Причина: {reason}
-📅 Время проверки: {format_date(datetime.now().isoformat())}
-
-💡 <b>Что делать дальше:</b>
-1. Исправьте указанные ошибки
-2. Отправьте задание заново
-3. Убедитесь, что скриншот соответствует требованиям
-
-🚀 <b>Требования к заданиям:</b>
-• Четкий скриншот
-• Соответствие описанию задания
-• Правильное количество выполнений
-• Отсутствие нарушений правил
-
-🔄 <b>Попробуйте еще раз!</b>
-            """
-            
-            await send_notification(context.bot, user_id, notification_text)
+    if task_info:
+        outbox.wake()
         
         await update.message.reply_text(
             f"✅ <b>Задание #{task_id} отклонено!</b>\n\nПричина отправлена участнику.",
@@ -2272,7 +4761,7 @@ async def process_task_rejection(update: Update, context: ContextTypes.DEFAULT_T
         # Возвращаемся к проверке заданий
         await check_tasks(update, context)
     else:
-        await update.message.reply_text("❌ Ошибка при отклонении задания!")
+        await update.message.reply_text("❌ Задание уже проверено или его проверяет другой администратор!")
     
     # Очищаем контекст
     context.user_data.pop('reject_task_id', None)
@@ -2324,7 +4813,7 @@ async def process_user_search(update: Update, context: ContextTypes.DEFAULT_TYPE
     # Если поиск по ID
     if search_term.isdigit():
         user_id = int(search_term)
-        user = db.get_user(user_id)
+        user = await adb.get_user(user_id)
         
         if user:
             await show_user_profile(update, context, user_id)
@@ -2334,7 +4823,7 @@ async def process_user_search(update: Update, context: ContextTypes.DEFAULT_TYPE
             return ADMIN_SEARCH_USER
     
     # Поиск по тексту
-    users = db.search_users(search_term, limit=10)
+    users = await adb.search_users(search_term, limit=10)
     
     if not users:
         await update.message.reply_text(
@@ -2408,7 +4897,7 @@ async def show_user_profile(update: Update, context: ContextTypes.DEFAULT_TYPE,
             await query.answer("⛔ У вас нет прав администратора!", show_alert=True)
         return
     
-    user = db.get_user(target_user_id)
+    user = await adb.get_user(target_user_id)
     if not user:
         if 'query' in locals():
             await query.edit_message_text("❌ Пользователь не найден!")
@@ -2417,9 +4906,9 @@ async def show_user_profile(update: Update, context: ContextTypes.DEFAULT_TYPE,
         return
     
     # Получаем статистику
-    stats = db.get_user_stats(target_user_id)
-    drawings_stats = db.get_user_drawings_stats(target_user_id)
-    admin_operations = db.get_admin_operations(target_user_id, limit=5)
+    stats = await adb.get_user_stats(target_user_id)
+    drawings_stats = await adb.get_user_drawings_stats(target_user_id)
+    admin_operations = await adb.get_admin_operations(target_user_id, limit=5)
     
     # Форматируем никнейм
     display_name = f"{user.get('custom_emoji', '')} {user['nickname']}".strip()
@@ -2564,7 +5053,7 @@ async def quick_admin_action(update: Update, context: ContextTypes.DEFAULT_TYPE)
         user_id = int(parts[0])
         points = int(parts[1])
         
-        success = db.update_user_points(user_id, points, admin_id, f"Быстрое добавление {points} баллов")
+        success = await adb.update_user_points(user_id, points, admin_id, f"Быстрое добавление {points} баллов")
         
         if success:
             await query.answer(f"✅ Добавлено {points} баллов!", show_alert=True)
@@ -2579,12 +5068,12 @@ async def quick_admin_action(update: Update, context: ContextTypes.DEFAULT_TYPE)
         points = int(parts[1])
         
         # Проверяем, что у пользователя достаточно баллов
-        user = db.get_user(user_id)
+        user = await adb.get_user(user_id)
         if user['total_points'] < points:
             await query.answer(f"❌ Недостаточно баллов! У пользователя: {user['total_points']}", show_alert=True)
             return
         
-        success = db.update_user_points(user_id, -points, admin_id, f"Быстрое снятие {points} баллов")
+        success = await adb.update_user_points(user_id, -points, admin_id, f"Быстрое снятие {points} баллов")
         
         if success:
             await query.answer(f"✅ Снято {points} баллов!", show_alert=True)
@@ -2598,24 +5087,20 @@ async def quick_admin_action(update: Update, context: ContextTypes.DEFAULT_TYPE)
         user_id = int(parts[0])
         badge_id = parts[1]
         
-        user = db.get_user(user_id)
+        user = await adb.get_user(user_id)
         badges = user.get('badges', [])
         
         if badge_id not in badges:
             badges.append(badge_id)
-            success = db.update_user_badges(user_id, badges)
+            success = await adb.update_user_badges(user_id, badges)
             
             if success:
                 badge_info = BADGES.get(badge_id, {'emoji': '🏅', 'name': badge_id})
                 await query.answer(f"✅ Выдан значок: {badge_info['emoji']} {badge_info['name']}", show_alert=True)
                 
                 # Записываем операцию
-                with db.get_cursor() as cursor:
-                    cursor.execute('''
-                        INSERT INTO admin_operations 
-                        (admin_id, user_id, operation_type, badge_change, note)
-                        VALUES (?, ?, ?, ?, ?)
-                    ''', (admin_id, user_id, "give_badge", badge_id, f"Выдан значок: {badge_info['name']}"))
+                await adb.add_admin_operation(admin_id, user_id, "give_badge", badge_id,
+                                              f"Выдан значок: {badge_info['name']}")
                 
                 await show_user_profile(update, context, user_id)
             else:
@@ -2652,7 +5137,7 @@ async def quick_admin_action(update: Update, context: ContextTypes.DEFAULT_TYPE)
         # Блокировка пользователя
         user_id = int(data.replace("quick_ban_", ""))
         
-        user = db.get_user(user_id)
+        user = await adb.get_user(user_id)
         
         if user.get('is_banned'):
             await query.answer("❌ Пользователь уже заблокирован!", show_alert=True)
@@ -2700,19 +5185,7 @@ async def process_ban_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return ConversationHandler.END
     
     # Блокируем пользователя
-    with db.get_cursor() as cursor:
-        cursor.execute('''
-            UPDATE users 
-            SET is_banned = 1, ban_reason = ?
-            WHERE user_id = ?
-        ''', (reason, user_id))
-        
-        # Записываем операцию
-        cursor.execute('''
-            INSERT INTO admin_operations 
-            (admin_id, user_id, operation_type, note)
-            VALUES (?, ?, ?, ?)
-        ''', (admin_id, user_id, "ban_user", f"Блокировка: {reason}"))
+    await adb.ban_user(user_id, admin_id, reason)
     
     await update.message.reply_text(
         f"✅ <b>Пользователь заблокирован!</b>\n\nПричина: {reason}",
@@ -2736,8 +5209,8 @@ async def manage_drawings(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     # Получаем статистику розыгрышей
-    active_drawings = db.get_active_drawings()
-    finished_drawings = db.get_finished_drawings(limit=5)
+    active_drawings = await adb.get_active_drawings()
+    finished_drawings = await adb.get_finished_drawings(limit=5)
     
     text = f"""
 🎰 <b>УПРАВЛЕНИЕ РОЗЫГРЫШАМИ</b>
@@ -2746,7 +5219,7 @@ async def manage_drawings(update: Update, context: ContextTypes.DEFAULT_TYPE):
 📊 <b>Статистика розыгрышей:</b>
 🟢 Активных: <code>{len(active_drawings)}</code>
 🔴 Завершенных: <code>{len(finished_drawings)}</code>
-👥 Всего участников за все время: <code>{sum(len(d['participants']) for d in finished_drawings)}</code>
+👥 Всего участников за все время: <code>{sum(d['participants_count'] for d in finished_drawings)}</code>
 
 📋 <b>Активные розыгрыши:</b>
 """
@@ -2755,7 +5228,7 @@ async def manage_drawings(update: Update, context: ContextTypes.DEFAULT_TYPE):
         for drawing in active_drawings[:3]:
             time_left = datetime.fromisoformat(drawing['end_date']) - datetime.now()
             time_left_str = format_timedelta(time_left)
-            participants = len(drawing['participants'])
+            participants = drawing['participants_count']
             
             text += f"\n🎁 <b>{drawing['name']}</b>"
             text += f"\n⏰ Осталось: {time_left_str}"
@@ -2770,7 +5243,7 @@ async def manage_drawings(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if finished_drawings:
         for drawing in finished_drawings[:2]:
             winners_count = len(drawing['winners'])
-            participants = len(drawing['participants'])
+            participants = drawing['participants_count']
             
             text += f"\n🎁 <b>{drawing['name']}</b>"
             text += f"\n👑 Победителей: {winners_count}"
@@ -2846,7 +5319,7 @@ async def process_drawing_creation(update: Update, context: ContextTypes.DEFAULT
             return ADMIN_CREATE_DRAWING
         
         # Проверяем уникальность
-        existing = db.get_drawing(drawing_name=name)
+        existing = await adb.get_drawing(drawing_name=name)
         if existing:
             await update.message.reply_text("❌ Розыгрыш с таким названием уже существует!")
             return ADMIN_CREATE_DRAWING
@@ -3090,7 +5563,7 @@ async def process_drawing_creation(update: Update, context: ContextTypes.DEFAULT
         # Завершаем создание
         try:
             # Сохраняем розыгрыш в базу
-            drawing_id = db.create_drawing({
+            drawing_id = await adb.create_drawing({
                 'name': drawing_data['name'],
                 'description': drawing_data['description'],
                 'prize': drawing_data['prize'],
@@ -3202,16 +5675,24 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
     elif data == "past_winners":
         await show_past_winners(update, context)
     
+    elif data == "my_position":
+        await show_my_position(update, context)
+    
     # Админ-функции
     elif data == "admin_back_to_dashboard":
         await admin_dashboard(update, context)
     
     elif data == "admin_back_to_tasks":
+        # Администратор ушел из проверки - закрепленные за ним задания возвращаются в очередь
+        await adb.release_claims(update.effective_user.id)
         await check_tasks(update, context)
     
     elif data == "admin_refresh_tasks":
         await check_tasks(update, context)
     
+    elif data.startswith("admin_tasks_after_"):
+        await check_tasks(update, context, int(data.replace("admin_tasks_after_", "")))
+    
     elif data.startswith("admin_review_task_"):
         await review_task(update, context)
     
@@ -3221,8 +5702,34 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
     elif data.startswith("admin_reject_task_"):
         await reject_task_callback(update, context)
     
-    elif data == "admin_next_task":
-        await check_tasks(update, context)
+    elif data.startswith("admin_next_task_"):
+        await open_next_task(update, context, int(data.replace("admin_next_task_", "")))
+    
+    elif data == "admin_claim_next":
+        await open_next_task(update, context)
+    
+    elif data == "admin_batch_review":
+        await start_batch_review(update, context)
+    
+    elif data.startswith("admin_batch_toggle_"):
+        await toggle_batch_decision(update, context, int(data.replace("admin_batch_toggle_", "")))
+    
+    elif data == "admin_batch_all":
+        await toggle_batch_decision(update, context)
+    
+    elif data == "admin_batch_apply":
+        await apply_batch_review(update, context)
+    
+    elif data == "admin_broadcast_confirm":
+        await confirm_broadcast(update, context)
+    
+    elif data == "admin_broadcast_discard":
+        context.user_data.pop('broadcast_text', None)
+        await query.edit_message_reply_markup(reply_markup=None)
+        await query.message.reply_text("❌ Рассылка отменена.")
+    
+    elif data.startswith("admin_broadcast_stop_"):
+        await stop_broadcast(update, context, int(data.replace("admin_broadcast_stop_", "")))
     
     elif data == "admin_search_again":
         await search_user(update, context)
@@ -3268,7 +5775,7 @@ async def set_user_emoji(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     # Устанавливаем эмодзи
-    success = db.update_user_emoji(user_id, emoji, admin_id, f"Установлен эмодзи: {emoji}")
+    success = await adb.update_user_emoji(user_id, emoji, admin_id, f"Установлен эмодзи: {emoji}")
     
     if success:
         await query.answer(f"✅ Эмодзи {emoji} установлен!", show_alert=True)
@@ -3289,7 +5796,7 @@ async def clear_user_emoji(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     # Очищаем эмодзи
-    success = db.update_user_emoji(user_id, "", admin_id, "Эмодзи очищен")
+    success = await adb.update_user_emoji(user_id, "", admin_id, "Эмодзи очищен")
     
     if success:
         await query.answer("✅ Эмодзи очищен!", show_alert=True)
@@ -3303,7 +5810,7 @@ async def show_all_badges(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     user_id = update.effective_user.id
-    user = db.get_user(user_id)
+    user = await adb.get_user(user_id)
     
     if not user:
         await query.edit_message_text("❌ Пользователь не найден!")
@@ -3397,7 +5904,7 @@ async def show_past_winners(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    finished_drawings = db.get_finished_drawings(limit=10)
+    finished_drawings = await adb.get_finished_drawings(limit=10)
     
     if not finished_drawings:
         await query.edit_message_text(
@@ -3424,12 +5931,17 @@ async def show_past_winners(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 """
     
+    # Имена всех победителей загружаем одним запросом
+    winner_users = await adb.get_users_by_ids(
+        user_id for drawing in finished_drawings[:5] for user_id in drawing['winners'].values()
+    )
+    
     for drawing in finished_drawings[:5]:  # Показываем последние 5 розыгрышей
         name = drawing['name']
         prize = drawing['prize']
         end_date = format_date(drawing['end_date'])
         winners = drawing['winners']
-        participants = len(drawing['participants'])
+        participants = drawing['participants_count']
         
         text += f"\n🎁 <b>{name}</b>"
         text += f"\n🏆 Приз: {prize}"
@@ -3439,9 +5951,9 @@ async def show_past_winners(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if winners:
             text += "\n👑 Победители:\n"
             for place, user_id in winners.items():
-                user = db.get_user(user_id)
+                user = winner_users.get(user_id)
                 if user:
-                    display_name = user.get('nickname', f"ID:{user_id}")
+                    display_name = user['nickname'] or f"ID:{user_id}"
                     place_emoji = {
                         '1': '🥇',
                         '2': '🥈',
@@ -3469,12 +5981,60 @@ async def show_past_winners(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 # ========== ЗАПУСК БОТА ==========
+async def post_init(application: Application):
+    """Подготовка после инициализации бота"""
+    await adb.run(leaderboard.start)
+    activity.seed(await adb.get_recent_activity(datetime.now() - ActivityTracker.WINDOW))
+    notifier.start(application.bot)
+    await broadcaster.resume(application.bot)
+    outbox.start(application.bot)
+
+async def flush_activity(context: ContextTypes.DEFAULT_TYPE):
+    """Периодическая запись активности пользователей"""
+    await activity.flush()
+
+async def cleanup_old_records(context: ContextTypes.DEFAULT_TYPE):
+    """Периодическое удаление устаревших служебных записей"""
+    try:
+        pruned = await adb.prune_daily_counters()
+        logger.info(f"Удалено устаревших дневных счетчиков: {pruned}")
+        pruned = await adb.prune_outbox()
+        logger.info(f"Удалено обработанных уведомлений outbox: {pruned}")
+    except Exception as e:
+        logger.error(f"Ошибка очистки устаревших записей: {e}")
+
+async def send_error_summary(context: ContextTypes.DEFAULT_TYPE):
+    """Периодическая сводка ошибок для администраторов (если ошибки были)"""
+    total, entries = error_aggregator.take_summary()
+    if not total:
+        return
+    
+    text = f"""
+🐞 <b>СВОДКА ОШИБОК</b> за {ERROR_SUMMARY_INTERVAL // 60} мин: {total}
+"""
+    for entry, count in entries:
+        text += (f"\n<code>{entry['fingerprint']}</code> {html.escape(entry['type'])} × {count}"
+                 f" — <code>{html.escape(entry['location'])}</code>")
+    text += "\n\n💡 Подробнее: /errors"
+    
+    await notify_admins(context.bot, text)
+
+async def post_shutdown(application: Application):
+    """Освобождение ресурсов после остановки бота"""
+    await outbox.stop()
+    await broadcaster.stop()
+    admin_digest.flush_all()
+    await notifier.stop()
+    await activity.flush()
+    adb.close()
+    db.close()
+
 def main():
     """Основная функция запуска бота"""
     # Создаем Application
     application = ApplicationBuilder() \
         .token(BOT_TOKEN) \
-        .concurrent_updates(True) \
+        .concurrent_updates(update_processor) \
         .pool_timeout(30) \
         .connect_timeout(30) \
         .read_timeout(30) \
@@ -3483,6 +6043,8 @@ def main():
         .get_updates_read_timeout(30) \
         .get_updates_write_timeout(30) \
         .get_updates_pool_timeout(30) \
+        .post_init(post_init) \
+        .post_shutdown(post_shutdown) \
         .build()
     
     # ConversationHandler для отправки заданий
@@ -3522,8 +6084,10 @@ def main():
         entry_points=[
             MessageHandler(filters.Regex("^📋 Проверить задания$"), check_tasks),
             MessageHandler(filters.Regex("^👥 Управление$"), admin_dashboard),
+            MessageHandler(filters.Regex("^📊 Статистика$"), show_system_stats),
             MessageHandler(filters.Regex("^🎰 Управление розыгрышами$"), manage_drawings),
-            MessageHandler(filters.Regex("^🔍 Поиск участника$"), search_user)
+            MessageHandler(filters.Regex("^🔍 Поиск участника$"), search_user),
+            MessageHandler(filters.Regex("^📢 Рассылка$"), start_broadcast)
         ],
         states={
             ADMIN_REVIEW_TASK: [
@@ -3537,6 +6101,9 @@ def main():
             ],
             ADMIN_BAN_USER: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, process_ban_user)
+            ],
+            ADMIN_SEND_BROADCAST: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, process_broadcast_text)
             ]
         },
         fallbacks=[
@@ -3575,6 +6142,7 @@ def main():
     application.add_handler(CommandHandler("tasks", show_my_tasks))
     application.add_handler(CommandHandler("drawings", show_active_drawings))
     application.add_handler(CommandHandler("admin", admin_dashboard))
+    application.add_handler(CommandHandler("errors", show_errors))
     
     # Обработчики сообщений
     application.add_handler(MessageHandler(filters.Regex("^📊 Мой профиль$"), show_profile))
@@ -3598,6 +6166,12 @@ def main():
     # Обработчик ошибок
     application.add_error_handler(error_handler)
     
+    # Периодические задачи
+    application.job_queue.run_repeating(flush_activity, interval=ACTIVITY_FLUSH_SECONDS, first=ACTIVITY_FLUSH_SECONDS)
+    application.job_queue.run_repeating(send_error_summary, interval=ERROR_SUMMARY_INTERVAL,
+                                        first=ERROR_SUMMARY_INTERVAL)
+    application.job_queue.run_repeating(cleanup_old_records, interval=timedelta(days=1), first=timedelta(minutes=5))
+    
     # Запускаем бота
     if WEBHOOK_URL:
         # Webhook режим
@@ -3624,7 +6198,7 @@ async def start_task_submission(update: Update, context: ContextTypes.DEFAULT_TY
     user_id = update.effective_user.id
     
     # Проверяем, не заблокирован ли пользователь
-    user = db.get_user(user_id)
+    user = await adb.get_user(user_id)
     if user and user.get('is_banned'):
         await update.message.reply_text(
             f"""
@@ -3638,27 +6212,16 @@ async def start_task_submission(update: Update, context: ContextTypes.DEFAULT_TY
         )
         return ConversationHandler.END
     
-    # Проверяем дневной лимит заданий
-    today = datetime.now().strftime("%Y-%m-%d")
-    last_task_date = user.get('last_task_date')
-    
-    if last_task_date != today:
-        # Сбрасываем счетчик на новый день
-        db.save_user({
-            'user_id': user_id,
-            'daily_tasks_count': 0,
-            'last_task_date': today
-        })
-        user['daily_tasks_count'] = 0
-    
-    if user.get('daily_tasks_count', 0) >= 10:
+    # Проверяем дневной лимит заданий (окончательно квота списывается при создании задания)
+    daily = await adb.get_daily_counters(user_id)
+    if daily.get(DAILY_TOTAL_KEY, 0) >= DAILY_TASK_LIMIT:
         await update.message.reply_text(
-            """
+            f"""
 📊 <b>ДНЕВНОЙ ЛИМИТ ИСЧЕРПАН</b>
 
-Вы уже отправили 10 заданий сегодня.
+Вы уже отправили {DAILY_TASK_LIMIT} заданий сегодня.
 
-🔄 <b>Лимит сбросится:</b> в 00:00 по МСК
+🔄 <b>Лимит сбросится:</b> {DAILY_RESET_TEXT}
 
 🎯 <b>Что можно сделать:</b>
 • Проверьте свои отправленные задания
@@ -3686,13 +6249,15 @@ async def start_task_submission(update: Update, context: ContextTypes.DEFAULT_TY
 5. Задание будет отправлено на проверку
 
 📊 <b>Лимиты на сегодня:</b>
-• Всего заданий: 10 (осталось: {remaining})
-• Семейные контракты: {family_contracts}/10
+• Всего заданий: {limit} (осталось: {remaining})
+• Семейные контракты: {family_contracts}/{family_limit}
 
 🎯 <b>Выберите тип задания:</b>
         """.format(
-            remaining=10 - user.get('daily_tasks_count', 0),
-            family_contracts=user.get('daily_family_contracts', 0)
+            limit=DAILY_TASK_LIMIT,
+            remaining=DAILY_TASK_LIMIT - daily.get(DAILY_TOTAL_KEY, 0),
+            family_contracts=daily.get('family_contracts', 0),
+            family_limit=TASK_TYPES['family_contracts']['max_per_day']
         ),
         parse_mode=ParseMode.HTML,
         reply_markup=create_task_types_keyboard()
@@ -3716,24 +6281,21 @@ async def select_task_type(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data['task_type'] = task_type
     context.user_data['task_info'] = task_info
     
-    # Проверяем лимиты для этого типа задания
+    # Проверяем дневной лимит для этого типа задания
     user_id = query.from_user.id
-    today = datetime.now().strftime("%Y-%m-%d")
     
-    # Для семейных контрактов проверяем дневной лимит
-    if task_type == "family_contracts":
-        user = db.get_user(user_id)
-        family_contracts_today = user.get('daily_family_contracts', 0)
+    if task_info.get('max_per_day'):
+        done_today = (await adb.get_daily_counters(user_id)).get(task_type, 0)
         
-        if family_contracts_today >= task_info['max_per_day']:
+        if done_today >= task_info['max_per_day']:
             await query.edit_message_text(
                 f"""
 ❌ <b>ДНЕВНОЙ ЛИМИТ ДОСТИГНУТ</b>
 
-Вы уже выполнили {family_contracts_today} семейных контрактов сегодня.
+Вы уже выполнили {done_today} × «{task_info['name']}» сегодня.
 Максимум в день: {task_info['max_per_day']}
 
-🔄 <b>Лимит сбросится:</b> в 00:00 по МСК
+🔄 <b>Лимит сбросится:</b> {DAILY_RESET_TEXT}
 
 🎯 <b>Выберите другой тип задания:</b>
                 """,
@@ -3794,19 +6356,18 @@ async def process_task_count(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     task_type = context.user_data.get('task_type')
     
-    # Проверяем лимиты для семейных контрактов
-    if task_type == "family_contracts":
+    # Проверяем дневной лимит типа задания
+    if task_info.get('max_per_day'):
         user_id = update.effective_user.id
-        user = db.get_user(user_id)
-        family_contracts_today = user.get('daily_family_contracts', 0)
+        done_today = (await adb.get_daily_counters(user_id)).get(task_type, 0)
         
-        if family_contracts_today + count > task_info['max_per_day']:
-            available = task_info['max_per_day'] - family_contracts_today
+        if done_today + count > task_info['max_per_day']:
+            available = max(0, task_info['max_per_day'] - done_today)
             await update.message.reply_text(
                 f"""
 ❌ <b>ПРЕВЫШЕН ДНЕВНОЙ ЛИМИТ</b>
 
-Вы уже выполнили {family_contracts_today} семейных контрактов.
+Вы уже выполнили {done_today} × «{task_info['name']}».
 Максимум в день: {task_info['max_per_day']}
 Доступно еще: {available}
 
@@ -4009,18 +6570,6 @@ async def finalize_task_submission(update: Update, context: ContextTypes.DEFAULT
             await update.message.reply_text("❌ Ошибка: данные задания не найдены!")
         return ConversationHandler.END
     
-    # Проверяем лимиты для семейных контрактов
-    if task_type == "family_contracts":
-        user = db.get_user(user_id)
-        family_contracts_today = user.get('daily_family_contracts', 0) + count
-        
-        # Обновляем дневной счетчик семейных контрактов
-        db.save_user({
-            'user_id': user_id,
-            'daily_family_contracts': family_contracts_today,
-            'last_family_reset': datetime.now().isoformat()
-        })
-    
     # Создаем задание в базе данных
     task_data = {
         'user_id': user_id,
@@ -4032,18 +6581,27 @@ async def finalize_task_submission(update: Update, context: ContextTypes.DEFAULT
         'status': 'pending'
     }
     
-    task_id = db.create_task(task_data)
+    # Квота списывается в одной транзакции с созданием задания
+    task_id, queue_was_empty = await adb.create_task(task_data, consume_quota=True)
     
-    # Обновляем счетчик дневных заданий
-    today = datetime.now().strftime("%Y-%m-%d")
-    user = db.get_user(user_id)
-    daily_tasks = user.get('daily_tasks_count', 0) + 1
+    if not task_id:
+        for key in ['task_type', 'task_info', 'task_count', 'task_screenshot_path', 'task_comment']:
+            context.user_data.pop(key, None)
+        await update.effective_message.reply_text(
+            f"""
+📊 <b>ДНЕВНОЙ ЛИМИТ ИСЧЕРПАН</b>
+
+Задание не отправлено: лимит на сегодня уже использован
+(всего {DAILY_TASK_LIMIT} заданий, для «{task_info['name']}» - {task_info.get('max_per_day') or 'без лимита'}).
+
+🔄 <b>Лимит сбросится:</b> {DAILY_RESET_TEXT}
+            """,
+            parse_mode=ParseMode.HTML,
+            reply_markup=create_user_keyboard()
+        )
+        return ConversationHandler.END
     
-    db.save_user({
-        'user_id': user_id,
-        'daily_tasks_count': daily_tasks,
-        'last_task_date': today
-    })
+    daily = await adb.get_daily_counters(user_id)
     
     # Формируем текст подтверждения
     total_points = task_info['points'] * count
@@ -4061,18 +6619,21 @@ async def finalize_task_submission(update: Update, context: ContextTypes.DEFAULT
 📝 <b>Статус:</b> отправлено на модерацию
 
 📊 <b>Ваша статистика сегодня:</b>
-📋 Отправлено заданий: {daily_tasks}/10
-👨‍👩‍👧‍👦 Сем. контрактов: {user.get('daily_family_contracts', 0)}/10
+📋 Отправлено заданий: {daily.get(DAILY_TOTAL_KEY, 0)}/{DAILY_TASK_LIMIT}
+👨‍👩‍👧‍👦 Сем. контрактов: {daily.get('family_contracts', 0)}/{TASK_TYPES['family_contracts']['max_per_day']}
 
 ✨ <b>Следите за уведомлениями!</b>
 Администратор проверит ваше задание и начислит баллы.
     """
     
-    # Уведомляем администраторов
-    user_info = db.get_user(user_id)
-    nickname = user_info.get('nickname', 'Неизвестно')
-    
-    admin_notification = f"""
+    # Уведомляем администраторов: о задании в пустую очередь сразу, иначе через сводку
+    if ADMIN_DIGEST_ENABLED and not queue_was_empty:
+        admin_digest.add(context.bot, task_type, exclude_id=user_id)
+    else:
+        user_info = await adb.get_user(user_id)
+        nickname = user_info.get('nickname', 'Неизвестно')
+        
+        admin_notification = f"""
 📋 <b>НОВОЕ ЗАДАНИЕ НА ПРОВЕРКУ!</b>
 
 🎮 <b>Тип:</b> {task_info['emoji']} {task_info['name']}
@@ -4087,8 +6648,8 @@ async def finalize_task_submission(update: Update, context: ContextTypes.DEFAULT
 
 🚀 <b>Быстро проверить:</b> /check_tasks
     """
-    
-    await notify_admins(context.bot, admin_notification, exclude_id=user_id)
+        
+        await notify_admins(context.bot, admin_notification, exclude_id=user_id)
     
     # Отправляем подтверждение пользователю
     if 'query' in locals():
@@ -4186,7 +6747,7 @@ async def show_task_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def show_top_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показать топ-10 пользователей"""
-    top_users = db.get_top_users(limit=10)
+    top_users = leaderboard.top(10)
     
     if not top_users:
         await update.message.reply_text("📊 Рейтинг пока пуст. Будьте первым!")
@@ -4219,7 +6780,7 @@ async def show_top_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     text += f"""
     
-📊 <b>Всего участников в системе:</b> {len(db.get_top_users(limit=1000))}
+📊 <b>Всего участников в системе:</b> {format_number(len(leaderboard))}
 🕐 <b>Обновлено:</b> {datetime.now().strftime('%d.%m.%Y %H:%M')}
 
 🚀 <b>Поднимайтесь в рейтинге!</b>
@@ -4230,13 +6791,7 @@ async def show_top_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Добавляем кнопку "Моя позиция" если пользователь не в топ-10
     user_id = update.effective_user.id
-    user_position = None
-    
-    all_users = db.get_top_users(limit=1000)
-    for i, user in enumerate(all_users, 1):
-        if user['user_id'] == user_id:
-            user_position = i
-            break
+    user_position = leaderboard.rank(user_id)
     
     if user_position and user_position > 10:
         keyboard.append([
@@ -4255,11 +6810,45 @@ async def show_top_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
         disable_web_page_preview=True
     )
 
+async def show_my_position(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показать место пользователя и соседей по рейтингу"""
+    query = update.callback_query
+    user_id = update.effective_user.id
+    
+    neighbors = leaderboard.around(user_id, radius=2)
+    if not neighbors:
+        await query.answer("📊 Вы пока не участвуете в рейтинге", show_alert=True)
+        return
+    
+    text = f"""
+📊 <b>МОЯ ПОЗИЦИЯ В РЕЙТИНГЕ</b>
+══════════════════════════════
+
+🏆 Ваше место: <b>#{leaderboard.rank(user_id)}</b> из {format_number(len(leaderboard))}
+
+"""
+    
+    for position, user in neighbors:
+        display_name = f"{user.get('custom_emoji', '')} {user['nickname']}".strip()
+        line = f"#{position} {display_name} — <code>{format_number(user['points'])}</code>"
+        if user['user_id'] == user_id:
+            line = f"👉 <b>{line}</b>"
+        text += f"\n{line}"
+    
+    await query.edit_message_text(
+        text,
+        parse_mode=ParseMode.HTML,
+        reply_markup=InlineKeyboardMarkup([[
+            InlineKeyboardButton("🔙 В меню", callback_data="back_to_menu")
+        ]]),
+        disable_web_page_preview=True
+    )
+
 async def show_my_tasks(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показать задания пользователя"""
     user_id = update.effective_user.id
     
-    tasks = db.get_user_tasks(user_id, limit=20)
+    tasks = await adb.get_user_tasks(user_id, limit=20)
     
     if not tasks:
         await update.message.reply_text(
@@ -4370,7 +6959,7 @@ async def show_my_tasks(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def start_nickname_change(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Начало изменения никнейма"""
     user_id = update.effective_user.id
-    user = db.get_user(user_id)
+    user = await adb.get_user(user_id)
     
     current_nickname = user.get('nickname', 'Не установлен')
     
@@ -4432,10 +7021,7 @@ async def process_nickname_change(update: Update, context: ContextTypes.DEFAULT_
         return NICKNAME_SET
     
     # Обновляем никнейм в базе данных
-    db.save_user({
-        'user_id': user_id,
-        'nickname': new_nickname
-    })
+    await adb.patch_user(user_id, nickname=new_nickname)
     
     await update.message.reply_text(
         f"""
@@ -4508,74 +7094,52 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик ошибок"""
     logger.error(f"Exception while handling an update: {context.error}", exc_info=context.error)
     
-    try:
-        # Пытаемся уведомить пользователя об ошибке
-        if update and update.effective_chat:
-            await context.bot.send_message(
-                chat_id=update.effective_chat.id,
-                text="❌ Произошла ошибка при обработке вашего запроса. Пожалуйста, попробуйте позже."
-            )
-    except:
-        pass
+    # Пытаемся уведомить пользователя об ошибке
+    if isinstance(update, Update) and update.effective_chat:
+        notifier.submit(
+            context.bot, update.effective_chat.id,
+            "❌ Произошла ошибка при обработке вашего запроса. Пожалуйста, попробуйте позже.",
+            priority=NOTIFY_PRIORITY_HIGH
+        )
+    
+    # Одинаковые ошибки группируются, администраторы получают одно оповещение за интервал
+    entry, alert = error_aggregator.record(context.error, update)
+    if not alert:
+        return
     
-    # Уведомляем администраторов об ошибке
+    sample = entry['samples'][-1]
     error_message = f"""
-⚠️ <b>ОШИБКА В БОТЕ</b>
+⚠️ <b>ОШИБКА В БОТЕ</b> <code>{entry['fingerprint']}</code>
+
+🐞 <b>Тип:</b> {html.escape(entry['type'])}
+📍 <b>Место:</b> <code>{html.escape(entry['location'])}</code>
+🔢 <b>Всего:</b> {entry['count']} (с прошлого оповещения: {entry['since_alert']})
 
 📝 <b>Детали:</b>
-<code>{str(context.error)[:1000]}</code>
+<code>{html.escape(sample['message'])}</code>
 
 🔄 <b>Обновление:</b>
-<code>{update.to_dict() if update else 'Нет данных'}</code>
+<code>{html.escape(sample['update'])}</code>
+
+Повторы этой ошибки не будут приходить {ERROR_ALERT_INTERVAL // 60} мин. Подробнее: /errors {entry['fingerprint']}
     """
-    
-    for admin_id in ADMIN_IDS:
-        try:
-            await context.bot.send_message(
-                chat_id=admin_id,
-                text=error_message,
-                parse_mode=ParseMode.HTML
-            )
-        except:
-            pass
+    error_aggregator.alert_sent(entry)
+    await notify_admins(context.bot, error_message)
 
 # ========== ФУНКЦИИ ДЛЯ ПЛАНИРОВАНИЯ ЗАДАЧ ==========
 async def daily_reset(context: CallbackContext):
-    """Ежедневный сброс счетчиков"""
-    logger.info("Выполнение ежедневного сброса...")
+    """Ежедневные задачи. Дневные квоты не сбрасываются: счетчики привязаны
+    к номеру дня, строки прошлых дней удаляет cleanup_old_records"""
+    logger.info("Выполнение ежедневных задач...")
     
     try:
-        # Сбрасываем дневные счетчики у всех пользователей
-        with db.get_cursor() as cursor:
-            cursor.execute('''
-                UPDATE users 
-                SET daily_tasks_count = 0,
-                    daily_family_contracts = 0,
-                    last_family_reset = datetime('now')
-                WHERE last_task_date != DATE('now') OR last_task_date IS NULL
-            ''')
-            
-            logger.info(f"Сброшены счетчики для {cursor.rowcount} пользователей")
-        
         # Проверяем завершение розыгрышей
-        with db.get_cursor() as cursor:
-            cursor.execute('''
-                SELECT drawing_id, name, participants, min_participants, winners
-                FROM drawings 
-                WHERE status = 'active' 
-                AND datetime('now') > end_date
-            ''')
-            
-            expired_drawings = cursor.fetchall()
-            
-            for drawing in expired_drawings:
-                drawing_id, name, participants_json, min_participants, winners_json = drawing
-                participants = json.loads(participants_json) if participants_json else []
-                winners = json.loads(winners_json) if winners_json else {}
-                
-                if len(participants) >= min_participants and not winners:
-                    # Нужно провести розыгрыш
-                    await conduct_drawing(context.bot, drawing_id)
+        expired_drawings = await adb.get_expired_drawings()
+        
+        for drawing in expired_drawings:
+            if drawing['participants_count'] >= drawing['min_participants'] and not drawing['winners']:
+                # Нужно провести розыгрыш
+                await conduct_drawing(context.bot, drawing['drawing_id'])
         
     except Exception as e:
         logger.error(f"Ошибка при ежедневном сбросе: {e}")
@@ -4583,26 +7147,20 @@ async def daily_reset(context: CallbackContext):
 async def conduct_drawing(bot, drawing_id: int):
     """Провести розыгрыш"""
     try:
-        drawing = db.get_drawing(drawing_id=drawing_id)
+        drawing = await adb.get_drawing(drawing_id=drawing_id)
         if not drawing or drawing['status'] != 'active':
             return
         
-        participants = drawing['participants']
+        participants = await adb.get_drawing_participants(drawing_id)
         min_participants = drawing['min_participants']
         
         if len(participants) < min_participants:
-            # Недостаточно участников - отмена розыгрыша
-            with db.get_cursor() as cursor:
-                cursor.execute('''
-                    UPDATE drawings 
-                    SET status = 'cancelled'
-                    WHERE drawing_id = ?
-                ''', (drawing_id,))
-            
-            # Уведомляем участников
-            for user_id in participants:
-                await send_notification(bot, user_id, 
-                    f"❌ Розыгрыш '{drawing['name']}' отменен из-за недостаточного количества участников.")
+            # Недостаточно участников - отмена розыгрыша, участники уведомляются через outbox
+            cancel_text = f"❌ Розыгрыш '{drawing['name']}' отменен из-за недостаточного количества участников."
+            await adb.cancel_drawing(drawing_id, [
+                (user_id, cancel_text, f"drawing:{drawing_id}:cancelled:{user_id}") for user_id in participants
+            ])
+            outbox.wake()
             
             return
         
@@ -4614,10 +7172,8 @@ async def conduct_drawing(bot, drawing_id: int):
         for i, user_id in enumerate(winners_list, 1):
             winners[i] = user_id
         
-        # Сохраняем победителей
-        db.finish_drawing(drawing_id, winners)
-        
-        # Уведомляем победителей
+        # Уведомления победителям и участникам сохраняются вместе с результатом розыгрыша
+        notifications = []
         for place, user_id in winners.items():
             place_emoji = {
                 1: '🥇',
@@ -4625,7 +7181,7 @@ async def conduct_drawing(bot, drawing_id: int):
                 3: '🥉'
             }.get(place, '🎖️')
             
-            await send_notification(bot, user_id,
+            notifications.append((user_id,
                 f"""
 {place_emoji} <b>ПОЗДРАВЛЯЕМ! ВЫ ВЫИГРАЛИ В РОЗЫГРЫШЕ!</b>
 
@@ -4636,9 +7192,9 @@ async def conduct_drawing(bot, drawing_id: int):
 ✨ <b>Ваш приз будет отправлен в ближайшее время!</b>
 
 🎉 <b>Поздравляем с победой!</b>
-                """)
+                """, f"drawing:{drawing_id}:winner:{user_id}"))
         
-        # Уведомляем всех участников
+        # Текст для остальных участников
         notification_text = f"""
 🎉 <b>РОЗЫГРЫШ ЗАВЕРШЕН!</b>
 
@@ -4649,9 +7205,10 @@ async def conduct_drawing(bot, drawing_id: int):
 🏆 <b>Победители:</b>
 """
         
+        winner_users = await adb.get_users_by_ids(winners.values())
         for place, user_id in winners.items():
-            user = db.get_user(user_id)
-            nickname = user.get('nickname', f"ID:{user_id}")
+            user = winner_users.get(user_id)
+            nickname = (user and user['nickname']) or f"ID:{user_id}"
             place_emoji = {
                 1: '🥇',
                 2: '🥈',
@@ -4663,10 +7220,14 @@ async def conduct_drawing(bot, drawing_id: int):
         notification_text += f"\n\n🎁 <b>Приз:</b> {drawing['prize']}"
         notification_text += "\n\n🚀 <b>Участвуйте в следующих розыгрышах!</b>"
         
-        # Отправляем уведомление всем участникам
+        # Уведомление всем участникам
         for user_id in participants:
             if user_id not in winners_list:  # Не отправляем победителям повторно
-                await send_notification(bot, user_id, notification_text)
+                notifications.append((user_id, notification_text, f"drawing:{drawing_id}:result:{user_id}"))
+        
+        # Сохраняем победителей
+        await adb.finish_drawing(drawing_id, winners, notifications)
+        outbox.wake()
         
         # Уведомляем администраторов
         admin_notification = f"""
@@ -4687,9 +7248,6 @@ async def conduct_drawing(bot, drawing_id: int):
 
 # ========== ЗАПУСК ПРИЛОЖЕНИЯ ==========
 if __name__ == "__main__":
-    # Инициализация базы данных
-    db.init_db()
-    
     # Проверка переменных окружения
     if not BOT_TOKEN:
         logger.error("❌ BOT_TOKEN не установлен!")
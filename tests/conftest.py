@@ -0,0 +1,51 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# main.py при импорте открывает базу и bot.log в текущем каталоге - уводим их во временный
+_import_dir = tempfile.mkdtemp(prefix='bot-tests-')
+os.environ.setdefault('BOT_TOKEN', 'test-token')
+os.environ['DB_PATH'] = os.path.join(_import_dir, 'import.db')
+_cwd = os.getcwd()
+os.chdir(_import_dir)
+try:
+    import main
+finally:
+    os.chdir(_cwd)
+
+
+@pytest.fixture
+def open_database(monkeypatch):
+    """Открыть новый экземпляр Database (синглтона) на файле path; все открытые закрываются после теста"""
+    monkeypatch.setattr(main, 'DB_PATH', main.DB_PATH)
+    monkeypatch.setattr(main.Database, '_instance', None)
+    opened = []
+
+    def open_database(path):
+        main.DB_PATH = str(path)
+        main.Database._instance = None
+        opened.append(main.Database())
+        return opened[-1]
+
+    yield open_database
+    for database in opened:
+        database.close()
+
+
+@pytest.fixture
+def database(open_database, tmp_path):
+    """Чистая база во временном каталоге на каждый тест"""
+    return open_database(tmp_path / 'bot.db')
+
+
+@pytest.fixture
+def add_user(database):
+    def add_user(user_id, **fields):
+        database.save_user({'user_id': user_id, 'nickname': f'user{user_id}', **fields})
+        return user_id
+    return add_user
@@ -0,0 +1,37 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import main
+
+
+def test_save_user_does_not_touch_last_active(database, add_user):
+    seen = datetime(2026, 5, 1, 12, 0)
+    add_user(1, last_active=seen)
+
+    database.save_user({'user_id': 1, 'nickname': 'renamed'})
+
+    user = database.get_user(1)
+    assert user['nickname'] == 'renamed'
+    assert datetime.fromisoformat(user['last_active']) == seen
+
+
+def test_activity_is_flushed_in_one_batch(database, add_user, monkeypatch):
+    monkeypatch.setattr(main, 'adb', main.AsyncDatabase(database))
+    for user_id in (1, 2, 3):
+        add_user(user_id)
+    tracker = main.ActivityTracker()
+    now = datetime.now()
+    tracker.touch(1, now - timedelta(minutes=5))
+    tracker.touch(2, now)
+    tracker.touch(1, now)
+
+    writes = []
+    touch_users = database.touch_users
+    monkeypatch.setattr(database, 'touch_users', lambda activity: writes.append(activity) or touch_users(activity))
+    asyncio.run(tracker.flush())
+    asyncio.run(tracker.flush())
+
+    assert len(writes) == 1 and len(writes[0]) == 2
+    recent = dict(database.get_recent_activity(now - timedelta(minutes=1)))
+    assert recent == {1: now, 2: now}
+    assert tracker.count_active(timedelta(minutes=1)) == 2
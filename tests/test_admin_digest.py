@@ -0,0 +1,71 @@
+import asyncio
+
+import main
+
+
+class Bot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+
+
+def test_new_tasks_are_coalesced_per_admin(monkeypatch):
+    monkeypatch.setattr(main, 'ADMIN_IDS', [10, 20])
+    monkeypatch.setattr(main, 'notifier', main.NotificationDispatcher(workers=1, rate=1000, chat_interval=0))
+    bot = Bot()
+
+    async def scenario():
+        digest = main.AdminTaskDigest(window=0.05, max_tasks=3)
+        # Администратор 10 сам отправил первое задание - о нем ему не сообщаем
+        digest.add(bot, 'contracts', exclude_id=10)
+        digest.add(bot, 'contracts')
+        digest.add(bot, 'family_contracts')
+        # У администратора 20 набралось max_tasks - сводка ушла сразу
+        await asyncio.sleep(0)
+        assert digest.digests_sent == 1
+        assert list(digest._pending) == [10]
+
+        await asyncio.sleep(0.1)
+        await main.notifier.stop()
+        return digest
+
+    digest = asyncio.run(scenario())
+
+    assert digest.digests_sent == 2
+    assert digest.tasks_coalesced == 5
+    texts = dict(bot.sent)
+    assert 'НА ПРОВЕРКУ: 3' in texts[20]
+    assert 'НА ПРОВЕРКУ: 2' in texts[10]
+    assert '<code>2</code>' in texts[20] and '<code>1</code>' in texts[20]
+
+
+def test_flush_all_sends_pending_digests(monkeypatch):
+    monkeypatch.setattr(main, 'ADMIN_IDS', [10])
+    monkeypatch.setattr(main, 'notifier', main.NotificationDispatcher(workers=1, rate=1000, chat_interval=0))
+    bot = Bot()
+
+    async def scenario():
+        digest = main.AdminTaskDigest(window=60, max_tasks=50)
+        digest.add(bot, 'contracts')
+        digest.flush_all()
+        assert not digest._timers
+        await main.notifier.stop()
+
+    asyncio.run(scenario())
+    assert len(bot.sent) == 1
+
+
+def test_create_task_reports_first_pending(database, add_user):
+    add_user(1)
+
+    def submit():
+        return database.create_task({'user_id': 1, 'task_type': 'contracts', 'points': 1, 'status': 'pending'})
+
+    first, first_pending = submit()
+    assert first_pending
+    assert submit()[1] is False
+    # Очередь разобрана - следующее задание снова первое
+    database.reject_tasks(database.claim_task_batch(99, 5), 99, 'нет')
+    assert submit()[1] is True
@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+from telegram.error import Forbidden
+
+import main
+
+
+class Bot:
+    def __init__(self, blocked=()):
+        self.blocked = set(blocked)
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if chat_id in self.blocked:
+            raise Forbidden('Forbidden: bot was blocked by the user')
+        self.sent.append(chat_id)
+
+
+@pytest.fixture
+def engine(database, monkeypatch):
+    monkeypatch.setattr(main, 'adb', main.AsyncDatabase(database))
+    monkeypatch.setattr(main, 'notifier', main.NotificationDispatcher(workers=2, rate=1000, chat_interval=0))
+    monkeypatch.setattr(main, 'BROADCAST_BATCH_SIZE', 2)
+    return main.BroadcastEngine()
+
+
+def test_recipients_follow_the_cursor(database, add_user):
+    for user_id in (5, 1, 3, 2):
+        add_user(user_id)
+    add_user(4, is_banned=1)
+    database.mark_bot_blocked(3)
+
+    broadcast_id = database.create_broadcast(99, 'Привет')
+    assert database.get_broadcast(broadcast_id)['total'] == 3
+
+    assert database.get_broadcast_recipients(0, 2) == [1, 2]
+    database.checkpoint_broadcast(broadcast_id, 2, sent=2, failed=0, blocked=0)
+    broadcast = database.get_broadcast(broadcast_id)
+    assert database.get_broadcast_recipients(broadcast['last_user_id'], 2) == [5]
+
+    assert database.finish_broadcast(broadcast_id, 'cancelled')['status'] == 'cancelled'
+    # Повторно завершить уже остановленную рассылку нельзя
+    assert database.finish_broadcast(broadcast_id) is None
+    assert database.get_running_broadcasts() == []
+
+
+def test_broadcast_runs_to_completion(database, add_user, engine):
+    for user_id in range(1, 6):
+        add_user(user_id)
+    broadcast_id = database.create_broadcast(99, 'Новости')
+    bot = Bot(blocked={4})
+
+    async def scenario():
+        await engine._run(bot, broadcast_id)
+        await main.notifier.stop()
+
+    asyncio.run(scenario())
+
+    broadcast = database.get_broadcast(broadcast_id)
+    assert broadcast['status'] == 'finished'
+    assert (broadcast['sent'], broadcast['blocked'], broadcast['failed']) == (4, 1, 0)
+    assert broadcast['last_user_id'] == 5
+    assert sorted(bot.sent) == [1, 2, 3, 5]
+    # Заблокировавший бота выпадает из следующих рассылок
+    assert database.get_user(4)['bot_blocked'] == 1
+    assert database.get_broadcast_recipients(0, 10) == [1, 2, 3, 5]
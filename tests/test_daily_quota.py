@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta, timezone
+
+import main
+
+
+def submit(database, user_id, task_type='contracts', count=1):
+    task_id, _ = database.create_task({
+        'user_id': user_id,
+        'task_type': task_type,
+        'points': 1,
+        'count': count,
+        'status': 'pending',
+    }, consume_quota=True)
+    return task_id
+
+
+def count_tasks(database, user_id):
+    with database.read_cursor() as cursor:
+        cursor.execute('SELECT COUNT(*) FROM tasks WHERE user_id = ?', (user_id,))
+        return cursor.fetchone()[0]
+
+
+def test_daily_submission_limit(database, add_user):
+    user_id = add_user(1)
+
+    for _ in range(main.DAILY_TASK_LIMIT):
+        assert submit(database, user_id)
+
+    assert submit(database, user_id) is None
+    assert count_tasks(database, user_id) == main.DAILY_TASK_LIMIT
+    assert database.get_daily_counters(user_id) == {
+        main.DAILY_TOTAL_KEY: main.DAILY_TASK_LIMIT, 'contracts': main.DAILY_TASK_LIMIT
+    }
+
+
+def test_type_limit_counts_executions(database, add_user):
+    user_id = add_user(1)
+    limit = main.TASK_TYPES['family_contracts']['max_per_day']
+
+    assert submit(database, user_id, 'family_contracts', count=limit - 3)
+    # Отказ не списывает квоту и не создает задание
+    assert submit(database, user_id, 'family_contracts', count=4) is None
+    assert submit(database, user_id, 'family_contracts', count=3)
+    assert submit(database, user_id, 'family_contracts') is None
+    # Лимит типа не мешает другим типам
+    assert submit(database, user_id, 'contracts')
+
+    assert count_tasks(database, user_id) == 3
+    assert database.get_daily_counters(user_id) == {
+        main.DAILY_TOTAL_KEY: 3, 'family_contracts': limit, 'contracts': 1
+    }
+
+
+def test_previous_day_counters_are_ignored(database, add_user):
+    user_id = add_user(1)
+
+    def exhaust_yesterday(db, cursor):
+        cursor.execute(
+            'INSERT INTO user_daily_counters (user_id, day, task_type, count) VALUES (?, ?, ?, ?)',
+            (user_id, main.day_number() - 1, main.DAILY_TOTAL_KEY, main.DAILY_TASK_LIMIT)
+        )
+    database.submit_write(exhaust_yesterday).result()
+
+    assert database.try_consume_quota(user_id, 'contracts') == {main.DAILY_TOTAL_KEY: 1, 'contracts': 1}
+
+
+def test_prune_daily_counters(database, add_user):
+    user_id = add_user(1)
+    submit(database, user_id)
+
+    def add_old_counters(db, cursor):
+        cursor.execute(
+            'INSERT INTO user_daily_counters (user_id, day, task_type, count) VALUES (?, ?, ?, 1)',
+            (user_id, main.day_number() - 30, main.DAILY_TOTAL_KEY)
+        )
+        cursor.execute("INSERT INTO system_counters (name, value) VALUES ('tasks_day:2000-01-01', 5)")
+    database.submit_write(add_old_counters).result()
+
+    assert database.prune_daily_counters() == 2
+    assert database.get_daily_counters(user_id) == {main.DAILY_TOTAL_KEY: 1, 'contracts': 1}
+    assert database.get_system_stats()['today_tasks'] == 1
+
+
+def test_day_boundary_is_utc_midnight():
+    moscow = timezone(timedelta(hours=3))
+    # 02:30 по Москве 2 января - еще 1 января по UTC
+    assert main.day_number(datetime(2026, 1, 2, 2, 30, tzinfo=moscow)) == main.day_number(datetime(2026, 1, 1, 12))
+    assert main.day_number(datetime(2026, 1, 2, 3, 0, tzinfo=moscow)) == main.day_number(datetime(2026, 1, 2))
+
+
+def test_day_number_matches_sqlite_date(database):
+    with database.read_cursor() as cursor:
+        cursor.execute("SELECT CAST(julianday(date('now')) - julianday('1970-01-01') AS INTEGER)")
+        assert cursor.fetchone()[0] == main.day_number()
+
+
+def test_quota_resets_at_utc_midnight(database, add_user, monkeypatch):
+    user_id = add_user(1)
+    monkeypatch.setattr(main, 'utc_now', lambda: datetime(2026, 3, 1, 23, 59, 59, tzinfo=timezone.utc))
+    for _ in range(main.DAILY_TASK_LIMIT):
+        assert submit(database, user_id)
+    assert submit(database, user_id) is None
+
+    monkeypatch.setattr(main, 'utc_now', lambda: datetime(2026, 3, 2, 0, 0, 0, tzinfo=timezone.utc))
+    assert database.get_daily_counters(user_id) == {}
+    assert submit(database, user_id)
+    assert database.get_daily_counters(user_id) == {main.DAILY_TOTAL_KEY: 1, 'contracts': 1}
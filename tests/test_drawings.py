@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+
+
+def create_drawing(database, name='Розыгрыш', max_participants=100, entry_cost=0):
+    return database.create_drawing({
+        'name': name,
+        'prize': 'Приз',
+        'start_date': datetime.now() - timedelta(days=1),
+        'end_date': datetime.now() + timedelta(days=1),
+        'status': 'active',
+        'max_participants': max_participants,
+        'entry_cost': entry_cost,
+    })
+
+
+def test_participants_get_sequential_tickets(database, add_user):
+    drawing_id = create_drawing(database)
+    for user_id in (1, 2, 3):
+        add_user(user_id)
+
+    tickets = [database.add_drawing_participant(drawing_id, user_id)['ticket_number'] for user_id in (3, 1, 2)]
+
+    assert tickets == [1, 2, 3]
+    assert database.get_drawing_participants(drawing_id) == [3, 1, 2]
+    assert database.get_participant_ticket(drawing_id, 2) == 3
+    assert database.get_drawing(drawing_id=drawing_id)['participants_count'] == 3
+
+
+def test_repeated_participation_is_refused(database, add_user):
+    drawing_id = create_drawing(database)
+    add_user(1)
+
+    assert database.add_drawing_participant(drawing_id, 1)['ticket_number'] == 1
+    assert database.add_drawing_participant(drawing_id, 1) is None
+    assert database.get_drawing_participants(drawing_id) == [1]
+    assert database.get_drawing(drawing_id=drawing_id)['participants_count'] == 1
+
+
+def test_participation_limited_by_max_participants(database, add_user):
+    drawing_id = create_drawing(database, max_participants=2)
+    for user_id in (1, 2, 3):
+        add_user(user_id)
+
+    assert database.add_drawing_participant(drawing_id, 1)
+    assert database.add_drawing_participant(drawing_id, 2)
+    assert database.add_drawing_participant(drawing_id, 3) is None
+    assert database.get_participant_ticket(drawing_id, 3) is None
+    assert database.get_drawing(drawing_id=drawing_id)['participants_count'] == 2
+
+
+def test_entry_cost_is_charged_once(database, add_user):
+    drawing_id = create_drawing(database, entry_cost=30)
+    add_user(1, total_points=50)
+    add_user(2, total_points=10)
+
+    assert database.add_drawing_participant(drawing_id, 1)['balance'] == 20
+    assert database.add_drawing_participant(drawing_id, 1) is None
+    # Не хватает баллов - участие не записывается
+    assert database.add_drawing_participant(drawing_id, 2) is None
+    assert database.get_user(1)['total_points'] == 20
+    assert database.get_user(2)['total_points'] == 10
+    assert database.get_drawing_participants(drawing_id) == [1]
@@ -0,0 +1,64 @@
+from datetime import timedelta
+
+import main
+
+
+def raise_key_error():
+    return {}['missing']
+
+
+def raise_value_error():
+    raise ValueError('bad value')
+
+
+def caught(func):
+    try:
+        func()
+    except Exception as e:
+        return e
+
+
+def test_same_error_is_grouped_and_alerts_are_rate_limited():
+    aggregator = main.ErrorAggregator(alert_interval=600, samples=2)
+
+    first, alert = aggregator.record(caught(raise_key_error), 'first')
+    assert alert
+    aggregator.alert_sent(first)
+    for i in range(3):
+        entry, alert = aggregator.record(caught(raise_key_error), f'again {i}')
+        assert entry is first and not alert
+
+    assert first['count'] == 4 and first['since_alert'] == 3
+    assert first['type'] == 'KeyError'
+    assert 'raise_key_error' in first['location']
+    assert [sample['update'] for sample in first['samples']] == ['again 1', 'again 2']
+
+    # Другая ошибка - другой отпечаток и свое оповещение
+    other, alert = aggregator.record(caught(raise_value_error))
+    assert alert and other['fingerprint'] != first['fingerprint']
+    assert aggregator.get(first['fingerprint']) is first
+    assert [entry['type'] for entry in aggregator.top()] == ['KeyError', 'ValueError']
+
+    # После интервала оповещение разрешено снова
+    first['last_alert'] -= timedelta(seconds=601)
+    assert aggregator.record(caught(raise_key_error))[1]
+
+
+def test_summary_counts_since_previous_summary():
+    aggregator = main.ErrorAggregator()
+    for _ in range(3):
+        aggregator.record(caught(raise_key_error))
+    aggregator.record(caught(raise_value_error))
+
+    total, entries = aggregator.take_summary()
+    assert total == 4
+    assert [(entry['type'], count) for entry, count in entries] == [('KeyError', 3), ('ValueError', 1)]
+    assert aggregator.take_summary() == (0, [])
+
+
+def test_oldest_fingerprint_is_evicted():
+    aggregator = main.ErrorAggregator(max_fingerprints=1)
+    first, _ = aggregator.record(caught(raise_key_error))
+    aggregator.record(caught(raise_value_error))
+    assert aggregator.get(first['fingerprint']) is None
+    assert [entry['type'] for entry in aggregator.top()] == ['ValueError']
@@ -0,0 +1,83 @@
+import sqlite3
+
+import pytest
+
+import main
+
+
+def insert_user(db, cursor, user_id):
+    cursor.execute('INSERT INTO users (user_id, nickname) VALUES (?, ?)', (user_id, f'user{user_id}'))
+    db._user_changed(user_id)
+    return user_id
+
+
+def insert_and_fail(db, cursor, user_id):
+    insert_user(db, cursor, user_id)
+    raise ValueError('boom')
+
+
+def user_ids(database):
+    with database.read_cursor() as cursor:
+        cursor.execute('SELECT user_id FROM users ORDER BY user_id')
+        return [row[0] for row in cursor.fetchall()]
+
+
+@pytest.fixture
+def slow_commit(monkeypatch):
+    # Широкое окно, чтобы все операции теста попали в один групповой коммит
+    monkeypatch.setattr(main, 'DB_GROUP_COMMIT_MS', 200)
+
+
+def test_batch_is_committed_in_one_transaction(slow_commit, database):
+    assert database.group_commit
+    commits = []
+    database.conn.set_trace_callback(lambda sql: commits.append(sql) if sql == 'COMMIT' else None)
+
+    futures = [database.submit_write(insert_user, user_id) for user_id in (1, 2, 3)]
+
+    assert [future.result(timeout=5) for future in futures] == [1, 2, 3]
+    assert user_ids(database) == [1, 2, 3]
+    assert len(commits) == 1
+
+
+def test_failed_operation_rolls_back_only_its_savepoint(slow_commit, database):
+    notified = []
+    database.add_user_listener(lambda ids: notified.extend(sorted(ids)))
+
+    first = database.submit_write(insert_user, 1)
+    failing = database.submit_write(insert_and_fail, 2)
+    last = database.submit_write(insert_user, 3)
+
+    assert first.result(timeout=5) == 1
+    with pytest.raises(ValueError):
+        failing.result(timeout=5)
+    assert last.result(timeout=5) == 3
+    assert user_ids(database) == [1, 3]
+    # Пользователи отмененной операции не попадают в уведомления об изменениях
+    assert notified == [1, 3]
+
+
+def test_constraint_error_does_not_break_batch(slow_commit, database):
+    first = database.submit_write(insert_user, 1)
+    duplicate = database.submit_write(insert_user, 1)
+    other = database.submit_write(insert_user, 2)
+
+    assert first.result(timeout=5) == 1
+    with pytest.raises(sqlite3.IntegrityError):
+        duplicate.result(timeout=5)
+    assert other.result(timeout=5) == 2
+    assert user_ids(database) == [1, 2]
+
+
+@pytest.fixture
+def no_group_commit(monkeypatch):
+    monkeypatch.setattr(main, 'DB_GROUP_COMMIT_MS', 0)
+
+
+def test_synchronous_write_without_group_commit(no_group_commit, database):
+    assert not database.group_commit
+
+    assert database.submit_write(insert_user, 1).result() == 1
+    with pytest.raises(ValueError):
+        database.submit_write(insert_and_fail, 2).result()
+    assert user_ids(database) == [1]
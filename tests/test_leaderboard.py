@@ -0,0 +1,84 @@
+import random
+import time
+
+import main
+
+
+def query_plan(database, sql, params):
+    with database.read_cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return ' '.join(row[-1] for row in cursor.fetchall())
+
+
+def test_sql_rank_matches_leaderboard(database, add_user):
+    add_user(1, total_points=100)
+    add_user(2, total_points=50)
+    add_user(3, total_points=100)
+    add_user(4, total_points=70, is_banned=1)
+    add_user(5)
+    leaderboard = main.Leaderboard(database)
+    leaderboard.load()
+
+    ranks = {user_id: database.get_user_rank(user_id) for user_id in range(1, 7)}
+    assert ranks == {1: 1, 3: 2, 2: 3, 5: 4, 4: None, 6: None}
+    assert ranks == {user_id: leaderboard.rank(user_id) for user_id in range(1, 7)}
+    assert database.count_ranked_users() == len(leaderboard) == 4
+
+
+def test_rank_and_search_use_points_indexes(database):
+    rank_plan = query_plan(database, 'SELECT COUNT(*) FROM users WHERE is_banned = 0 AND total_points > ?', (10,))
+    assert 'idx_users_rank' in rank_plan
+
+    search_plan = query_plan(database, '''
+        SELECT user_id FROM users WHERE nickname LIKE ? OR username LIKE ?
+        ORDER BY total_points DESC LIMIT 10
+    ''', ('%ab%', '%ab%'))
+    assert 'idx_users_points' in search_plan
+    assert 'TEMP B-TREE' not in search_plan
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'рейтинг не обновился'
+        time.sleep(0.01)
+
+
+def test_refresher_starts_with_the_bot_not_at_import(database, add_user):
+    assert main.leaderboard._sync_thread is None
+
+    add_user(1, total_points=10)
+    add_user(2, total_points=20)
+    leaderboard = main.Leaderboard(database)
+    database.update_user_points(1, 50)
+    # До start() рейтинг не подписан на изменения и пуст
+    assert len(leaderboard) == 0 and not leaderboard._stale
+
+    leaderboard.start()
+    assert leaderboard.rank(1) == 1
+
+    database.update_user_points(2, 100)
+    wait_for(lambda: leaderboard.rank(2) == 1)
+    assert [entry['user_id'] for entry in leaderboard.top(2)] == [2, 1]
+
+
+def test_ranks_stay_consistent_after_many_updates(database, add_user):
+    rng = random.Random(7)
+    for user_id in range(1, 201):
+        add_user(user_id, total_points=rng.randrange(50))
+    leaderboard = main.Leaderboard(database)
+    leaderboard.load()
+
+    changed = rng.sample(range(1, 201), 60)
+    for user_id in changed:
+        database.update_user_points(user_id, rng.randrange(-20, 20))
+    database.ban_user(changed[0], 99, 'тест')
+    leaderboard._refresh(changed)
+
+    assert len(leaderboard) == database.count_ranked_users()
+    for user_id in range(1, 201):
+        assert leaderboard.rank(user_id) == database.get_user_rank(user_id)
+    assert leaderboard.rank(changed[0]) is None
+    places = [place for place, _ in leaderboard.around(changed[1], radius=2)]
+    assert leaderboard.rank(changed[1]) in places
+    assert places == list(range(places[0], places[0] + len(places)))
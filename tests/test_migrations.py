@@ -0,0 +1,165 @@
+import sqlite3
+from datetime import date, timedelta
+
+import main
+
+# Схема базы до оптимизаций (как ее создавала первая версия бота)
+BASELINE_SCHEMA = '''
+CREATE TABLE users (
+    user_id INTEGER PRIMARY KEY,
+    username TEXT,
+    nickname TEXT,
+    first_name TEXT,
+    last_name TEXT,
+    total_points INTEGER DEFAULT 0,
+    badges TEXT DEFAULT '[]',
+    custom_emoji TEXT DEFAULT '',
+    daily_family_contracts INTEGER DEFAULT 0,
+    last_family_reset TIMESTAMP,
+    join_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_active TIMESTAMP,
+    tasks_completed INTEGER DEFAULT 0,
+    tasks_pending INTEGER DEFAULT 0,
+    tasks_rejected INTEGER DEFAULT 0,
+    is_banned BOOLEAN DEFAULT 0,
+    ban_reason TEXT DEFAULT '',
+    daily_tasks_count INTEGER DEFAULT 0,
+    last_task_date DATE,
+    settings TEXT DEFAULT '{}',
+    drawings_won INTEGER DEFAULT 0,
+    last_drawing_win TIMESTAMP
+);
+CREATE TABLE tasks (
+    task_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    task_type TEXT NOT NULL,
+    points INTEGER NOT NULL,
+    count INTEGER DEFAULT 1,
+    screenshot_path TEXT,
+    comment TEXT,
+    status TEXT DEFAULT 'pending',
+    drawing_name TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    reviewed_at TIMESTAMP,
+    reviewed_by INTEGER,
+    rejection_reason TEXT,
+    FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE
+);
+CREATE TABLE admin_operations (
+    operation_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    admin_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    operation_type TEXT NOT NULL,
+    points_change INTEGER DEFAULT 0,
+    badge_change TEXT,
+    emoji_change TEXT,
+    note TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE drawings (
+    drawing_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE,
+    description TEXT,
+    prize TEXT NOT NULL,
+    start_date TIMESTAMP NOT NULL,
+    end_date TIMESTAMP NOT NULL,
+    status TEXT DEFAULT 'announced',
+    min_participants INTEGER DEFAULT 5,
+    max_participants INTEGER DEFAULT 100,
+    entry_cost INTEGER DEFAULT 0,
+    required_badges TEXT DEFAULT '[]',
+    participants TEXT DEFAULT '[]',
+    winners TEXT DEFAULT '{}',
+    ticket_numbers TEXT DEFAULT '{}',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE drawing_participations (
+    participation_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    drawing_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    ticket_number INTEGER,
+    participated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    won_place INTEGER DEFAULT 0,
+    FOREIGN KEY (drawing_id) REFERENCES drawings (drawing_id),
+    FOREIGN KEY (user_id) REFERENCES users (user_id)
+);
+CREATE INDEX idx_users_points ON users(total_points DESC);
+CREATE INDEX idx_users_nickname ON users(nickname);
+CREATE INDEX idx_tasks_status ON tasks(status);
+CREATE INDEX idx_tasks_user_date ON tasks(user_id, created_at DESC);
+CREATE INDEX idx_drawings_status ON drawings(status);
+CREATE INDEX idx_drawings_dates ON drawings(start_date, end_date);
+'''
+
+
+def create_baseline_database(path):
+    # Дневные счетчики считаются по UTC
+    today = date(1970, 1, 1) + timedelta(days=main.day_number())
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.executemany('''
+        INSERT INTO users (user_id, nickname, total_points, daily_tasks_count, daily_family_contracts,
+                           last_task_date, last_family_reset)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', [
+        (1, 'today', 100, 3, 2, today.isoformat(), today.isoformat() + 'T12:00:00'),
+        (2, 'yesterday', 50, 5, 4, (today - timedelta(days=1)).isoformat(),
+         (today - timedelta(days=1)).isoformat() + 'T12:00:00'),
+    ])
+    conn.execute("INSERT INTO tasks (user_id, task_type, points) VALUES (1, 'contracts', 10)")
+    conn.execute('''
+        INSERT INTO drawings (drawing_id, name, prize, start_date, end_date, status)
+        VALUES (1, 'Старый розыгрыш', 'Приз', datetime('now', '-1 day'), datetime('now', '+1 day'), 'active')
+    ''')
+    # Старая схема допускала повторное участие
+    conn.executemany(
+        'INSERT INTO drawing_participations (drawing_id, user_id, ticket_number) VALUES (1, ?, ?)',
+        [(1, 1), (2, 2), (1, 3)]
+    )
+    conn.commit()
+    conn.close()
+
+
+def index_names(database):
+    with database.read_cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+        return {row[0] for row in cursor.fetchall()}
+
+
+def test_migrate_baseline_database(open_database, tmp_path):
+    path = tmp_path / 'baseline.db'
+    create_baseline_database(path)
+
+    database = open_database(path)
+
+    # Дневные счетчики: действуют только сегодняшние значения
+    assert database.get_daily_counters(1) == {main.DAILY_TOTAL_KEY: 3, 'family_contracts': 2}
+    assert database.get_daily_counters(2) == {}
+
+    # Участие: дубликаты удалены, повторное участие запрещено индексом
+    assert sorted(database.get_drawing_participants(1)) == [1, 2]
+    assert database.get_drawing(drawing_id=1)['participants_count'] == 2
+    assert 'idx_participations_drawing_user' in index_names(database)
+    assert database.add_drawing_participant(1, 1) is None
+
+    # Счетчики панели администратора посчитаны по существующим данным
+    stats = database.get_system_stats()
+    assert stats['total_users'] == 2
+    assert stats['pending_tasks'] == 1
+    assert stats['active_drawings'] == 1
+    assert stats['total_points'] == 150
+
+    assert 'idx_tasks_status' not in index_names(database)
+    assert {'idx_users_points', 'idx_users_rank'} <= index_names(database)
+
+
+def test_migration_is_idempotent(open_database, tmp_path):
+    path = tmp_path / 'baseline.db'
+    create_baseline_database(path)
+    open_database(path).close()
+
+    database = open_database(path)
+
+    assert database.get_daily_counters(1) == {main.DAILY_TOTAL_KEY: 3, 'family_contracts': 2}
+    assert database.get_drawing(drawing_id=1)['participants_count'] == 2
+    assert database.get_system_stats()['pending_tasks'] == 1
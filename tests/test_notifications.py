@@ -0,0 +1,103 @@
+import asyncio
+
+from telegram.error import BadRequest, NetworkError
+
+import main
+
+
+class RecordingBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+
+
+def test_high_priority_goes_before_bulk():
+    async def scenario():
+        bot = RecordingBot()
+        notifier = main.NotificationDispatcher(workers=1, rate=1000, chat_interval=0)
+        futures = [
+            notifier.submit(bot, 1, 'bulk 1'),
+            notifier.submit(bot, 2, 'bulk 2'),
+            notifier.submit(bot, 3, 'answer', priority=main.NOTIFY_PRIORITY_HIGH),
+            notifier.submit(bot, 4, 'bulk 3'),
+        ]
+        await asyncio.gather(*futures)
+        await notifier.stop()
+
+        assert [text for _, text in bot.sent] == ['answer', 'bulk 1', 'bulk 2', 'bulk 3']
+        assert notifier.stats()['sent'] == 4
+        assert not notifier.running
+
+    asyncio.run(scenario())
+
+
+class HangingBot:
+    """Telegram не отвечает: отправка висит до отмены"""
+
+    def __init__(self):
+        self.attempts = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.attempts += 1
+        await asyncio.Event().wait()
+
+
+def test_stop_fails_undelivered_messages_on_timeout():
+    async def scenario():
+        bot = HangingBot()
+        notifier = main.NotificationDispatcher(workers=1, rate=1000, chat_interval=0)
+        futures = [notifier.submit(bot, chat_id, 'text') for chat_id in (1, 2, 3)]
+        await asyncio.sleep(0.01)
+
+        await notifier.stop(timeout=0.05)
+
+        # Одно сообщение было в отправке, два ждали в очереди - все завершены отказом
+        assert bot.attempts == 1
+        assert [future.result() for future in futures] == [main.DELIVERY_FAILED] * 3
+        assert notifier.stats() == {'queued': 0, 'sent': 0, 'failed': 3, 'blocked': 0, 'retried': 0}
+        assert not notifier.running
+
+    asyncio.run(scenario())
+
+
+def test_stop_flushes_delayed_retries():
+    class FlakyBot(RecordingBot):
+        async def send_message(self, chat_id, text, **kwargs):
+            if not self.sent and not getattr(self, 'failed_once', False):
+                self.failed_once = True
+                raise NetworkError('connection reset')
+            await super().send_message(chat_id, text, **kwargs)
+
+    async def scenario():
+        bot = FlakyBot()
+        notifier = main.NotificationDispatcher(workers=1, rate=1000, chat_interval=0)
+        future = notifier.submit(bot, 1, 'text')
+        await asyncio.sleep(0.01)
+        # Повтор отложен на секунды, stop() отправляет его сразу
+        assert notifier.stats()['retried'] == 1
+
+        await notifier.stop(timeout=1)
+        assert future.result() == main.DELIVERY_SENT
+        assert bot.sent == [(1, 'text')]
+
+    asyncio.run(scenario())
+
+
+def test_send_notification_waits_for_delivery(monkeypatch):
+    class RejectingBot(RecordingBot):
+        async def send_message(self, chat_id, text, **kwargs):
+            if chat_id == 2:
+                raise BadRequest('Chat not found')
+            await super().send_message(chat_id, text, **kwargs)
+
+    async def scenario():
+        monkeypatch.setattr(main, 'notifier', main.NotificationDispatcher(workers=1, rate=1000, chat_interval=0))
+        bot = RejectingBot()
+        assert await main.send_notification(bot, 1, '<b>text</b>', priority=main.NOTIFY_PRIORITY_HIGH)
+        assert not await main.send_notification(bot, 2, 'text')
+        await main.notifier.stop()
+        assert bot.sent == [(1, '<b>text</b>')]
+
+    asyncio.run(scenario())
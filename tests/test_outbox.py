@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+from telegram.error import BadRequest, Forbidden
+
+import main
+
+
+class Bot:
+    def __init__(self, errors=None):
+        self.errors = errors or {}
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if chat_id in self.errors:
+            raise self.errors[chat_id]
+        self.sent.append((chat_id, text))
+
+
+@pytest.fixture
+def worker(database, monkeypatch):
+    monkeypatch.setattr(main, 'adb', main.AsyncDatabase(database))
+    monkeypatch.setattr(main, 'notifier', main.NotificationDispatcher(workers=2, rate=1000, chat_interval=0))
+    return main.OutboxWorker()
+
+
+def deliver(worker, bot):
+    """Один проход воркера: забрать пачку, отправить, записать итоги"""
+    async def scenario():
+        worker._bot = bot
+        messages = await main.adb.claim_outbox(worker.batch_size)
+        if messages:
+            await worker._send(messages)
+        await main.notifier.stop()
+        return messages
+
+    return asyncio.run(scenario())
+
+
+def submit_task(database, user_id):
+    task_id, _ = database.create_task({
+        'user_id': user_id, 'task_type': 'contracts', 'points': 5, 'count': 1, 'status': 'pending'
+    })
+    return task_id
+
+
+def outbox_rows(database):
+    with database.read_cursor() as cursor:
+        cursor.execute('SELECT chat_id, status, attempts FROM outbox ORDER BY outbox_id')
+        return [tuple(row) for row in cursor.fetchall()]
+
+
+def test_review_notifications_go_through_outbox(database, add_user, worker):
+    for user_id in (1, 2, 3):
+        add_user(user_id)
+    approved = submit_task(database, 1)
+    database.approve_task(approved, 99, notify=main.task_approved_message)
+    # Повтор одобрения не добавляет второе уведомление
+    database.approve_task(approved, 99, notify=main.task_approved_message)
+    database.reject_task(submit_task(database, 2), 99, 'нет скриншота', notify=main.task_rejected_message)
+    database.approve_task(submit_task(database, 3), 99, notify=main.task_approved_message)
+    assert database.get_outbox_stats() == {'pending': 3}
+
+    bot = Bot(errors={
+        2: BadRequest('Chat not found'),
+        3: Forbidden('Forbidden: bot was blocked by the user'),
+    })
+    assert len(deliver(worker, bot)) == 3
+
+    assert [chat_id for chat_id, _ in bot.sent] == [1]
+    assert 'ОДОБРЕНО' in bot.sent[0][1]
+    # Неудачная отправка отложена, заблокировавшему бота больше не пишем
+    assert outbox_rows(database) == [(1, 'sent', 1), (2, 'pending', 1), (3, 'blocked', 1)]
+    assert deliver(worker, Bot()) == []
+
+
+def test_stale_sending_rows_are_claimed_again(database, add_user):
+    add_user(1)
+    database.approve_task(submit_task(database, 1), 99, notify=main.task_approved_message)
+
+    assert len(database.claim_outbox(10)) == 1
+    assert database.claim_outbox(10) == []
+
+    def expire_lease(db, cursor):
+        cursor.execute("UPDATE outbox SET locked_at = datetime('now', '-1 hour')")
+    database.submit_write(expire_lease).result()
+
+    assert [message['attempts'] for message in database.claim_outbox(10)] == [2]
+
+
+def test_prune_keeps_undelivered(database, add_user):
+    add_user(1)
+    for _ in range(3):
+        database.approve_task(submit_task(database, 1), 99, notify=main.task_approved_message)
+    first, second, _ = database.claim_outbox(10)
+    database.complete_outbox([
+        (first['outbox_id'], main.DELIVERY_SENT, 1),
+        (second['outbox_id'], main.DELIVERY_BLOCKED, 1),
+    ])
+
+    def age_rows(db, cursor):
+        cursor.execute("UPDATE outbox SET created_at = datetime('now', '-30 days')")
+    database.submit_write(age_rows).result()
+
+    assert database.prune_outbox() == 2
+    assert database.get_outbox_stats() == {'sending': 1}
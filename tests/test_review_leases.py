@@ -0,0 +1,176 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import main
+
+ADMIN_A = 1001
+ADMIN_B = 1002
+
+
+def create_task(database, user_id, points=10):
+    task_id, _ = database.create_task({
+        'user_id': user_id,
+        'task_type': 'family_contracts',
+        'points': points,
+        'status': 'pending',
+    })
+    return task_id
+
+
+def test_admins_get_different_tasks(database, add_user):
+    user_id = add_user(1)
+    first, second = create_task(database, user_id), create_task(database, user_id)
+
+    assert database.claim_next_task(ADMIN_A) == first
+    assert database.claim_next_task(ADMIN_B) == second
+    assert database.claim_next_task(ADMIN_B, keep_task_id=second) is None
+
+
+def test_claimed_task_cannot_be_reviewed_by_another_admin(database, add_user):
+    user_id = add_user(1)
+    task_id = create_task(database, user_id)
+    assert database.claim_task(task_id, ADMIN_A)
+
+    assert not database.claim_task(task_id, ADMIN_B)
+    assert database.approve_task(task_id, ADMIN_B) is None
+    assert database.reject_task(task_id, ADMIN_B, 'нет') is None
+    assert database.approve_task(task_id, ADMIN_A)['balance'] == 10
+
+
+def test_expired_lease_returns_task_to_queue(database, add_user, monkeypatch):
+    user_id = add_user(1)
+    task_id = create_task(database, user_id)
+    # Аренда истекает сразу после выдачи
+    monkeypatch.setattr(main, 'REVIEW_LEASE_SECONDS', -1)
+    assert database.claim_next_task(ADMIN_A) == task_id
+
+    assert database.claim_next_task(ADMIN_B) == task_id
+    assert database.approve_task(task_id, ADMIN_B)['reviewed_by'] == ADMIN_B
+
+
+def test_double_approve_credits_points_once(database, add_user):
+    user_id = add_user(1)
+    task_id = create_task(database, user_id, points=25)
+
+    assert database.approve_task(task_id, ADMIN_A)['balance'] == 25
+    assert database.approve_task(task_id, ADMIN_A) is None
+    assert database.approve_task(task_id, ADMIN_B) is None
+    assert database.reject_task(task_id, ADMIN_B, 'поздно') is None
+
+    user = database.get_user(user_id)
+    assert user['total_points'] == 25
+    assert user['tasks_completed'] == 1
+    assert user['tasks_pending'] == 0
+
+
+
+def test_batch_approve_skips_already_reviewed_tasks(database, add_user):
+    user_id = add_user(1)
+    first, second = create_task(database, user_id, points=5), create_task(database, user_id, points=5)
+    assert database.approve_task(first, ADMIN_A)
+
+    result = database.approve_tasks([first, second], ADMIN_B)
+
+    assert result[first] is None
+    assert result[second]['balance'] == 10
+    assert database.get_user(user_id)['total_points'] == 10
+
+
+def test_batch_claim_skips_tasks_held_by_other_admin(database, add_user):
+    user_id = add_user(1)
+    first, second, third = (create_task(database, user_id) for _ in range(3))
+    assert database.claim_task(first, ADMIN_A)
+
+    assert database.claim_task_batch(ADMIN_B, 5) == [second, third]
+    result = database.reject_tasks([first, second], ADMIN_B, 'нет')
+    assert result[first] is None
+    assert result[second]['task_id'] == second
+
+
+def claimed_by(database, task_id):
+    with database.read_cursor() as cursor:
+        cursor.execute('SELECT claimed_by FROM tasks WHERE task_id = ?', (task_id,))
+        return cursor.fetchone()[0]
+
+
+def test_batch_review_applies_in_one_transaction(database, add_user):
+    user_id = add_user(1)
+    approve, reject, untouched = (create_task(database, user_id, points=5) for _ in range(3))
+    database.claim_task_batch(ADMIN_A, 5)
+
+    approved, rejected = database.apply_batch_review(
+        [approve], [reject], ADMIN_A, 'нет',
+        approve_notify=main.task_approved_message, reject_notify=main.task_rejected_message
+    )
+
+    assert approved[approve]['balance'] == 5
+    assert rejected[reject]['rejection_reason'] == 'нет'
+    assert claimed_by(database, untouched) is None
+    assert database.get_outbox_stats() == {'pending': 2}
+
+
+def test_failed_batch_review_changes_nothing(database, add_user):
+    user_id = add_user(1)
+    approve, reject = create_task(database, user_id), create_task(database, user_id)
+    database.claim_task_batch(ADMIN_A, 5)
+
+    def broken_notify(task):
+        raise RuntimeError('шаблон уведомления сломан')
+
+    with pytest.raises(RuntimeError):
+        database.apply_batch_review([approve], [reject], ADMIN_A, 'нет', reject_notify=broken_notify)
+
+    assert database.get_user(user_id)['total_points'] == 0
+    assert database.get_task_details(approve)['status'] == 'pending'
+    assert claimed_by(database, approve) == ADMIN_A
+    assert database.get_outbox_stats() == {}
+
+
+class Query:
+    def __init__(self, admin_id):
+        self.from_user = SimpleNamespace(id=admin_id)
+        self.data = ''
+        self.screens = []
+
+    async def answer(self, *args, **kwargs):
+        pass
+
+    async def edit_message_text(self, text, reply_markup=None, **kwargs):
+        buttons = [button.callback_data for row in reply_markup.inline_keyboard for button in row]
+        self.screens.append((text, buttons))
+
+
+def test_next_task_is_claimed_only_when_opened(database, add_user, monkeypatch):
+    monkeypatch.setattr(main, 'adb', main.AsyncDatabase(database))
+    user_id = add_user(1)
+    first, second, third = (create_task(database, user_id) for _ in range(3))
+    query = Query(ADMIN_A)
+    update = SimpleNamespace(callback_query=query, effective_user=query.from_user)
+    context = SimpleNamespace(bot=None, user_data={})
+
+    asyncio.run(main.review_task(update, context, first))
+    text, buttons = query.screens[-1]
+    assert f'#{first}' in text and f'admin_next_task_{first}' in buttons
+    # Следующее задание не закреплено заранее и достается другому администратору
+    assert claimed_by(database, first) == ADMIN_A
+    assert claimed_by(database, second) is None
+    assert database.claim_next_task(ADMIN_B) == second
+
+    asyncio.run(main.open_next_task(update, context, first))
+    assert f'#{third}' in query.screens[-1][0]
+    assert claimed_by(database, first) is None
+    assert claimed_by(database, third) == ADMIN_A
+
+
+def test_tasks_by_ids_are_read_in_chunks(database, add_user, monkeypatch):
+    monkeypatch.setattr(main, 'SQL_IN_CHUNK_SIZE', 2)
+    user_id = add_user(1)
+    task_ids = [create_task(database, user_id) for _ in range(5)]
+
+    tasks = database.get_tasks_by_ids(task_ids[::-1] + task_ids[:1])
+
+    assert [task['task_id'] for task in tasks] == task_ids
+    assert {task['nickname'] for task in tasks} == {'user1'}
+    assert database.get_tasks_by_ids([]) == []
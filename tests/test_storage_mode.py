@@ -0,0 +1,30 @@
+import os
+
+import pytest
+
+import main
+
+
+def journal_mode(database):
+    with database.read_cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode')
+        return cursor.fetchone()[0]
+
+
+@pytest.mark.skipif('DB_STORAGE_MODE' in os.environ, reason='режим хранилища задан окружением')
+def test_default_is_rollback_journal(database):
+    assert main.DB_STORAGE_MODE == 'legacy'
+    assert not database.wal_mode
+    assert journal_mode(database) == 'delete'
+    assert database.max_concurrency == 1
+
+
+def test_wal_is_opt_in(open_database, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'DB_STORAGE_MODE', 'wal')
+    database = open_database(tmp_path / 'wal.db')
+
+    assert database.wal_mode
+    assert journal_mode(database) == 'wal'
+    assert database.max_concurrency == main.DB_READ_POOL_SIZE + 1
+    database.save_user({'user_id': 1, 'nickname': 'wal'})
+    assert database.get_user(1)['nickname'] == 'wal'
@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+
+
+def create_task(database, user_id, points=10):
+    task_id, _ = database.create_task({'user_id': user_id, 'task_type': 'contracts', 'points': points, 'status': 'pending'})
+    return task_id
+
+
+def test_user_counters_follow_points_and_bans(database, add_user):
+    add_user(1, total_points=100)
+    add_user(2, total_points=50)
+    database.update_user_points(2, 25)
+
+    assert database.get_system_stats()['total_users'] == 2
+    assert database.get_system_stats()['total_points'] == 175
+
+    database.ban_user(1, admin_id=1000, reason='спам')
+
+    stats = database.get_system_stats()
+    assert stats['total_users'] == 1
+    assert stats['total_points'] == 75
+
+
+def test_task_counters_follow_review(database, add_user):
+    add_user(1)
+    first = create_task(database, 1)
+    create_task(database, 1)
+
+    stats = database.get_system_stats()
+    assert stats['pending_tasks'] == 2
+    assert stats['today_tasks'] == 2
+
+    database.approve_task(first, 1000)
+
+    stats = database.get_system_stats()
+    assert stats['pending_tasks'] == 1
+    assert stats['today_tasks'] == 2
+
+
+def test_active_drawings_counter(database):
+    drawing_id = database.create_drawing({
+        'name': 'Розыгрыш',
+        'prize': 'Приз',
+        'start_date': datetime.now() - timedelta(days=1),
+        'end_date': datetime.now() + timedelta(days=1),
+        'status': 'active',
+    })
+    assert database.get_system_stats()['active_drawings'] == 1
+
+    database.finish_drawing(drawing_id, {})
+
+    assert database.get_system_stats()['active_drawings'] == 0
@@ -0,0 +1,63 @@
+import sqlite3
+from datetime import datetime, timezone
+
+import main
+
+
+def create_task(database, user_id, task_type='contracts', points=10, count=1):
+    task_id, _ = database.create_task({
+        'user_id': user_id, 'task_type': task_type, 'points': points, 'count': count, 'status': 'pending'
+    })
+    return task_id
+
+
+def test_day_range_is_half_open():
+    assert main.day_range('2026-02-28') == ('2026-02-28', '2026-03-01')
+    assert main.day_range('2026-12-31') == ('2026-12-31', '2027-01-01')
+
+
+def test_rollup_follows_submission_and_review(database, add_user):
+    add_user(1)
+    approved = create_task(database, 1, points=10, count=3)
+    rejected = create_task(database, 1)
+    create_task(database, 1, task_type='woodcutting')
+
+    database.approve_task(approved, 1000)
+    database.reject_task(rejected, 1000, 'нет скриншота')
+
+    assert database.get_user_task_type_stats(1, 'contracts') == {'total': 2, 'approved': 1, 'rejected': 1}
+    totals = {row['task_type']: row for row in database.get_task_type_totals()}
+    assert totals['contracts']['points'] == 30
+    assert totals['woodcutting']['submitted'] == 1
+    [today] = database.get_task_daily_totals()
+    assert (today['submitted'], today['approved'], today['rejected']) == (3, 1, 1)
+
+
+def test_tasks_by_type_for_day(database, add_user):
+    add_user(1)
+    create_task(database, 1)
+    rejected = create_task(database, 1)
+    database.reject_task(rejected, 1000, 'нет скриншота')
+
+    # created_at пишется CURRENT_TIMESTAMP, то есть в UTC
+    today = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+    assert database.get_user_tasks_by_type(1, 'contracts', today) == 1
+    assert database.get_user_tasks_by_type(1, 'contracts', '2000-01-01') == 0
+
+
+def test_rollup_backfilled_for_existing_tasks(open_database, tmp_path):
+    path = tmp_path / 'bot.db'
+    database = open_database(path)
+    database.save_user({'user_id': 1, 'nickname': 'user1'})
+    task_id = create_task(database, 1, points=5, count=2)
+    database.approve_task(task_id, 1000)
+    database.close()
+
+    conn = sqlite3.connect(path)
+    conn.execute('DROP TABLE task_daily_stats')
+    conn.commit()
+    conn.close()
+
+    database = open_database(path)
+    assert database.get_user_task_type_stats(1, 'contracts') == {'total': 1, 'approved': 1, 'rejected': 0}
+    assert database.get_task_type_totals()[0]['points'] == 10
@@ -0,0 +1,62 @@
+import asyncio
+
+from telegram import CallbackQuery, Update, User
+
+import main
+
+
+def make_update(update_id, user_id):
+    user = User(id=user_id, first_name='user', is_bot=False)
+    return Update(update_id, callback_query=CallbackQuery(str(update_id), user, 'chat'))
+
+
+def test_same_user_runs_in_order_other_users_in_parallel():
+    async def scenario():
+        processor = main.UserLaneUpdateProcessor(max_concurrent_updates=8)
+        release = asyncio.Event()
+        log = []
+
+        async def handler(name, blocking=False):
+            log.append(f'start {name}')
+            if blocking:
+                await release.wait()
+            log.append(f'end {name}')
+
+        first = asyncio.create_task(processor.process_update(make_update(1, 10), handler('a1', blocking=True)))
+        second = asyncio.create_task(processor.process_update(make_update(2, 10), handler('a2')))
+        other = asyncio.create_task(processor.process_update(make_update(3, 20), handler('b1')))
+        await other
+
+        # Второе обновление пользователя 10 ждет первое, пользователь 20 уже обработан
+        assert log == ['start a1', 'start b1', 'end b1']
+        assert processor.stats()['pending'] == 2
+        assert processor.hot_lanes() == [(10, 2)]
+
+        release.set()
+        await asyncio.gather(first, second)
+        assert log[3:] == ['end a1', 'start a2', 'end a2']
+        assert processor.stats() == {
+            'in_progress': 0, 'lanes': 0, 'pending': 0, 'peak_depth': 2, 'queued_total': 1
+        }
+
+    asyncio.run(scenario())
+
+
+def test_concurrency_limit_applies_across_users():
+    async def scenario():
+        processor = main.UserLaneUpdateProcessor(max_concurrent_updates=2)
+        running = []
+        peak = []
+
+        async def handler():
+            running.append(1)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.pop()
+
+        await asyncio.gather(*(
+            processor.process_update(make_update(i, 100 + i), handler()) for i in range(6)
+        ))
+        assert max(peak) == 2
+
+    asyncio.run(scenario())
@@ -0,0 +1,59 @@
+import main
+
+
+def profile(user_id):
+    return {'user_id': user_id, 'badges': [], 'settings': {}}
+
+
+def test_lru_eviction():
+    cache = main.UserCache(max_size=2, ttl=60)
+    for user_id in (1, 2):
+        cache.put(user_id, profile(user_id), cache.generation)
+
+    assert cache.get(1)['user_id'] == 1
+    cache.put(3, profile(3), cache.generation)
+    # 2 дольше всех не читали - вытеснен
+    assert cache.get(2) is None
+    assert cache.get(1) and cache.get(3)
+
+
+def test_expired_entry_is_dropped():
+    cache = main.UserCache(ttl=-1)
+    cache.put(1, profile(1), cache.generation)
+
+    assert cache.get(1) is None
+    assert cache.stats()['misses'] == 1
+
+
+def test_stale_read_is_not_cached_after_invalidation():
+    cache = main.UserCache()
+    generation = cache.generation
+    cache.invalidate({1})
+
+    cache.put(1, profile(1), generation)
+
+    assert cache.get(1) is None
+
+
+def test_cached_copy_is_isolated(database, add_user):
+    add_user(1, badges=['star'])
+    user = database.get_user(1)
+    user['badges'].append('hacked')
+    user['nickname'] = 'hacked'
+
+    again = database.get_user(1)
+    assert again['badges'] == ['star']
+    assert again['nickname'] == 'user1'
+    assert database.user_cache.stats()['hits'] == 1
+
+
+def test_write_invalidates_cached_user(database, add_user):
+    add_user(1)
+    assert database.get_user(1)['total_points'] == 0
+
+    database.update_user_points(1, 15)
+    database.patch_user(1, nickname='renamed')
+
+    user = database.get_user(1)
+    assert user['total_points'] == 15
+    assert user['nickname'] == 'renamed'
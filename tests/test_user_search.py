@@ -0,0 +1,59 @@
+import sqlite3
+
+
+def found(database, term):
+    return [user['user_id'] for user in database.search_users(term)]
+
+
+def test_substring_search(database, add_user):
+    add_user(1, nickname='DarkKnight', username='knight_rider')
+    add_user(2, nickname='Светлана', first_name='Света')
+    add_user(3, nickname='Other')
+
+    assert database.fts_enabled
+    assert found(database, 'knig') == [1]
+    assert found(database, 'ветл') == [2]
+    assert found(database, 'nothing') == []
+
+
+def test_index_follows_profile_changes(database, add_user):
+    add_user(1, nickname='OldName')
+
+    database.patch_user(1, nickname='NewName')
+
+    assert found(database, 'OldName') == []
+    assert found(database, 'NewName') == [1]
+
+
+def test_quotes_in_term_are_literal(database, add_user):
+    add_user(1, nickname='Игрок "Ас"')
+
+    assert found(database, '"Ас"') == [1]
+    assert found(database, 'OR "x') == []
+
+
+def test_short_terms_and_disabled_fts_use_like(database, add_user):
+    add_user(1, nickname='Ivan', total_points=10)
+    add_user(2, nickname='Ivanka', total_points=20)
+
+    assert found(database, 'Iv') == [2, 1]
+    database.fts_enabled = False
+    assert found(database, 'Ivan') == [2, 1]
+    assert found(database, 'anka') == [2]
+
+
+def test_index_rebuilt_for_existing_users(open_database, tmp_path):
+    path = tmp_path / 'bot.db'
+    database = open_database(path)
+    database.save_user({'user_id': 1, 'nickname': 'Existing'})
+    database.close()
+
+    conn = sqlite3.connect(path)
+    for trigger in ('trg_users_fts_insert', 'trg_users_fts_delete', 'trg_users_fts_update'):
+        conn.execute(f'DROP TRIGGER {trigger}')
+    conn.execute('DROP TABLE users_fts')
+    conn.commit()
+    conn.close()
+
+    database = open_database(path)
+    assert found(database, 'xisting') == [1]